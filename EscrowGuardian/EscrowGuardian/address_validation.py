@@ -0,0 +1,169 @@
+import hashlib
+import re
+from functools import lru_cache, reduce
+from operator import xor
+
+# ======================== NETWORK PARAMETERS ========================
+
+# Base58Check version bytes accepted per currency
+BASE58_VERSIONS = {
+    'BTC': {0x00: 'p2pkh', 0x05: 'p2sh'},
+    'LTC': {0x30: 'p2pkh', 0x32: 'p2sh', 0x05: 'p2sh'},
+}
+
+# Human-readable parts for segwit addresses
+BECH32_HRPS = {
+    'BTC': 'bc',
+    'LTC': 'ltc',
+}
+
+# ======================== PRECOMPILED TABLES ========================
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+BASE58_INDEX = {char: index for index, char in enumerate(BASE58_ALPHABET)}
+BASE58_PATTERN = re.compile(r'^[1-9A-HJ-NP-Za-km-z]{25,35}$')
+
+BECH32_CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+BECH32_INDEX = {char: index for index, char in enumerate(BECH32_CHARSET)}
+BECH32_PATTERN = re.compile(r'^([a-z]{1,83})1([qpzry9x8gf2tvdw0s3jn54khce6mua7l]{6,87})$')
+BECH32_GENERATORS = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+# XOR of the generators selected by each 5-bit overflow, so _polymod does
+# one table lookup per character instead of an inner loop
+BECH32_GENERATOR_TABLE = tuple(
+    reduce(xor, (g for i, g in enumerate(BECH32_GENERATORS) if (top >> i) & 1), 0)
+    for top in range(32)
+)
+BECH32_CONST = 1
+BECH32M_CONST = 0x2bc830a3
+
+# Expanded HRPs are fixed per currency, so they are computed once
+BECH32_HRP_EXPANDED = {
+    hrp: [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    for hrp in BECH32_HRPS.values()
+}
+
+CACHE_SIZE = 4096
+
+# ======================== BASE58CHECK ========================
+
+def base58check_decode(address):
+    """Return the payload (version byte included) or None if the checksum fails."""
+    if not BASE58_PATTERN.match(address):
+        return None
+    return _base58check_payload(address)
+
+def _base58check_payload(text):
+    number = 0
+    for char in text:
+        index = BASE58_INDEX.get(char)
+        if index is None:
+            return None
+        number = number * 58 + index
+    leading_zeros = len(text) - len(text.lstrip('1'))
+    body = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    raw = b'\x00' * leading_zeros + body
+    if len(raw) < 5:
+        return None
+    payload, checksum = raw[:-4], raw[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        return None
+    return payload
+
+def extended_key_decode(text):
+    """Payload of a Base58Check extended key (78 bytes) or None if malformed."""
+    payload = _base58check_payload(text)
+    return payload if payload is not None and len(payload) == 78 else None
+
+# ======================== BECH32 / BECH32M ========================
+
+def _polymod(values):
+    checksum = 1
+    table = BECH32_GENERATOR_TABLE
+    for value in values:
+        checksum = ((checksum & 0x1ffffff) << 5 ^ value) ^ table[checksum >> 25]
+    return checksum
+
+def _convert_bits(data, from_bits, to_bits, pad=False):
+    accumulator = 0
+    bits = 0
+    result = []
+    max_value = (1 << to_bits) - 1
+    for value in data:
+        accumulator = (accumulator << from_bits) | value
+        bits += from_bits
+        while bits >= to_bits:
+            bits -= to_bits
+            result.append((accumulator >> bits) & max_value)
+    if pad:
+        if bits:
+            result.append((accumulator << (to_bits - bits)) & max_value)
+        return result
+    if bits >= from_bits or ((accumulator << (to_bits - bits)) & max_value):
+        return None
+    return result
+
+def segwit_decode(hrp, address):
+    """Return (witness_version, program) or None if invalid for this HRP."""
+    if address.lower() != address and address.upper() != address:
+        return None
+    match = BECH32_PATTERN.match(address.lower())
+    if not match or match.group(1) != hrp:
+        return None
+    data = [BECH32_INDEX[char] for char in match.group(2)]
+    constant = _polymod(BECH32_HRP_EXPANDED[hrp] + data)
+    if constant not in (BECH32_CONST, BECH32M_CONST):
+        return None
+
+    version = data[0]
+    program = _convert_bits(data[1:-6], 5, 8)
+    if program is None or version > 16 or not 2 <= len(program) <= 40:
+        return None
+    # BIP-350: v0 uses bech32 with 20/32 byte programs, v1+ must use bech32m
+    if version == 0:
+        if constant != BECH32_CONST or len(program) not in (20, 32):
+            return None
+    elif constant != BECH32M_CONST:
+        return None
+    return version, bytes(program)
+
+def segwit_encode(hrp, version, program):
+    """Encode a witness program as a bech32 (v0) or bech32m (v1+) address."""
+    data = [version] + _convert_bits(program, 8, 5, pad=True)
+    constant = BECH32_CONST if version == 0 else BECH32M_CONST
+    checksum = _polymod(BECH32_HRP_EXPANDED[hrp] + data + [0] * 6) ^ constant
+    data += [(checksum >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join(BECH32_CHARSET[value] for value in data)
+
+# ======================== PUBLIC API ========================
+
+@lru_cache(maxsize=CACHE_SIZE)
+def address_type(currency, address):
+    """Classify an address ('p2pkh', 'p2sh', 'p2wpkh', ...) or None if invalid."""
+    hrp = BECH32_HRPS.get(currency)
+    if hrp is None or not address:
+        return None
+
+    if address[:len(hrp) + 1].lower() == hrp + '1':
+        decoded = segwit_decode(hrp, address)
+        if decoded is None:
+            return None
+        version, program = decoded
+        if version == 0:
+            return 'p2wpkh' if len(program) == 20 else 'p2wsh'
+        return 'p2tr' if version == 1 and len(program) == 32 else f'witness_v{version}'
+
+    payload = base58check_decode(address)
+    if payload is None or len(payload) != 21:
+        return None
+    return BASE58_VERSIONS[currency].get(payload[0])
+
+def verify_address(currency, address):
+    """Check that an address is well-formed and checksummed for the currency."""
+    return address_type(currency, address) is not None
+
+def verify_many(currency, addresses):
+    """Validate a batch of addresses, returning booleans in input order."""
+    return [address_type(currency, address) is not None for address in addresses]
+
+def cache_info():
+    return address_type.cache_info()
@@ -0,0 +1,61 @@
+import functools
+import hmac
+from flask import Blueprint, Response, jsonify, request
+from config import ADMIN_API_TOKEN, EXPORT_PAGE_SIZE
+import export
+
+# The /admin routes, registered on the web server of a single process
+# (main.py) and on the cluster supervisor's (cluster.py). Storage is read on
+# the web server's threads, never through a bot event loop, so even a long
+# export leaves update handling untouched.
+
+admin = Blueprint('admin', __name__)
+
+def admin_required(view):
+    """Reject requests without the admin bearer token; the routes do not exist without one configured"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_API_TOKEN:
+            return jsonify({"error": "not found"}), 404
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), ADMIN_API_TOKEN.encode()):
+            return jsonify({"error": "forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def export_query(kind):
+    """Filters and resume key from the query string; raises ValueError on bad input"""
+    args = request.args
+    filters = export.parse_filters(kind, args.get('status'), args.get('currency'), args.get('from'), args.get('to'))
+    after = export.decode_cursor(args['cursor']) if args.get('cursor') else None
+    return filters, after
+
+@admin.route('/admin/<kind>')
+@admin_required
+def admin_page(kind):
+    """One page of transactions, reviews or reports, with the cursor of the next"""
+    from storage import storage
+    try:
+        filters, after = export_query(kind)
+        limit = min(max(int(request.args.get('limit', EXPORT_PAGE_SIZE)), 1), EXPORT_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows, last = export.fetch_page(storage, kind, filters, after, limit)
+    return jsonify({"items": rows, "next_cursor": export.encode_cursor(last) if last else None})
+
+@admin.route('/admin/<kind>/export')
+@admin_required
+def admin_export(kind):
+    """Stream every matching row as NDJSON or CSV"""
+    from storage import storage
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        filters, after = export_query(kind)
+        if fmt not in export.FORMATS:
+            raise ValueError(f"Unknown format: {fmt}")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    chunks = export.render(kind, export.iter_pages(storage, kind, filters, after), fmt)
+    return Response(chunks, mimetype=export.FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{kind}.{fmt}"'
+    })
@@ -0,0 +1,452 @@
+import bisect
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import uuid
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from models import Transaction, TransactionStatus, STATUS_CODES
+from money import to_units
+from config import ARCHIVE_DIR, ARCHIVE_OPEN_SEGMENTS
+
+MAGIC = b'EGA1'
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{8})\.col$')
+NULL_INT = -2 ** 63
+INT_COLUMNS = ('user_id', 'buyer_id', 'seller_id', 'chat_id', 'deposit_index', 'amount', 'rejected_amount')
+FLOAT_COLUMNS = ('created_at', 'funded_at', 'finished_at')
+STRING_COLUMNS = ('buyer_address', 'seller_address', 'deposit_address', 'funding_outpoint', 'rejected_outpoint')
+PARTICIPANT_COLUMNS = ('user_id', 'buyer_id', 'seller_id')
+BLOOM_BITS_PER_KEY = 10  # ~1% false positives with BLOOM_HASHES probes
+BLOOM_HASHES = 7
+
+# ======================== BLOOM FILTERS ========================
+
+class BloomFilter:
+    """Set membership with rare false positives and no false negatives.
+
+    One per segment and key kind lets a lookup skip every segment that
+    cannot hold the key without mapping it.
+    """
+
+    __slots__ = ('bits', 'size')
+
+    def __init__(self, bits):
+        self.bits = bits
+        self.size = len(bits) * 8
+
+    @classmethod
+    def build(cls, keys):
+        keys = set(keys)
+        bloom = cls(bytearray(max(8, -(-len(keys) * BLOOM_BITS_PER_KEY // 8))))
+        for key in keys:
+            for position in bloom._positions(key):
+                bloom.bits[position >> 3] |= 1 << (position & 7)
+        bloom.bits = bytes(bloom.bits)
+        return bloom
+
+    def _positions(self, key):
+        # Double hashing: BLOOM_HASHES probes from one 128-bit digest
+        first, second = struct.unpack('<QQ', hashlib.blake2b(key, digest_size=16).digest())
+        return ((first + i * second) % self.size for i in range(BLOOM_HASHES))
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+def _participant_key(user_id):
+    return struct.pack('<q', user_id)
+
+def _bloom_keys(transactions):
+    """Keys of each filter kind for a batch of transactions."""
+    return {
+        'id': [uuid.UUID(t.id).bytes for t in transactions],
+        'participant': [_participant_key(user_id) for t in transactions for user_id in t.participants()],
+        'outpoint': [t.funding_outpoint.encode() for t in transactions if t.funding_outpoint],
+    }
+
+# ======================== ENCODING ========================
+
+def _int(value):
+    return NULL_INT if value is None else value
+
+def _float(value):
+    if value is None:
+        return math.nan
+    return value.timestamp() if isinstance(value, datetime) else value
+
+def _strings(values):
+    offsets = array('I', [0])
+    blob = bytearray()
+    for value in values:
+        if value:
+            blob += value.encode()
+        offsets.append(len(blob))
+    return offsets.tobytes(), bytes(blob)
+
+def encode_segment(transactions):
+    """Serialize transactions column by column; returns the segment file's bytes."""
+    currencies = sorted({t.currency for t in transactions})
+    currency_codes = {currency: code for code, currency in enumerate(currencies)}
+    ids = [uuid.UUID(t.id).bytes for t in transactions]
+    columns = {
+        'id': b''.join(ids),
+        'status': bytes(STATUS_CODES[t.status] for t in transactions),
+        'currency': bytes(currency_codes[t.currency] for t in transactions),
+    }
+    for name in INT_COLUMNS:
+        columns[name] = array('q', (_int(getattr(t, name)) for t in transactions)).tobytes()
+    for name in FLOAT_COLUMNS:
+        columns[name] = array('d', (_float(getattr(t, name)) for t in transactions)).tobytes()
+    for name in STRING_COLUMNS:
+        columns[f'{name}_offsets'], columns[name] = _strings(getattr(t, name) for t in transactions)
+    # Rows in id order, for binary search by id
+    columns['id_order'] = array('I', sorted(range(len(ids)), key=ids.__getitem__)).tobytes()
+    for kind, keys in _bloom_keys(transactions).items():
+        columns[f'{kind}_bloom'] = BloomFilter.build(keys).bits
+
+    layout = {}
+    body = bytearray()
+    for name, data in columns.items():
+        body += b'\x00' * (-len(body) % 8)  # Keep every column 8-byte aligned
+        layout[name] = [len(body), len(data)]
+        body += data
+    deposit_indexes = {}
+    for t in transactions:
+        if t.deposit_index is not None:
+            deposit_indexes[t.currency] = max(t.deposit_index, deposit_indexes.get(t.currency, -1))
+    header = json.dumps({
+        'rows': len(transactions),
+        'deposit_indexes': deposit_indexes,
+        'amount_units': True,
+        'statuses': [status.value for status in TransactionStatus],
+        'currencies': currencies,
+        'columns': layout,
+    }).encode()
+    header += b' ' * (-(len(header) + 8) % 8)
+    return MAGIC + struct.pack('<I', len(header)) + header + bytes(body)
+
+class _Segment:
+    """A memory-mapped segment file with zero-copy views of its columns."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:4] != MAGIC:
+            raise ValueError(f"{path} is not an archive segment")
+        (header_length,) = struct.unpack_from('<I', self._map, 4)
+        header = json.loads(self._map[8:8 + header_length])
+        self.base = 8 + header_length
+        self.rows = header['rows']
+        self.statuses = [TransactionStatus(value) for value in header['statuses']]
+        self.currencies = [sys.intern(currency) for currency in header['currencies']]
+        self.layout = header['columns']
+        # Highest derivation index per currency; absent in segments written before it
+        self.deposit_indexes = header.get('deposit_indexes', {})
+        # Older segments stored amounts as float coins
+        self.legacy_amounts = not header.get('amount_units', False)
+        view = memoryview(self._map)
+        self._views = {}
+        for name, (offset, length) in self.layout.items():
+            column = view[self.base + offset:self.base + offset + length]
+            if name == 'amount' and self.legacy_amounts:
+                column = column.cast('d')
+            elif name in INT_COLUMNS or name.endswith('_offsets') or name == 'id_order':
+                column = column.cast('q' if name in INT_COLUMNS else 'I')
+            elif name in FLOAT_COLUMNS:
+                column = column.cast('d')
+            self._views[name] = column
+        view.release()
+
+    def _find(self, column, needle, width):
+        """Row numbers whose fixed-width value equals needle, found with mmap.find."""
+        offset, length = self.layout[column]
+        start = self.base + offset
+        end = start + length
+        rows = []
+        position = self._map.find(needle, start, end)
+        while position != -1:
+            if (position - start) % width == 0:
+                rows.append((position - start) // width)
+            position = self._map.find(needle, position + 1, end)
+        return rows
+
+    def _id(self, row):
+        return bytes(self._views['id'][row * 16:row * 16 + 16])
+
+    def find_id(self, transaction_id):
+        needle = uuid.UUID(transaction_id).bytes
+        order = self._views.get('id_order')
+        if order is None:
+            # Segments written before the id order column
+            rows = self._find('id', needle, 16)
+            return rows[0] if rows else None
+        index = bisect.bisect_left(order, needle, key=self._id)
+        if index < len(order) and self._id(order[index]) == needle:
+            return order[index]
+        return None
+
+    def find_participant(self, user_id):
+        needle = _participant_key(user_id)
+        rows = set()
+        for column in PARTICIPANT_COLUMNS:
+            rows.update(self._find(column, needle, 8))
+        return rows
+
+    def blooms(self):
+        """Bloom filter per key kind, built from the columns for segments written without them."""
+        if all(f'{kind}_bloom' in self._views for kind in ('id', 'participant', 'outpoint')):
+            return {
+                kind: BloomFilter(bytes(self._views[f'{kind}_bloom']))
+                for kind in ('id', 'participant', 'outpoint')
+            }
+        return {kind: BloomFilter.build(keys) for kind, keys in _bloom_keys(
+            [self.transaction(row) for row in range(self.rows)]
+        ).items()}
+
+    def find_outpoint(self, outpoint):
+        """Row funded by outpoint, found with mmap.find over the string column."""
+        if 'funding_outpoint' not in self.layout:
+            return None
+        offset, length = self.layout['funding_outpoint']
+        start = self.base + offset
+        offsets = self._views['funding_outpoint_offsets']
+        needle = outpoint.encode()
+        position = self._map.find(needle, start, start + length)
+        while position != -1:
+            # Values are concatenated, so a hit must start and end on value boundaries
+            row = bisect.bisect_right(offsets, position - start) - 1
+            if offsets[row] == position - start and offsets[row + 1] == offsets[row] + len(needle):
+                return row
+            position = self._map.find(needle, position + 1, start + length)
+        return None
+
+    def created_range(self):
+        """(earliest, latest) created_at timestamp of the segment's rows."""
+        created = self._views['created_at']
+        return min(created, default=math.inf), max(created, default=-math.inf)
+
+    def page_rows(self, after, status, currency, created_from, created_to):
+        """Rows matching the filters whose created_at is not clearly before after's."""
+        views = self._views
+        created = views['created_at']
+        status_code = self.statuses.index(status) if status is not None else None
+        if currency is not None and currency not in self.currencies:
+            return []
+        currency_code = self.currencies.index(currency) if currency is not None else None
+        low = created_from if created_from is not None else -math.inf
+        if after is not None:
+            # A millisecond of slack: exact ordering is left to the (datetime, id) keys
+            low = max(low, after - 0.001)
+        high = created_to if created_to is not None else math.inf
+        return [
+            row for row in range(self.rows)
+            if low <= created[row] < high
+            and (status_code is None or views['status'][row] == status_code)
+            and (currency_code is None or views['currency'][row] == currency_code)
+        ]
+
+    def _string(self, name, row):
+        if name not in self._views:
+            return None
+        offsets = self._views[f'{name}_offsets']
+        value = bytes(self._views[name][offsets[row]:offsets[row + 1]])
+        return value.decode() if value else None
+
+    def transaction(self, row):
+        views = self._views
+        ints = [views[name][row] if name in views else NULL_INT for name in INT_COLUMNS]
+        user_id, buyer_id, seller_id, chat_id, deposit_index, amount, rejected_amount = (
+            None if v == NULL_INT else v for v in ints
+        )
+        if self.legacy_amounts:
+            amount = None if math.isnan(amount) else to_units(amount)
+        created_at, funded_at, finished_at = (
+            views[name][row] if name in views else math.nan for name in FLOAT_COLUMNS
+        )
+        return Transaction(
+            id=str(uuid.UUID(bytes=self._id(row))),
+            user_id=user_id,
+            currency=self.currencies[views['currency'][row]],
+            status=self.statuses[views['status'][row]],
+            created_at=datetime.fromtimestamp(created_at),
+            buyer_id=buyer_id,
+            seller_id=seller_id,
+            buyer_address=self._string('buyer_address', row),
+            seller_address=self._string('seller_address', row),
+            amount=amount,
+            funded_at=None if math.isnan(funded_at) else datetime.fromtimestamp(funded_at),
+            chat_id=chat_id,
+            deposit_address=self._string('deposit_address', row),
+            deposit_index=deposit_index,
+            funding_outpoint=self._string('funding_outpoint', row),
+            rejected_outpoint=self._string('rejected_outpoint', row),
+            rejected_amount=rejected_amount,
+            finished_at=None if math.isnan(finished_at) else datetime.fromtimestamp(finished_at),
+        )
+
+    def close(self):
+        for column in self._views.values():
+            column.release()
+        self._views.clear()
+        self._map.close()
+        self._file.close()
+
+# ======================== ARCHIVE ========================
+
+class TransactionArchive:
+    """Finished transactions in append-only columnar segment files.
+
+    Segments are memory-mapped only while being read, with at most
+    max_open kept mapped. What stays resident is each segment's created_at
+    range and Bloom filters over its ids, participants and funding
+    outpoints, about three bytes per archived row: a lookup only maps the
+    segments whose filter may hold the key, then binary searches the id
+    order column or scans the participant columns with mmap.find.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR, max_open=ARCHIVE_OPEN_SEGMENTS):
+        self.directory = directory
+        self.max_open = max_open
+        os.makedirs(directory, exist_ok=True)
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+        # created_at range and Bloom filters per segment, kept after the segment is unmapped
+        self._ranges = {}
+        self._blooms = {}
+        self._numbers = self._list()
+
+    def _list(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _path(self, number):
+        return os.path.join(self.directory, f"segment-{number:08d}.col")
+
+    def _segment(self, number):
+        segment = self._open.get(number)
+        if segment is None:
+            segment = self._open[number] = _Segment(self._path(number))
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)[1].close()
+        self._open.move_to_end(number)
+        return segment
+
+    def _may_hold(self, number, kind, key):
+        blooms = self._blooms.get(number)
+        if blooms is None:
+            blooms = self._blooms[number] = self._segment(number).blooms()
+        return key in blooms[kind]
+
+    def write(self, transactions):
+        """Append transactions as a new segment, durably, before they leave live storage."""
+        if not transactions:
+            return
+        with self._lock:
+            number = (self._numbers[-1] + 1) if self._numbers else 1
+            path = self._path(number)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(encode_segment(transactions))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            self._numbers.append(number)
+
+    def get(self, transaction_id):
+        with self._lock:
+            key = uuid.UUID(transaction_id).bytes
+            for number in reversed(self._numbers):
+                if not self._may_hold(number, 'id', key):
+                    continue
+                segment = self._segment(number)
+                row = segment.find_id(transaction_id)
+                if row is not None:
+                    return segment.transaction(row)
+        return None
+
+    def get_by_outpoint(self, outpoint):
+        """The archived transaction funded by outpoint, if any."""
+        with self._lock:
+            key = outpoint.encode()
+            for number in reversed(self._numbers):
+                if not self._may_hold(number, 'outpoint', key):
+                    continue
+                segment = self._segment(number)
+                row = segment.find_outpoint(outpoint)
+                if row is not None:
+                    return segment.transaction(row)
+        return None
+
+    def find_by_participant(self, user_id):
+        """Archived transactions the user took part in, newest first."""
+        found = []
+        with self._lock:
+            key = _participant_key(user_id)
+            for number in self._numbers:
+                if not self._may_hold(number, 'participant', key):
+                    continue
+                segment = self._segment(number)
+                found.extend(segment.transaction(row) for row in segment.find_participant(user_id))
+        found.sort(key=lambda t: t.created_at, reverse=True)
+        return found
+
+    def max_deposit_index(self, currency):
+        """Highest derivation index archived for the currency, -1 if none."""
+        with self._lock:
+            return max(
+                (self._segment(number).deposit_indexes.get(currency, -1) for number in self._numbers),
+                default=-1
+            )
+
+    def page(self, after, limit, status=None, currency=None, created_from=None, created_to=None):
+        """Up to limit archived transactions ordered by (created_at, id), starting after the key after.
+
+        Segments whose created_at range lies wholly before the key, outside
+        the time filter or after an already full page are skipped without
+        reading their rows, so paging through the archive stays linear.
+        """
+        after_ts = after[0].timestamp() if after is not None else None
+        from_ts = created_from.timestamp() if created_from is not None else None
+        to_ts = created_to.timestamp() if created_to is not None else None
+        page = []
+        for number in list(self._numbers):
+            with self._lock:
+                earliest, latest = self._ranges.get(number) or self._ranges.setdefault(
+                    number, self._segment(number).created_range()
+                )
+                if after_ts is not None and latest < after_ts - 0.001:
+                    continue
+                if (from_ts is not None and latest < from_ts) or (to_ts is not None and earliest >= to_ts):
+                    continue
+                if len(page) == limit and earliest > page[-1].created_at.timestamp() + 0.001:
+                    continue
+                segment = self._segment(number)
+                rows = segment.page_rows(after_ts, status, currency, from_ts, to_ts)
+                candidates = [segment.transaction(row) for row in rows]
+            if after is not None:
+                candidates = [t for t in candidates if (t.created_at, t.id) > after]
+            page = heapq.nsmallest(limit, page + candidates, key=lambda t: (t.created_at, t.id))
+        return page
+
+    def __iter__(self):
+        """Every archived transaction, oldest segment first."""
+        for number in list(self._numbers):
+            with self._lock:
+                segment = self._segment(number)
+                rows = [segment.transaction(row) for row in range(segment.rows)]
+            yield from rows
+
+    def close(self):
+        with self._lock:
+            while self._open:
+                self._open.popitem()[1].close()
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import logging
+import os
+import aiofiles
+from telegram import InputFile
+from telegram.error import BadRequest
+from config import ASSETS_DIR, ASSET_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+class AssetCache:
+    """Maps files in attached_assets to Telegram file_ids so each is uploaded once."""
+
+    def __init__(self, path=ASSET_CACHE_PATH, assets_dir=ASSETS_DIR):
+        self.path = path
+        self.assets_dir = assets_dir
+        self._entries = self._load()
+        self._hashes = {}
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as cache_file:
+                return json.load(cache_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable asset cache %s: %s", self.path, e)
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(self._entries, cache_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def asset_path(self, name):
+        return os.path.join(self.assets_dir, name)
+
+    def content_hash(self, name):
+        """Hash an asset once per process; None if the file does not exist."""
+        if name not in self._hashes:
+            digest = hashlib.sha256()
+            try:
+                with open(self.asset_path(name), 'rb') as asset:
+                    for chunk in iter(lambda: asset.read(1 << 16), b''):
+                        digest.update(chunk)
+                self._hashes[name] = digest.hexdigest()
+            except FileNotFoundError:
+                self._hashes[name] = None
+        return self._hashes[name]
+
+    def get_file_id(self, name):
+        entry = self._entries.get(name)
+        if entry and entry.get('sha256') == self.content_hash(name):
+            return entry['file_id']
+        return None
+
+    def store(self, name, file_id):
+        self._entries[name] = {'file_id': file_id, 'sha256': self.content_hash(name)}
+        self._save()
+
+    def is_current(self, key, digest):
+        """Whether content with this digest was already published under key."""
+        entry = self._entries.get(key)
+        return entry is not None and entry.get('sha256') == digest
+
+    def remember(self, key, digest):
+        self._entries[key] = {'sha256': digest}
+        self._save()
+
+    def invalidate(self, name):
+        if self._entries.pop(name, None) is not None:
+            self._save()
+
+    async def send(self, name, send_method, media_arg, **kwargs):
+        """Send an asset through a bot method, uploading only on a cache miss.
+
+        Returns None when the asset file is missing so callers can fall back.
+        """
+        if self.content_hash(name) is None:
+            return None
+
+        file_id = self.get_file_id(name)
+        if file_id:
+            try:
+                return await send_method(**{media_arg: file_id}, **kwargs)
+            except BadRequest as e:
+                logger.warning("Cached file_id for %s rejected (%s); re-uploading", name, e)
+                self.invalidate(name)
+
+        async with aiofiles.open(self.asset_path(name), 'rb') as asset:
+            data = await asset.read()
+        message = await send_method(**{media_arg: InputFile(data, filename=name)}, **kwargs)
+
+        attachment = message.effective_attachment
+        if isinstance(attachment, (list, tuple)):
+            attachment = attachment[-1]
+        if attachment is not None:
+            self.store(name, attachment.file_id)
+            logger.info("Uploaded asset %s and cached its file_id", name)
+        return message
+
+asset_cache = AssetCache()
@@ -0,0 +1,42 @@
+"""Address validation throughput per address type.
+
+Run from the project directory: python benchmarks/bench_address_validation.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import address_validation  # noqa: E402
+
+SAMPLES = {
+    ('BTC', 'p2pkh'): '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa',
+    ('BTC', 'p2sh'): '3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy',
+    ('BTC', 'p2wpkh'): 'bc1qvcf5t3282g4ssxygcstxmk4s4tepdns8hmgpv4',
+    ('BTC', 'p2tr'): 'bc1p5d7rjq7g6rdk2yhzks9smlaqtedr4dekq08ge8ztwac72sfr9rusxg3297',
+    ('LTC', 'p2pkh'): 'LVg2kJoFNg45Nbpy53h7Fe1wKyeXVRhMH9',
+    ('LTC', 'p2wpkh'): 'ltc1qwl8qe05cyr6phmn484nnc6rw7af335fh0q4kv7',
+    ('BTC', 'invalid'): '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb',
+}
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"{label:<28} {number / seconds:>14,.0f} addr/s")
+
+def main(number=20000):
+    validate = address_validation.address_type.__wrapped__
+    print("Uncached (full checksum on every call)")
+    for (currency, kind), address in SAMPLES.items():
+        bench(f"  {currency} {kind}", lambda: validate(currency, address), number)
+
+    print("Cached (LRU hit)")
+    for (currency, kind), address in SAMPLES.items():
+        bench(f"  {currency} {kind}", lambda: address_validation.verify_address(currency, address), number)
+
+    batch = [address for (currency, _), address in SAMPLES.items() if currency == 'BTC'] * 100
+    seconds = min(timeit.repeat(lambda: address_validation.verify_many('BTC', batch), number=20, repeat=5))
+    print(f"{'verify_many (BTC, cached)':<28} {20 * len(batch) / seconds:>14,.0f} addr/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""Update throughput of the full application against a fake Bot API.
+
+Builds the Application like bot.main, with every handler from
+setup_handlers, but answers Bot API calls from an in-process transport
+after a configurable latency. Scripted escrow lifecycles from many
+simulated groups are replayed through the bot's update processor, and
+each update is timed from dispatch until its handlers have finished.
+
+Run from the project directory:
+
+    python benchmarks/bench_load.py --deals 2000 --concurrency 256
+    python benchmarks/bench_load.py --save benchmarks/baselines/load.json
+    python benchmarks/bench_load.py --compare benchmarks/baselines/load.json
+
+Storage defaults to the memory backend without journal so the numbers
+measure the bot; set STORAGE_BACKEND to include a database. Scripted
+users send commands far faster than people do, so inbound throttling is
+off unless THROTTLE_ENABLED=true.
+"""
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('JOURNAL_ENABLED', 'false')
+os.environ.setdefault('ARCHIVE_DIR', tempfile.mkdtemp(prefix='bench-archive-'))
+os.environ.setdefault('LOG_FILE', '')
+os.environ.setdefault('THROTTLE_ENABLED', 'false')
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+from models import TransactionStatus  # noqa: E402
+from storage import async_storage  # noqa: E402
+from update_processor import KeyedUpdateProcessor  # noqa: E402
+from rate_limiter import OutboundScheduler  # noqa: E402
+from config import MAX_CONCURRENT_UPDATES  # noqa: E402
+import bot  # noqa: E402
+
+BUYER_ADDRESS = '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa'
+SELLER_ADDRESS = 'bc1qvcf5t3282g4ssxygcstxmk4s4tepdns8hmgpv4'
+BOT_USER = {
+    'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot',
+    'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False,
+}
+UPDATE_IDS = itertools.count(1)
+
+# ======================== FAKE BOT API ========================
+
+class FakeRequest(BaseRequest):
+    """Answers Bot API calls in process after a fixed latency and counts them."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = iter(range(1, sys.maxsize))
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _result(self, api_method, parameters):
+        if api_method == 'getMe':
+            return BOT_USER
+        if api_method.startswith(('send', 'edit')):
+            return {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': parameters.get('chat_id', 0), 'type': 'supergroup', 'title': 'Bench'},
+                'from': BOT_USER,
+                'text': parameters.get('text', ''),
+            }
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        parameters = request_data.parameters if request_data else {}
+        body = {'ok': True, 'result': self._result(api_method, parameters)}
+        return 200, json.dumps(body).encode()
+
+# ======================== SCRIPTED UPDATES ========================
+
+class Deal:
+    """One simulated group where a creator and a counterparty run a deal."""
+
+    def __init__(self, number, application):
+        self.application = application
+        self.chat = {'id': -1_000_000_000 - number, 'type': 'supergroup', 'title': f'Deal {number}'}
+        self.creator = {'id': 10_000_000 + 2 * number, 'is_bot': False, 'first_name': 'Creator'}
+        self.counterparty = {'id': 10_000_001 + 2 * number, 'is_bot': False, 'first_name': 'Counterparty'}
+        self.transaction_id = None
+        self.latencies = defaultdict(list)
+
+    def command(self, user, text):
+        update_id = next(UPDATE_IDS)
+        command = text.split()[0]
+        return {'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': int(time.time()), 'chat': self.chat, 'from': user,
+            'text': text, 'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}],
+        }}
+
+    def button(self, user, data):
+        update_id = next(UPDATE_IDS)
+        return {'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'from': user, 'chat_instance': str(self.chat['id']), 'data': data,
+            'message': {'message_id': update_id, 'date': int(time.time()), 'chat': self.chat, 'from': BOT_USER},
+        }}
+
+    async def send(self, label, data):
+        """Dispatch an update through the bot's update processor and time it."""
+        application = self.application
+        update = Update.de_json(data, application.bot)
+        start = time.perf_counter()
+        await application.update_processor.process_update(update, application.process_update(update))
+        self.latencies[label].append(time.perf_counter() - start)
+
+    async def open(self, currency='btc'):
+        await self.send('/transaction', self.command(self.creator, '/transaction'))
+        await self.send('callback', self.button(self.creator, f'currency_{currency}'))
+        self.transaction_id = (await async_storage.get_user_transaction(self.creator['id'])).id
+
+    async def fund(self):
+        """What the deposit watcher does once the buyer's payment confirms."""
+        await async_storage.transition(
+            self.transaction_id, TransactionStatus.SELLER_SET, TransactionStatus.FUNDED,
+            amount=1_000_000, funded_at=datetime.now()
+        )
+
+async def lifecycle(deal):
+    """Open, configure, fund, release and review one deal."""
+    await deal.open()
+    await deal.send('/set_buyer', deal.command(deal.creator, f'/set_buyer {BUYER_ADDRESS}'))
+    await deal.send('/set_seller', deal.command(
+        deal.counterparty, f'/set_seller {SELLER_ADDRESS} {deal.transaction_id}'))
+    await deal.fund()
+    await deal.send('/status', deal.command(deal.creator, f'/status {deal.transaction_id}'))
+    await deal.send('/pay_seller', deal.command(deal.creator, f'/pay_seller {deal.transaction_id}'))
+    await deal.send('/review', deal.command(deal.creator, '/review Smooth deal'))
+
+async def status_polling(deal, repeats=10):
+    """Both parties checking on an open deal."""
+    await deal.open()
+    for index in range(repeats):
+        user = deal.creator if index % 2 else deal.counterparty
+        await deal.send('/status', deal.command(user, f'/status {deal.transaction_id}'))
+
+async def currency_buttons(deal, repeats=5):
+    """Repeated presses of the currency keyboard, each creating a transaction."""
+    for index in range(repeats):
+        await deal.send('callback', deal.button(deal.creator, 'currency_btc' if index % 2 else 'currency_ltc'))
+
+SCENARIOS = {
+    'lifecycle': lifecycle,
+    'status': status_polling,
+    'callbacks': currency_buttons,
+}
+
+# ======================== RUNNER ========================
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(latencies):
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def build_application(transport, rate_limit):
+    builder = Application.builder() \
+        .token('0:bench') \
+        .request(transport) \
+        .get_updates_request(FakeRequest(0)) \
+        .updater(None) \
+        .job_queue(None) \
+        .concurrent_updates(KeyedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+    if rate_limit:
+        builder = builder.rate_limiter(OutboundScheduler())
+    application = builder.build()
+    bot.setup_handlers(application)
+    return application
+
+async def run_scenario(name, deals, concurrency, api_latency, rate_limit):
+    transport = FakeRequest(api_latency)
+    application = build_application(transport, rate_limit)
+    errors = []
+
+    async def count_error(update, context):
+        errors.append(context.error)
+    application.add_error_handler(count_error)
+
+    script = SCENARIOS[name]
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(deal):
+        async with slots:
+            await script(deal)
+
+    async with application:
+        population = [Deal(number, application) for number in range(deals)]
+        gc.collect()
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        await asyncio.gather(*(run(deal) for deal in population))
+        elapsed = time.perf_counter() - start
+        rss_after = peak_rss_mb()
+
+    by_command = defaultdict(list)
+    for deal in population:
+        for label, samples in deal.latencies.items():
+            by_command[label].extend(samples)
+    latencies = [sample for samples in by_command.values() for sample in samples]
+    return {
+        'updates': len(latencies),
+        'seconds': round(elapsed, 3),
+        'updates_per_second': round(len(latencies) / elapsed, 1),
+        **summarize(latencies),
+        'api_calls': sum(transport.calls.values()),
+        'errors': len(errors),
+        'peak_rss_growth_mb': round(rss_after - rss_before, 1),
+        'commands': {label: summarize(samples) for label, samples in sorted(by_command.items())},
+    }
+
+def print_result(name, result):
+    print(
+        f"{name:<10} {result['updates']:>7} updates {result['updates_per_second']:>9,.0f} upd/s "
+        f"p50 {result['p50_ms']:>7.2f} ms  p99 {result['p99_ms']:>7.2f} ms  "
+        f"api {result['api_calls']:>7}  errors {result['errors']}  rss +{result['peak_rss_growth_mb']} MB"
+    )
+    for label, stats in result['commands'].items():
+        print(f"    {label:<12} {stats['count']:>7} p50 {stats['p50_ms']:>7.2f} ms  p99 {stats['p99_ms']:>7.2f} ms")
+
+def compare(results, baseline, tolerance):
+    """Print changes against a saved baseline; True if any throughput fell beyond tolerance."""
+    print(f"\nAgainst {baseline.get('commit', 'unknown')[:12]} ({baseline.get('date', '?')}):")
+    regressed = False
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        throughput = result['updates_per_second'] / before['updates_per_second'] - 1
+        p99 = result['p99_ms'] / before['p99_ms'] - 1 if before['p99_ms'] else 0.0
+        flag = ''
+        if throughput < -tolerance:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"{name:<10} throughput {throughput:+7.1%}  p99 {p99:+7.1%}{flag}")
+    return regressed
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), action='append',
+                        help="Scenario to run; repeat for several (default: all)")
+    parser.add_argument('--deals', type=int, default=1000, help="Simulated groups per scenario")
+    parser.add_argument('--concurrency', type=int, default=128, help="Groups sending updates at once")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="Seconds per fake Bot API call")
+    parser.add_argument('--rate-limit', action='store_true', help="Keep the outbound rate limiter enabled")
+    parser.add_argument('--save', metavar='PATH', help="Write results as a baseline JSON file")
+    parser.add_argument('--compare', metavar='PATH', help="Compare against a baseline JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="Throughput drop that fails --compare (default: 0.10)")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenario or list(SCENARIOS):
+        results[name] = asyncio.run(
+            run_scenario(name, args.deals, args.concurrency, args.api_latency, args.rate_limit)
+        )
+        print_result(name, results[name])
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as baseline:
+            json.dump({
+                'commit': git_commit(),
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'python': sys.version.split()[0],
+                'storage': os.environ['STORAGE_BACKEND'],
+                'options': {k: v for k, v in vars(args).items() if k not in ('save', 'compare')},
+                'results': results,
+            }, baseline, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline:
+            if compare(results, json.load(baseline), args.tolerance):
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
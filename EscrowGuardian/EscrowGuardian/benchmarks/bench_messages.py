@@ -0,0 +1,80 @@
+"""Per-reply cost of building texts and keyboards inline versus the message catalog.
+
+Run from the project directory: python benchmarks/bench_messages.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup  # noqa: E402
+from models import Transaction, TransactionStatus  # noqa: E402
+from messages import catalog_for, format_minute  # noqa: E402
+
+TRANSACTION = Transaction(
+    id='0b6f1d2e-4c1a-4e8e-9d55-3f7c2a1b9e10', user_id=1, currency='BTC',
+    status=TransactionStatus.BUYER_SET, created_at=datetime(2024, 5, 1, 12, 30),
+    buyer_address='bc1qvcf5t3282g4ssxygcstxmk4s4tepdns8hmgpv4'
+)
+ESCROW_ADDRESS = '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa'
+
+def inline_welcome():
+    keyboard = [
+        [InlineKeyboardButton("📚 How It Works", callback_data='show_escrow_info'),
+         InlineKeyboardButton("💼 Start Transaction", callback_data='start_transaction')],
+        [InlineKeyboardButton("📝 Terms of Service", callback_data='show_terms')]
+    ]
+    return "👋 Welcome to GengarEscrow Bot! 👻💼", InlineKeyboardMarkup(keyboard)
+
+def catalog_welcome():
+    messages = catalog_for()
+    return messages.text('welcome'), messages.keyboard('welcome')
+
+def inline_status(t=TRANSACTION):
+    return (
+        f"📊 Transaction Status\n\n"
+        f"🔖 ID: `{t.id}`\n"
+        f"🕒 Created: {t.created_at.strftime('%Y-%m-%d %H:%M')}\n"
+        f"💰 Currency: {t.currency}\n"
+        f"📥 Escrow Address:\n`{ESCROW_ADDRESS}`\n"
+        f"📈 Status: {t.status.value.capitalize()}\n"
+        f"👤 Buyer: {t.buyer_address or 'Not set'}\n"
+        f"👥 Seller: {t.seller_address or 'Not set'}"
+    )
+
+def catalog_status(t=TRANSACTION):
+    messages = catalog_for()
+    not_set = messages.text('not_set')
+    return messages.render(
+        'status', id=t.id, created=format_minute(t.created_at), currency=t.currency,
+        deposit_address=ESCROW_ADDRESS, status=messages.status(t.status),
+        buyer=t.buyer_address or not_set, seller=t.seller_address or not_set
+    )
+
+def allocated_per_call(func, number=2000):
+    """Bytes allocated per call, including blocks freed before returning."""
+    func()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    results = [func() for _ in range(number)]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return (peak - before) / number
+
+def bench(label, func, number=50000):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"{label:<20} {seconds / number * 1e6:>8.2f} us/reply {allocated_per_call(func):>10,.0f} B/reply")
+
+def main():
+    bench("welcome inline", inline_welcome)
+    bench("welcome catalog", catalog_welcome)
+    bench("status inline", inline_status)
+    bench("status catalog", catalog_status)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Compare-and-set transition throughput per storage backend.
+
+Run from the project directory: python benchmarks/bench_transitions.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import TransactionStatus  # noqa: E402
+from storage import Storage  # noqa: E402
+from sqlite_storage import SQLiteStorage  # noqa: E402
+
+LIFECYCLE = (
+    (TransactionStatus.CREATED, TransactionStatus.BUYER_SET),
+    (TransactionStatus.BUYER_SET, TransactionStatus.FUNDED),
+    (TransactionStatus.FUNDED, TransactionStatus.COMPLETED),
+)
+
+def report(label, count, seconds):
+    print(f"{label:<36} {count / seconds:>14,.0f} ops/s")
+
+def bench(label, storage, count):
+    ids = [storage.create_transaction(user_id, 'BTC').id for user_id in range(count)]
+
+    start = time.perf_counter()
+    for expected, new in LIFECYCLE:
+        for transaction_id in ids:
+            storage.transition(transaction_id, expected, new)
+    report(f"{label}: legal transitions", count * len(LIFECYCLE), time.perf_counter() - start)
+
+    # Losing side of a race: the status no longer matches
+    start = time.perf_counter()
+    for transaction_id in ids:
+        storage.transition(transaction_id, TransactionStatus.FUNDED, TransactionStatus.REFUNDED)
+    report(f"{label}: stale compare-and-set", count, time.perf_counter() - start)
+
+    # Rejected from the transition table without touching storage
+    start = time.perf_counter()
+    for transaction_id in ids:
+        storage.transition(transaction_id, TransactionStatus.COMPLETED, TransactionStatus.FUNDED)
+    report(f"{label}: illegal transitions", count, time.perf_counter() - start)
+
+    batch_ids = [storage.create_transaction(user_id, 'BTC').id for user_id in range(count)]
+    start = time.perf_counter()
+    storage.transition_many(
+        [(i, TransactionStatus.CREATED, TransactionStatus.CANCELLED) for i in batch_ids]
+    )
+    report(f"{label}: transition_many", count, time.perf_counter() - start)
+
+def main(count=20000):
+    bench("memory", Storage(), count)
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SQLiteStorage(os.path.join(directory, 'bench.db'))
+        bench("sqlite", storage, count // 4)
+        storage.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,51 @@
-﻿import logging
-import os
-import aiofiles
+﻿from startup import startup  # First import, so startup phases are timed from here
+import hashlib
+import json
+import logging
 import asyncio
+import threading
+import time
 from telegram import Update
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
-    ContextTypes
+    ChatMemberHandler,
+    ContextTypes,
+    TypeHandler
 )
-from config import TELEGRAM_TOKEN
+from config import (
+    TELEGRAM_TOKEN, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    UPDATE_QUEUE_SIZE, MAX_CONCURRENT_UPDATES, SWEEP_INTERVAL_SECONDS,
+    DEPOSIT_POLL_SECONDS, HEARTBEAT_SECONDS, ARCHIVE_INTERVAL_SECONDS,
+    TELEGRAM_GLOBAL_RATE, CLUSTER_WORKERS, CLUSTER_WORKER_INDEX, LEADER_RENEW_SECONDS,
+    BOT_NAME, PROFILE_PHOTO, THROTTLE_ENABLED, FEE_REFRESH_SECONDS
+)
+from webhook import webhook_bridge, BUSY, UNAVAILABLE
+from leader import leadership, lease_job, leader_only
+from member_cache import track_chat_members
+from throttle import throttle_update
+from asset_cache import asset_cache
+import metrics
+import logging_setup
+from update_processor import KeyedUpdateProcessor
+from rate_limiter import OutboundScheduler
+from sweeper import sweep_job, archive_job
+from deposit_watcher import deposit_job, deposit_watcher
+from deposit_addresses import warm_pools
+from money import fee_job, fee_schedule
 from handlers import (
     start, transaction, select_currency, set_buyer, set_seller,
-    status, balance, verify, review, report, restart, terms,
+    status, balance, verify, review, reputation, report, restart, terms,
     button_callback, refund_buyer, pay_seller, contact, real, check, how
 )
 
-# Set up logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+# Runs updates from different users in parallel, same-transaction updates in order
+update_processor = KeyedUpdateProcessor(MAX_CONCURRENT_UPDATES, max_pending=UPDATE_QUEUE_SIZE)
+profile_task = None
+
 # Define bot commands for menu
 BOT_COMMANDS = [
     ("start", "Start the bot and receive a welcome menu"),
@@ -33,7 +56,8 @@ BOT_COMMANDS = [
     ("balance", "Check your current balance"),
     ("refund_buyer", "Process refund to buyer"),
     ("pay_seller", "Complete payment to seller"),
-    ("review", "[message] Leave transaction review"),
+    ("review", "[1-5] [message] Leave transaction review"),
+    ("reputation", "Show a user's track record (reply to them)"),
     ("restart", "Restart transaction to start anew"),
     ("verify", "[crypto_address] Verify escrow address legitimacy"),
     ("report", "[message] Report suspicious activities"),
@@ -50,54 +74,49 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     if isinstance(update, Update) and update.message:
         await update.message.reply_text("⚠️ Service temporarily unavailable. Please try again later.")
 
-async def set_bot_profile_photo(application: Application):
-    """Set bot's profile photo using async file handling"""
+async def publish_if_changed(key, content, publish):
+    """Send profile content to Telegram unless the same content was sent successfully before"""
+    digest = hashlib.sha256(json.dumps(content).encode()).hexdigest()
+    if asset_cache.is_current(f"profile:{key}", digest):
+        logger.debug("Bot %s unchanged; not updating", key)
+        return
     try:
-        photo_path = os.path.abspath(os.path.join('attached_assets', 'gengar_pfp.jpg'))
-        if os.path.exists(photo_path):
-            async with aiofiles.open(photo_path, 'rb') as photo_file:
-                photo_data = await photo_file.read()
-                await application.bot.set_my_photo(photo=photo_data)
-                logger.info("Successfully updated bot profile photo")
-        else:
-            logger.error("Profile photo file not found at: %s", photo_path)
+        await publish()
     except Exception as e:
-        logger.error("Failed to set profile photo: %s", str(e))
-
-async def set_bot_name(application: Application):
-    """Set bot's display name with flood control handling"""
-    max_retries = 3
-    base_delay = 10
-    
-    for attempt in range(1, max_retries+1):
-        try:
-            await application.bot.set_my_name("Gengar Escrow Bot")
-            logger.info("Successfully updated bot name")
-            return
-        except Exception as e:
-            if "retry after" in str(e):
-                wait_time = int(str(e).split()[-1])
-                logger.warning("Flood control: Waiting %d seconds (attempt %d)", wait_time, attempt)
-                await asyncio.sleep(wait_time + 5)
-            else:
-                logger.warning("Name set attempt %d failed: %s", attempt, str(e))
-                await asyncio.sleep(base_delay * (2 ** attempt))
-    logger.error("Permanent failure setting bot name")
+        # Flood control is handled by the outbound scheduler; this is permanent
+        logger.error("Failed to update bot %s: %s", key, e)
+        return
+    asset_cache.remember(f"profile:{key}", digest)
+    logger.info("Updated bot %s", key)
+
+def check_profile_photo():
+    """The Bot API cannot set profile photos, so point out when the asset changes"""
+    digest = asset_cache.content_hash(PROFILE_PHOTO)
+    if digest is None:
+        logger.error("Profile photo %s not found in assets", PROFILE_PHOTO)
+    elif not asset_cache.is_current("profile:photo", digest):
+        logger.warning("%s changed; set it as the bot's photo with BotFather's /setuserpic", PROFILE_PHOTO)
+        asset_cache.remember("profile:photo", digest)
+
+async def update_bot_profile(application: Application):
+    """Menu commands and profile, sent in the background only when they changed"""
+    bot = application.bot
+    await publish_if_changed("commands", BOT_COMMANDS, lambda: bot.set_my_commands(BOT_COMMANDS))
+    await publish_if_changed("name", BOT_NAME, lambda: bot.set_my_name(BOT_NAME))
+    check_profile_photo()
 
 async def post_init(application: Application):
-    """Async initialization tasks"""
-    try:
-        # Set commands first for immediate usability
-        await application.bot.set_my_commands(BOT_COMMANDS)
-        
-        # Profile customization (optional)
-        await set_bot_profile_photo(application)
-        # await set_bot_name(application)  # Temporarily disabled due to flood control
-        
-        logger.info("Bot initialization completed")
-    except Exception as e:
-        logger.error("Post-init failed: %s", str(e))
-        raise
+    """Async initialization; anything not needed to handle updates runs later"""
+    startup.phase("initialize")
+    # Every process hands out addresses, so each fills its own pools
+    warm_pools()
+    # Profile and command updates are global, so only the leader sends them
+    if not await leadership.renew():
+        logger.info("Not the leader; skipping bot profile setup")
+        return
+    # The application is not running yet, so this is a plain task tracked here
+    global profile_task
+    profile_task = asyncio.create_task(update_bot_profile(application), name="bot_profile")
 
 def setup_handlers(application: Application):
     """Configure all async handlers"""
@@ -111,6 +130,7 @@ def setup_handlers(application: Application):
         CommandHandler("balance", balance),
         CommandHandler("verify", verify),
         CommandHandler("review", review),
+        CommandHandler("reputation", reputation),
         CommandHandler("report", report),
         CommandHandler("restart", restart),
         CommandHandler("terms", terms),
@@ -123,22 +143,176 @@ def setup_handlers(application: Application):
         CallbackQueryHandler(button_callback)
     ]
 
+    application.add_handler(TypeHandler(Update, note_first_update), group=-110)
+    # Tag every log line emitted while handling an update with its ids
+    application.add_handler(TypeHandler(Update, logging_setup.bind_update), group=-100)
+    # Membership changes refresh the chat member cache before any handler reads it
+    application.add_handler(ChatMemberHandler(track_chat_members, ChatMemberHandler.ANY_CHAT_MEMBER), group=-90)
+    # Over-limit commands stop here, before any handler spends API calls on them
+    if THROTTLE_ENABLED:
+        application.add_handler(TypeHandler(Update, throttle_update), group=-50)
+
     for handler in handlers:
+        name = next(iter(handler.commands)) if isinstance(handler, CommandHandler) else handler.callback.__name__
+        handler.callback = metrics.instrument_handler(name, handler.callback)
         application.add_handler(handler)
 
     application.add_error_handler(error_handler)
 
-def main():
-    """Start the async application"""
-    application = Application.builder() \
+async def note_first_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Log time-to-first-update once"""
+    startup.update_received()
+
+async def heartbeat_job(context: ContextTypes.DEFAULT_TYPE):
+    """Prove to /health that the event loop is still turning"""
+    metrics.heartbeat.beat()
+
+def setup_metrics(application: Application):
+    """Expose queue depth and update processor state on /metrics"""
+    metrics.register_gauge(
+        'escrow_update_queue_depth', 'Updates waiting in the application queue',
+        lambda: application.update_queue.qsize()
+    )
+    metrics.register_gauge(
+        'escrow_update_processor', 'Concurrent update processor state',
+        lambda: {(key,): value for key, value in update_processor.stats().items()},
+        labelnames=('stat',)
+    )
+    metrics.register_gauge(
+        'escrow_startup_seconds', 'Duration of each startup phase and time to the first update',
+        startup.samples, labelnames=('phase',)
+    )
+
+def setup_jobs(application: Application):
+    """Schedule recurring background jobs"""
+    if application.job_queue is None:
+        logger.warning("Job queue unavailable; install python-telegram-bot[job-queue] to expire stale escrows")
+        return
+    application.job_queue.run_repeating(heartbeat_job, interval=HEARTBEAT_SECONDS, first=0, name="heartbeat")
+    application.job_queue.run_repeating(lease_job, interval=LEADER_RENEW_SECONDS, first=0, name="leader_lease")
+    # Every worker settles deals, so each keeps its own fee table fresh
+    application.job_queue.run_repeating(fee_job, interval=FEE_REFRESH_SECONDS, first=0, name="fee_refresh")
+    # Singleton jobs: with several workers only the lease holder runs them
+    application.job_queue.run_repeating(leader_only(sweep_job), interval=SWEEP_INTERVAL_SECONDS, first=60, name="escrow_timeout_sweep")
+    application.job_queue.run_repeating(leader_only(deposit_job), interval=DEPOSIT_POLL_SECONDS, first=10, name="deposit_watcher")
+    application.job_queue.run_repeating(leader_only(archive_job), interval=ARCHIVE_INTERVAL_SECONDS, first=120, name="transaction_archive")
+
+async def post_shutdown(application: Application):
+    """Release pooled connections and hand leadership over"""
+    if profile_task is not None:
+        profile_task.cancel()
+    await deposit_watcher.close()
+    await fee_schedule.close()
+    await leadership.release()
+
+async def run_webhook(application: Application):
+    """Process updates pushed to the web server's webhook route"""
+    async with application:
+        await post_init(application)
+        # Ready to take updates before Telegram is told to send them
+        await application.start()
+        webhook_bridge.attach(application)
+        startup.phase("ready")
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+        logger.info("Webhook registered, waiting for updates...")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            webhook_bridge.detach()
+            await application.stop()
+            # Only run_polling invokes the post_shutdown hook by itself
+            await post_shutdown(application)
+
+def feed_updates(source):
+    """Move updates routed by the cluster supervisor into the application"""
+    while True:
+        data = source.get()
+        if data is None:
+            return
+        result = webhook_bridge.submit(data)
+        while result == BUSY:
+            # Backpressure: the supervisor's queue to this worker fills up instead
+            time.sleep(0.1)
+            result = webhook_bridge.submit(data)
+        if result == UNAVAILABLE:
+            logger.error("Application stopped; no longer reading routed updates")
+            return
+
+async def run_worker(application: Application, source):
+    """Process updates routed to this cluster worker by the supervisor"""
+    async with application:
+        await post_init(application)
+        await application.start()
+        webhook_bridge.attach(application)
+        feeder = threading.Thread(target=feed_updates, args=(source,), name="update-feeder", daemon=True)
+        feeder.start()
+        startup.phase("ready")
+        logger.info("Cluster worker %s ready", CLUSTER_WORKER_INDEX)
+        try:
+            while feeder.is_alive():
+                await asyncio.sleep(1)
+        finally:
+            webhook_bridge.detach()
+            await application.stop()
+            # Only run_polling invokes the post_shutdown hook by itself
+            await post_shutdown(application)
+
+def main(source=None):
+    """Start the async application; source is a cluster worker's update queue"""
+    startup.phase("imports")
+    global_rate = TELEGRAM_GLOBAL_RATE
+    if CLUSTER_WORKER_INDEX is not None:
+        # Workers share the bot's global budget
+        rate, burst = TELEGRAM_GLOBAL_RATE
+        global_rate = (rate / CLUSTER_WORKERS, max(1, burst / CLUSTER_WORKERS))
+
+    builder = Application.builder() \
         .token(TELEGRAM_TOKEN) \
-        .post_init(post_init) \
-        .build()
+        .request(metrics.InstrumentedRequest()) \
+        .rate_limiter(OutboundScheduler(global_rate=global_rate)) \
+        .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)) \
+        .concurrent_updates(update_processor) \
+        .post_shutdown(post_shutdown)
+
+    if source is not None:
+        application = builder.updater(None).build()
+        setup_handlers(application)
+        setup_metrics(application)
+        setup_jobs(application)
+        startup.phase("build")
+        asyncio.run(run_worker(application, source))
+        return
+
+    if WEBHOOK_URL:
+        application = builder.updater(None).build()
+        setup_handlers(application)
+        setup_metrics(application)
+        setup_jobs(application)
+        startup.phase("build")
+        asyncio.get_event_loop().run_until_complete(run_webhook(application))
+        return
 
+    application = builder.post_init(post_init) \
+        .get_updates_request(metrics.InstrumentedRequest()) \
+        .build()
     setup_handlers(application)
-    
+    setup_metrics(application)
+    setup_jobs(application)
+    startup.phase("build")
+
+    # chat_member updates are only delivered when requested explicitly
+    polling_kwargs = {'allowed_updates': Update.ALL_TYPES}
+    # Signal handlers can only be installed from the main thread
+    if threading.current_thread() is not threading.main_thread():
+        polling_kwargs['stop_signals'] = None
+
     logger.info("Starting bot polling...")
-    application.run_polling()
+    application.run_polling(**polling_kwargs)
 
 if __name__ == '__main__':
+    logging_setup.configure_logging()
     main()
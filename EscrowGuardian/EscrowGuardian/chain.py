@@ -0,0 +1,160 @@
+import asyncio
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import httpx
+from config import CHAIN_BACKEND, ESPLORA_URLS, CHAIN_HTTP_TIMEOUT, CHAIN_HTTP_MAX_CONNECTIONS
+
+@dataclass(frozen=True)
+class Deposit:
+    txid: str
+    address: str
+    amount: int  # Base units (satoshis / litoshis)
+    senders: Tuple[str, ...]
+    block_height: Optional[int] = None  # None while in the mempool
+    vout: int = 0  # First output of the transaction paying address
+
+    @property
+    def outpoint(self):
+        """'txid:vout', unique per credited payment even when one tx funds several addresses."""
+        return f"{self.txid}:{self.vout}"
+
+    def confirmations(self, tip_height):
+        if self.block_height is None:
+            return 0
+        return tip_height - self.block_height + 1
+
+class ChainBackend:
+    """Read-only chain data source used by the deposit watcher."""
+
+    async def get_tip_height(self):
+        raise NotImplementedError
+
+    async def get_block_deposits(self, height):
+        """Payments to every address in the block at height, one per (transaction, address)."""
+        raise NotImplementedError
+
+    async def get_fee_rate(self, target_blocks):
+        """Base units per virtual byte to confirm within target_blocks."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class EsploraBackend(ChainBackend):
+    """Esplora REST API client (blockstream.info, mempool.space, litecoinspace)."""
+
+    def __init__(self, base_url, client=None):
+        self.base_url = base_url.rstrip('/')
+        self._client = client
+
+    @property
+    def client(self):
+        # Built on first use: its TLS context takes tens of ms to load at startup
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=CHAIN_HTTP_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=CHAIN_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=CHAIN_HTTP_MAX_CONNECTIONS
+                )
+            )
+        return self._client
+
+    async def _get(self, path):
+        response = await self.client.get(f"{self.base_url}{path}")
+        response.raise_for_status()
+        return response
+
+    async def get_tip_height(self):
+        return int((await self._get('/blocks/tip/height')).text)
+
+    @staticmethod
+    def _deposits(tx, height):
+        # Outputs to the same address are summed and keyed by the first one
+        outputs = {}
+        for index, out in enumerate(tx.get('vout', [])):
+            address = out.get('scriptpubkey_address')
+            if address and out.get('value'):
+                vout, amount = outputs.get(address, (index, 0))
+                outputs[address] = (vout, amount + out['value'])
+        if not outputs:
+            return []
+        senders = tuple(sorted({
+            vin['prevout']['scriptpubkey_address']
+            for vin in tx.get('vin', [])
+            if vin.get('prevout') and vin['prevout'].get('scriptpubkey_address')
+        }))
+        return [
+            Deposit(tx['txid'], address, amount, senders, height, vout)
+            for address, (vout, amount) in outputs.items()
+        ]
+
+    async def get_block_deposits(self, height):
+        block_hash = (await self._get(f'/block-height/{height}')).text.strip()
+        tx_count = (await self._get(f'/block/{block_hash}')).json()['tx_count']
+        # Transactions come 25 to a page; pages are fetched concurrently but
+        # never more at once than there are pooled connections, so none
+        # times out waiting for one
+        slots = asyncio.Semaphore(CHAIN_HTTP_MAX_CONNECTIONS)
+
+        async def page(start):
+            async with slots:
+                return (await self._get(f'/block/{block_hash}/txs/{start}')).json()
+
+        deposits = []
+        for txs in await asyncio.gather(*(page(start) for start in range(0, tx_count, 25))):
+            for tx in txs:
+                deposits.extend(self._deposits(tx, height))
+        return deposits
+
+    async def get_fee_rate(self, target_blocks):
+        # Keys are confirmation targets; take the nearest one at least as fast
+        estimates = {int(target): rate for target, rate in (await self._get('/fee-estimates')).json().items()}
+        eligible = [target for target in estimates if target <= target_blocks]
+        return estimates[max(eligible) if eligible else min(estimates)]
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+class MockNode(ChainBackend):
+    """In-process stand-in node for tests and local development."""
+
+    def __init__(self, height=0, fee_rate=1.0):
+        self.height = height
+        self.fee_rate = fee_rate
+        self._mempool = []
+        self._blocks = defaultdict(list)
+
+    def send(self, sender, address, amount):
+        """Broadcast a payment; it stays unconfirmed until mine() is called."""
+        deposit = Deposit(uuid.uuid4().hex, address, amount, (sender,))
+        self._mempool.append(deposit)
+        return deposit.txid
+
+    def mine(self, blocks=1):
+        for _ in range(blocks):
+            self.height += 1
+            for deposit in self._mempool:
+                confirmed = Deposit(deposit.txid, deposit.address, deposit.amount, deposit.senders, self.height)
+                self._blocks[self.height].append(confirmed)
+            self._mempool = []
+
+    async def get_tip_height(self):
+        return self.height
+
+    async def get_block_deposits(self, height):
+        return list(self._blocks.get(height, ()))
+
+    async def get_fee_rate(self, target_blocks):
+        return self.fee_rate
+
+def create_chain_backend(currency, backend=CHAIN_BACKEND):
+    """Build the chain data source selected by configuration."""
+    if backend == 'esplora':
+        return EsploraBackend(ESPLORA_URLS[currency])
+    if backend == 'mock':
+        return MockNode()
+    raise ValueError(f"Unknown chain backend: {backend}")
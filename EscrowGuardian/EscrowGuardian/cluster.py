@@ -0,0 +1,297 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import urllib.request
+import zlib
+from telegram import Update
+from update_processor import sender_key
+
+# Project modules that read config are imported inside functions: worker
+# processes are spawned fresh and must set their environment first.
+
+logger = logging.getLogger(__name__)
+
+# ======================== PARTITIONING ========================
+
+def shard_key(update):
+    """Chat id, so every update of a chat (and its deals) lands on one worker."""
+    if update.effective_chat:
+        return update.effective_chat.id
+    return sender_key(update)
+
+def shard_for(update, workers):
+    return zlib.crc32(str(shard_key(update)).encode()) % workers
+
+# ======================== WORKERS ========================
+
+def worker_environment(index):
+    """Per-worker settings: a share of the rate budget, own log file and journal."""
+    from config import LOG_FILE, JOURNAL_DIR
+    env = {'CLUSTER_WORKER_INDEX': str(index)}
+    if LOG_FILE:
+        root, ext = os.path.splitext(LOG_FILE)
+        env['LOG_FILE'] = f"{root}.worker{index}{ext}"
+    env['JOURNAL_DIR'] = os.path.join(JOURNAL_DIR, f"worker{index}")
+    return env
+
+def serve_worker_metrics(index):
+    """Serve this worker's /metrics on localhost, for the supervisor to collect"""
+    from flask import Flask, Response
+    from werkzeug.serving import make_server
+    from config import CLUSTER_METRICS_PORT
+    import metrics
+
+    app = Flask(f"worker{index}")
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+    server = make_server('127.0.0.1', CLUSTER_METRICS_PORT + index, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="worker-metrics", daemon=True).start()
+
+def run_worker(source, env):
+    """Entry point of a worker process"""
+    os.environ.update(env)
+    import logging_setup
+    logging_setup.configure_logging()
+    serve_worker_metrics(int(env['CLUSTER_WORKER_INDEX']))
+    import bot
+    bot.main(source=source)
+
+# ======================== METRICS ========================
+
+def _with_worker(sample, index):
+    """A sample line with a worker label added first."""
+    name, brace, rest = sample.partition('{')
+    if brace:
+        return f'{name}{{worker="{index}",{rest}'
+    name, _, value = sample.partition(' ')
+    return f'{name}{{worker="{index}"}} {value}'
+
+def merge_metrics(expositions):
+    """One exposition from each worker's, samples labelled by worker and grouped per metric.
+
+    expositions maps worker index to its /metrics text, or None if it could
+    not be read; escrow_cluster_worker_up reports which ones were.
+    """
+    families = {}
+    for index, text in expositions.items():
+        family = None
+        for line in (text or '').splitlines():
+            if line.startswith('# HELP ') or line.startswith('# TYPE '):
+                family = families.setdefault(line.split(' ', 3)[2], ([], []))
+                if len(family[0]) < 2:
+                    family[0].append(line)
+            elif line and family is not None:
+                family[1].append(_with_worker(line, index))
+    lines = [
+        "# HELP escrow_cluster_worker_up Whether the worker's metrics could be read",
+        "# TYPE escrow_cluster_worker_up gauge",
+    ]
+    lines += [f'escrow_cluster_worker_up{{worker="{index}"}} {int(text is not None)}' for index, text in expositions.items()]
+    for header, samples in families.values():
+        lines += header + samples
+    return '\n'.join(lines) + '\n'
+
+class Cluster:
+    """Supervisor that partitions updates across bot worker processes.
+
+    Each worker runs a full application fed from its own queue. Updates are
+    routed by chat id, so one chat is always handled by the same worker and
+    keeps its ordering; storage is shared, and compare-and-set transitions
+    keep deals consistent when participants in different chats touch them.
+    Dead workers are restarted and resume from their queue.
+
+    The supervisor's web server answers /health, the webhook and /admin
+    (storage is shared, so it reads it directly). Worker i serves its own
+    /metrics on localhost at CLUSTER_METRICS_PORT + i, and the supervisor's
+    /metrics merges them with a worker label.
+    """
+
+    def __init__(self, workers, queue_size):
+        from config import CLUSTER_RESTART_DELAY
+        self.workers = workers
+        self.restart_delay = CLUSTER_RESTART_DELAY
+        self._context = multiprocessing.get_context('spawn')
+        self.queues = [self._context.Queue(queue_size) for _ in range(workers)]
+        self.processes = [None] * workers
+        self._stopping = threading.Event()
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=run_worker,
+            args=(self.queues[index], worker_environment(index)),
+            name=f"escrow-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        threading.Thread(target=self._watch, name="cluster-watchdog", daemon=True).start()
+        logger.info("Started %d cluster workers", self.workers)
+
+    def _watch(self):
+        while not self._stopping.wait(self.restart_delay):
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logger.error("Worker %d exited with code %s; restarting", index, process.exitcode)
+                    self._spawn(index)
+
+    def dispatch(self, update, data, timeout=None):
+        """Queue a parsed update's raw data on its worker; False if the queue stayed full."""
+        try:
+            self.queues[shard_for(update, self.workers)].put(data, timeout=timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def route(self, data, timeout):
+        """Route a raw update received by the web server."""
+        from webhook import ACCEPTED, BUSY, INVALID
+        try:
+            update = Update.de_json(data, None)
+        except Exception as e:
+            logger.warning("Rejected malformed webhook payload: %s", e)
+            return INVALID
+        return ACCEPTED if self.dispatch(update, data, timeout) else BUSY
+
+    def alive(self):
+        return [process is not None and process.is_alive() for process in self.processes]
+
+    def collect_metrics(self, timeout=2):
+        """Every worker's /metrics text by index, None for those that did not answer"""
+        from config import CLUSTER_METRICS_PORT
+        expositions = {}
+        for index in range(self.workers):
+            try:
+                url = f"http://127.0.0.1:{CLUSTER_METRICS_PORT + index}/metrics"
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    expositions[index] = response.read().decode()
+            except OSError as e:
+                logger.warning("Could not read metrics of worker %d: %s", index, e)
+                expositions[index] = None
+        return expositions
+
+    def stop(self):
+        self._stopping.set()
+        for source in self.queues:
+            try:
+                source.put_nowait(None)
+            except queue.Full:
+                pass
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+# ======================== INGESTION ========================
+
+async def poll_updates(cluster, token):
+    """Long-poll Telegram once for the whole cluster and route each update"""
+    from telegram import Bot
+    from telegram.error import TelegramError
+    offset = None
+    async with Bot(token) as bot:
+        await bot.delete_webhook()
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+            except TelegramError as e:
+                logger.warning("getUpdates failed: %s", e)
+                await asyncio.sleep(5)
+                continue
+            for update in updates:
+                # Blocks while the worker is saturated, so the offset only
+                # advances past updates a worker has accepted
+                await asyncio.to_thread(cluster.dispatch, update, update.to_dict())
+                offset = update.update_id + 1
+
+async def register_webhook(token):
+    from telegram import Bot
+    from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET
+    async with Bot(token) as bot:
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+
+def create_cluster_app(cluster):
+    """Web server of the supervisor: worker health and metrics, the webhook and admin routes"""
+    from flask import Flask, Response, jsonify, request
+    from config import WEBHOOK_PATH, WEBHOOK_SUBMIT_TIMEOUT
+    from webhook import webhook_bridge, http_response
+    from admin_api import admin
+    from metrics import CONTENT_TYPE
+
+    app = Flask(__name__)
+    app.register_blueprint(admin)
+
+    @app.route('/health')
+    def health():
+        alive = cluster.alive()
+        status = "ok" if all(alive) else "degraded" if any(alive) else "down"
+        return jsonify({"status": status, "workers": alive}), 200 if status == "ok" else 503
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(merge_metrics(cluster.collect_metrics()), mimetype=CONTENT_TYPE)
+
+    @app.route(WEBHOOK_PATH, methods=['POST'])
+    def telegram_webhook():
+        if not webhook_bridge.check_secret(request.headers.get('X-Telegram-Bot-Api-Secret-Token')):
+            return jsonify({"error": "forbidden"}), 403
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({"error": "invalid payload"}), 400
+        body, status, headers = http_response(cluster.route(data, WEBHOOK_SUBMIT_TIMEOUT))
+        return jsonify(body), status, headers
+
+    return app
+
+# ======================== ENTRY POINT ========================
+
+def main():
+    """Run the bot as CLUSTER_WORKERS processes sharing one storage backend"""
+    import logging_setup
+    logging_setup.configure_logging()
+    from config import (
+        TELEGRAM_TOKEN, WEBHOOK_URL, STORAGE_BACKEND, SQLITE_PATH, SQLITE_BUSY_TIMEOUT,
+        POSTGRES_DSN, CLUSTER_WORKERS, UPDATE_QUEUE_SIZE
+    )
+
+    if STORAGE_BACKEND == 'memory':
+        raise SystemExit("Cluster mode needs shared storage; set STORAGE_BACKEND=sqlite or postgres")
+    # Create and migrate the schema once, before workers race to open it
+    if STORAGE_BACKEND == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        SQLiteStorage(SQLITE_PATH, SQLITE_BUSY_TIMEOUT).close()
+    elif STORAGE_BACKEND == 'postgres':
+        from postgres_storage import PostgresStorage
+        PostgresStorage(POSTGRES_DSN, 1).close()
+
+    cluster = Cluster(CLUSTER_WORKERS, UPDATE_QUEUE_SIZE)
+    cluster.start()
+    app = create_cluster_app(cluster)
+    serve = functools.partial(app.run, host='0.0.0.0', port=5000, threaded=True, use_reloader=False)
+    try:
+        if WEBHOOK_URL:
+            asyncio.run(register_webhook(TELEGRAM_TOKEN))
+            serve()
+        else:
+            # Health, metrics and admin stay reachable while polling
+            threading.Thread(target=serve, name="cluster-web", daemon=True).start()
+            asyncio.run(poll_updates(cluster, TELEGRAM_TOKEN))
+    finally:
+        cluster.stop()
+
+if __name__ == '__main__':
+    main()
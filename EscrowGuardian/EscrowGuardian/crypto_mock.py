@@ -1,5 +1,6 @@
-import re
 import uuid
+import address_validation
+from money import fee_schedule
 
 class CryptoMock:
     """Mock class for crypto-related operations."""
@@ -7,28 +8,22 @@ class CryptoMock:
     @staticmethod
     def verify_address(currency, address):
         """Verify if an address format is valid for the given currency."""
-        if currency == 'BTC':
-            # Simple check for BTC address format
-            return bool(re.match(r'^[13][a-km-zA-HJ-NP-Z1-9]{25,34}$', address))
-        elif currency == 'LTC':
-            # Simple check for LTC address format
-            return bool(re.match(r'^[LM3][a-km-zA-HJ-NP-Z1-9]{26,33}$', address))
-        return False
+        return address_validation.verify_address(currency, address)
 
     @staticmethod
-    def get_fee(currency: str) -> float:
-        """Get the transaction fee for the given currency."""
-        if currency == 'BTC':
-            return 0.00002256
-        elif currency == 'LTC':
-            return 0.0
-        return 0.0
+    def verify_many(currency, addresses):
+        """Verify a batch of addresses for the given currency."""
+        return address_validation.verify_many(currency, addresses)
 
     @staticmethod
-    def calculate_total(amount: float, currency: str) -> float:
-        """Calculate the total amount including fees."""
-        fee = CryptoMock.get_fee(currency)
-        return amount + fee
+    def get_fee(currency: str) -> int:
+        """Get the network fee in base units for the given currency."""
+        return fee_schedule.rules[currency].network_fee
+
+    @staticmethod
+    def calculate_total(amount: int, currency: str) -> int:
+        """Calculate the deposit in base units that pays amount out after fees."""
+        return fee_schedule.total(currency, amount)
 
     @staticmethod
     def generate_transaction_id():
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from collections import deque
+import metrics
+from storage import async_storage
+from hd_wallet import AddressDeriver
+from config import ESCROW_WALLETS, DEPOSIT_XPUBS, DEPOSIT_POOL_SIZE, DEPOSIT_POOL_LOW_WATER
+
+logger = logging.getLogger(__name__)
+
+class AddressPool:
+    """Deposit addresses of one currency, derived ahead of demand.
+
+    Derivation is elliptic-curve math, so it runs on a worker thread whenever
+    the pool drops to its low-water mark and creating a deal just pops a
+    ready address. Indexes are reserved in storage before deriving, so
+    refills in other processes never hand out the same address.
+    """
+
+    def __init__(self, deriver, size=DEPOSIT_POOL_SIZE, low_water=DEPOSIT_POOL_LOW_WATER):
+        self.deriver = deriver
+        self.currency = deriver.currency
+        self.size = size
+        self.low_water = low_water
+        self._ready = deque()
+        self._refill = None
+
+    def __len__(self):
+        return len(self._ready)
+
+    def refill_soon(self):
+        """Start a background refill unless one is running; returns its task."""
+        if self._refill is None or self._refill.done():
+            self._refill = asyncio.create_task(self._fill(), name=f"deposit_pool_{self.currency}")
+            self._refill.add_done_callback(self._refilled)
+        return self._refill
+
+    async def _fill(self):
+        count = self.size - len(self._ready)
+        if count <= 0:
+            return
+        start = await async_storage.reserve_deposit_indexes(self.currency, count)
+        self._ready.extend(await asyncio.to_thread(self.deriver.addresses, start, count))
+
+    def _refilled(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Refilling %s deposit addresses failed: %s", self.currency, task.exception())
+
+    async def take(self):
+        """Next unused (index, address); only waits when the pool has run dry."""
+        while not self._ready:
+            logger.warning("%s deposit address pool empty; waiting for a refill", self.currency)
+            await self.refill_soon()
+        pair = self._ready.popleft()
+        if len(self._ready) <= self.low_water:
+            self.refill_soon()
+        return pair
+
+deposit_pools = {
+    currency: AddressPool(AddressDeriver(currency, xpub))
+    for currency, xpub in DEPOSIT_XPUBS.items() if xpub
+}
+
+metrics.register_gauge(
+    'escrow_deposit_pool_ready', 'Pre-derived deposit addresses ready per currency',
+    lambda: {(currency,): len(pool) for currency, pool in deposit_pools.items()},
+    labelnames=('currency',)
+)
+
+def warm_pools():
+    """Fill every pool in the background, e.g. at startup."""
+    for pool in deposit_pools.values():
+        pool.refill_soon()
+
+async def assign_deposit_address(currency):
+    """(index, address) for a new deal, or (None, None) where the shared wallet is used."""
+    pool = deposit_pools.get(currency)
+    return await pool.take() if pool is not None else (None, None)
+
+def deposit_address_of(transaction):
+    """Where the buyer of a transaction pays."""
+    return transaction.deposit_address or ESCROW_WALLETS[transaction.currency]
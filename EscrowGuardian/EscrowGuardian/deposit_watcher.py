@@ -0,0 +1,198 @@
+import asyncio
+import logging
+from datetime import datetime
+from telegram.constants import ParseMode
+from telegram.ext import CallbackContext
+import metrics
+from models import TransactionStatus
+from storage import async_storage
+from chain import create_chain_backend
+from money import fee_schedule, format_units
+from config import (
+    ESCROW_WALLETS, MINIMUM_CONFIRMATIONS, SUPPORTED_CURRENCIES, DEPOSIT_LOOKBACK_BLOCKS,
+    DEPOSIT_MAX_BLOCKS_PER_POLL
+)
+
+logger = logging.getLogger(__name__)
+
+AWAITING_FUNDS = (TransactionStatus.BUYER_SET, TransactionStatus.SELLER_SET)
+
+class DepositWatcher:
+    """Moves transactions to FUNDED once their deposit is deep enough.
+
+    Each poll reads the blocks that have reached the required depth since
+    the last one, once per currency however many deals are open, and looks
+    their outputs up in the deposit address index in a single query per
+    block. A per-currency height cursor, kept in storage, means every block
+    is read once, across restarts and leader changes too. A credited
+    payment's outpoint is stored on the deal it funded, so a deposit seen
+    twice is never credited twice; a refused one is stored on its deal as
+    the rejected outpoint and amount, for the operator to refund.
+    """
+
+    def __init__(self, backends, min_confirmations=MINIMUM_CONFIRMATIONS, max_blocks=DEPOSIT_MAX_BLOCKS_PER_POLL):
+        self.backends = backends
+        self.min_confirmations = min_confirmations
+        self.max_blocks = max_blocks
+        # Next block height to read per currency
+        self.cursors = {currency: None for currency in backends}
+
+    async def poll_currency(self, currency):
+        backend = self.backends[currency]
+        tip = await backend.get_tip_height()
+        if self.cursors[currency] is None:
+            self.cursors[currency] = await async_storage.get_chain_cursor(currency)
+        if self.cursors[currency] is None:
+            # Nothing older than an escrow's lifetime can fund an open deal
+            self.cursors[currency] = max(0, tip - DEPOSIT_LOOKBACK_BLOCKS[currency])
+        # Blocks up to here have enough confirmations; a long outage is caught up over several polls
+        last = min(tip - self.min_confirmations + 1, self.cursors[currency] + self.max_blocks - 1)
+        outcomes = []
+        for height in range(self.cursors[currency], last + 1):
+            # Any failure aborts the poll before the cursor passes this block
+            outcomes.extend(await self.credit(currency, await backend.get_block_deposits(height)))
+            self.cursors[currency] = height + 1
+            await async_storage.set_chain_cursor(currency, height + 1)
+        return outcomes
+
+    async def credit(self, currency, deposits):
+        """Fund the deals the block's deposits pay.
+
+        Returns (transaction, deposit, violation) for each deposit matched to
+        a deal: violation is None if it funded the deal, else why it was refused.
+        """
+        wallet = ESCROW_WALLETS[currency]
+        owners = {
+            t.deposit_address: t for t in await async_storage.get_transactions_by_deposit_addresses(
+                {deposit.address for deposit in deposits if deposit.address != wallet}
+            )
+            if t.currency == currency
+        }
+        outcomes = []
+        for deposit in deposits:
+            if deposit.address != wallet and deposit.address not in owners:
+                continue  # Someone else's payment
+            if await async_storage.get_transaction_by_outpoint(deposit.outpoint):
+                continue  # Credited before a restart or by a previous leader
+            transaction = await self.match(currency, deposit, owners)
+            if transaction is None:
+                logger.warning("Unmatched %s deposit %s from %s", currency, deposit.txid, deposit.senders)
+                continue
+            if transaction.rejected_outpoint == deposit.outpoint:
+                continue  # Refused before a restart
+            violation = self.violation(transaction, deposit)
+            if violation:
+                # Funds are on chain either way, and the cursor moves past this
+                # block: the deal records them for an operator to refund
+                metrics.rejected_deposits.inc(violation)
+                logger.error(
+                    "Deposit %s of %s %s to %s is %s; not funding it", deposit.txid,
+                    format_units(deposit.amount), currency, transaction.id, violation,
+                    extra={"transaction_id": transaction.id}
+                )
+                rejected = None
+                if transaction.is_active():
+                    rejected = await async_storage.transition(
+                        transaction.id, transaction.status, transaction.status,
+                        rejected_outpoint=deposit.outpoint, rejected_amount=deposit.amount
+                    )
+                outcomes.append((rejected or transaction, deposit, violation))
+                continue
+            transaction = await async_storage.transition(
+                transaction.id, transaction.status, TransactionStatus.FUNDED,
+                amount=deposit.amount, funded_at=datetime.now(), funding_outpoint=deposit.outpoint
+            )
+            if transaction is None:
+                logger.warning("Deposit %s matched a transaction that changed meanwhile", deposit.txid)
+                continue
+            outcomes.append((transaction, deposit, None))
+        return outcomes
+
+    @staticmethod
+    def violation(transaction, deposit):
+        """None if the deposit may fund the deal, else why it is refused."""
+        if transaction.status == TransactionStatus.CREATED:
+            return 'not_ready'
+        if transaction.status not in AWAITING_FUNDS:
+            return 'already_funded' if transaction.is_active() else 'closed'
+        return fee_schedule.violation(transaction.currency, deposit.amount)
+
+    async def match(self, currency, deposit, owners):
+        """The deal owning the receiving address, whatever its status, else the oldest unfunded one whose buyer sent it."""
+        if deposit.address != ESCROW_WALLETS[currency]:
+            return owners.get(deposit.address)
+        candidates = []
+        for sender in deposit.senders:
+            candidates.extend(
+                t for t in await async_storage.get_transactions_by_address(sender)
+                if t.currency == currency and t.buyer_address == sender and t.status in AWAITING_FUNDS
+            )
+        return min(candidates, key=lambda t: t.created_at, default=None)
+
+    async def poll(self):
+        """Poll every currency concurrently and return (transaction, deposit, violation) triples."""
+        results = await asyncio.gather(
+            *(self.poll_currency(currency) for currency in self.backends),
+            return_exceptions=True
+        )
+        outcomes = []
+        for currency, result in zip(self.backends, results):
+            if isinstance(result, Exception):
+                logger.error("Deposit poll for %s failed: %s", currency, result)
+            else:
+                outcomes.extend(result)
+        return outcomes
+
+    async def close(self):
+        for backend in self.backends.values():
+            await backend.close()
+
+deposit_watcher = DepositWatcher({
+    currency: create_chain_backend(currency) for currency in SUPPORTED_CURRENCIES
+})
+
+# Why a refused deposit did not fund its deal, as shown in the chat
+REJECTION_REASONS = {
+    'above_maximum': "it is above the {maximum} {currency} limit",
+    'below_fee': "it does not cover the network and service fees",
+    'not_ready': "the buyer and seller addresses were not set yet",
+    'already_funded': "the deal was already funded",
+    'closed': "the deal was already closed",
+}
+
+def deposit_text(transaction, deposit, violation):
+    """Chat announcement of a deposit that funded, or was refused by, a deal."""
+    amount = f"{format_units(deposit.amount)} {transaction.currency}"
+    if violation is None:
+        return (
+            f"💰 Deposit Confirmed!\n\n"
+            f"🔖 ID: `{transaction.id}`\n"
+            f"Amount: {amount}\n"
+            f"TX: `{deposit.txid}`\n\n"
+            "Release with /pay_seller or cancel with /refund_buyer"
+        )
+    reason = REJECTION_REASONS[violation].format(
+        maximum=format_units(fee_schedule.rules[transaction.currency].maximum), currency=transaction.currency
+    )
+    return (
+        f"⚠️ Deposit Not Accepted\n\n"
+        f"🔖 ID: `{transaction.id}`\n"
+        f"Amount: {amount}\n"
+        f"TX: `{deposit.txid}`\n\n"
+        f"The deal was not funded because {reason}. "
+        "The payment is recorded and will be refunded by an administrator; use /contact to follow up."
+    )
+
+async def deposit_job(context: CallbackContext):
+    """Job queue entry point for deposit confirmation polling"""
+    for transaction, deposit, violation in await deposit_watcher.poll():
+        if violation is None:
+            logger.info("Transaction %s funded by %s", transaction.id, deposit.txid, extra={"transaction_id": transaction.id})
+        try:
+            await context.bot.send_message(
+                chat_id=transaction.chat_id or transaction.user_id,
+                text=deposit_text(transaction, deposit, violation),
+                parse_mode=ParseMode.MARKDOWN
+            )
+        except Exception as e:
+            logger.warning("Could not announce deposit to %s: %s", transaction.id, e)
@@ -0,0 +1,162 @@
+import argparse
+import base64
+import binascii
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from models import TransactionStatus
+from config import SUPPORTED_CURRENCIES, EXPORT_PAGE_SIZE
+
+# Admin exports of transactions, reviews and reports, shared by the /admin
+# routes and the command line. Rows are read one keyset page at a time and
+# written out as each page arrives, so an export of any size holds a single
+# page in memory.
+
+KINDS = ('transactions', 'reviews', 'reports')
+FIELDS = {
+    'transactions': (
+        'id', 'user_id', 'currency', 'status', 'created_at', 'buyer_id', 'seller_id',
+        'buyer_address', 'seller_address', 'amount', 'funded_at', 'chat_id',
+        'deposit_address', 'deposit_index', 'funding_outpoint', 'rejected_outpoint', 'rejected_amount',
+        'finished_at'
+    ),
+    'reviews': ('id', 'transaction_id', 'user_id', 'subject_id', 'rating', 'message', 'created_at'),
+    'reports': ('id', 'user_id', 'subject_id', 'resolved', 'message', 'created_at'),
+}
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# ======================== ROWS ========================
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, TransactionStatus):
+        return value.value
+    return value
+
+def transaction_row(transaction):
+    """Export fields of a transaction; amount stays in base units."""
+    return {field: _value(getattr(transaction, field)) for field in FIELDS['transactions']}
+
+def event_row(kind, event_id, event):
+    """Export fields of a review or report and its storage id."""
+    return {'id': event_id, **{field: _value(getattr(event, field)) for field in FIELDS[kind][1:]}}
+
+# ======================== PAGING ========================
+
+def parse_time(value):
+    """Naive local time from ISO 8601, as storage keeps it; offsets are converted, not dropped."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def encode_cursor(key):
+    """Opaque cursor for the (created_at, id) key of the last row of a page."""
+    return base64.urlsafe_b64encode(json.dumps([key[0].isoformat(), key[1]]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return parse_time(created_at), row_id
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def parse_filters(kind, status=None, currency=None, created_from=None, created_to=None):
+    """Storage filters from request or command line strings; raises ValueError on bad input."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown export: {kind}")
+    filters = {}
+    if status or currency:
+        if kind != 'transactions':
+            raise ValueError("status and currency only filter transactions")
+        if status:
+            filters['status'] = TransactionStatus(status.lower())
+        if currency:
+            if currency.upper() not in SUPPORTED_CURRENCIES:
+                raise ValueError(f"Unsupported currency: {currency}")
+            filters['currency'] = currency.upper()
+    if created_from:
+        filters['created_from'] = parse_time(created_from)
+    if created_to:
+        filters['created_to'] = parse_time(created_to)
+    return filters
+
+def fetch_page(storage, kind, filters, after=None, limit=EXPORT_PAGE_SIZE):
+    """(rows, key of the last row or None once there are no more) of one page."""
+    if kind == 'transactions':
+        transactions = storage.page_transactions(after, limit, **filters)
+        rows = [transaction_row(t) for t in transactions]
+        last = (transactions[-1].created_at, transactions[-1].id) if transactions else None
+    else:
+        events = getattr(storage, f'page_{kind}')(after, limit, **filters)
+        rows = [event_row(kind, event_id, event) for event_id, event in events]
+        last = (events[-1][1].created_at, events[-1][0]) if events else None
+    return rows, (last if len(rows) == limit else None)
+
+def iter_pages(storage, kind, filters, after=None, page_size=EXPORT_PAGE_SIZE):
+    """Every matching row after the key, a page at a time."""
+    while True:
+        rows, after = fetch_page(storage, kind, filters, after, page_size)
+        if rows:
+            yield rows
+        if after is None:
+            return
+
+# ======================== FORMATS ========================
+
+def render(kind, pages, fmt):
+    """Chunks of NDJSON or CSV text, one per page."""
+    if fmt == 'ndjson':
+        for rows in pages:
+            yield ''.join(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n' for row in rows)
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS[kind])
+    writer.writeheader()
+    for rows in pages:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # Header of an empty export
+
+# ======================== COMMAND LINE ========================
+
+def main():
+    """Write an export to stdout or a file.
+
+    Storage is opened as configured, so with the memory backend this reads
+    the journal and archive on disk rather than a running bot's state.
+    """
+    parser = argparse.ArgumentParser(description="Export transactions, reviews or reports")
+    parser.add_argument('kind', choices=KINDS)
+    parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+    parser.add_argument('--status', help="Transaction status, e.g. funded")
+    parser.add_argument('--currency', help="Transaction currency, e.g. BTC")
+    parser.add_argument('--from', dest='created_from', metavar='TIME', help="Created at or after (ISO 8601)")
+    parser.add_argument('--to', dest='created_to', metavar='TIME', help="Created before (ISO 8601)")
+    parser.add_argument('--cursor', help="Resume after the row this cursor points to")
+    parser.add_argument('--page-size', type=int, default=EXPORT_PAGE_SIZE)
+    parser.add_argument('--output', '-o', help="File to write (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        filters = parse_filters(args.kind, args.status, args.currency, args.created_from, args.created_to)
+        after = decode_cursor(args.cursor) if args.cursor else None
+    except ValueError as e:
+        parser.error(str(e))
+    from storage import storage
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for chunk in render(args.kind, iter_pages(storage, args.kind, filters, after, args.page_size), args.format):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,20 @@
-from telegram import Update, InputFile, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update
 from telegram.constants import ParseMode
-from telegram.ext import CallbackContext, CallbackQueryHandler
-from models import Transaction, Review, Report, TransactionStatus
-from storage import storage
+from telegram.ext import CallbackContext
+from models import Review, Report, TransactionStatus, TRANSACTION_ID_PATTERN
+from storage import async_storage
 from datetime import datetime
 from crypto_mock import CryptoMock
-from config import SUPPORTED_CURRENCIES, ESCROW_WALLETS
+from config import ESCROW_WALLETS, WELCOME_ANIMATION
+from asset_cache import asset_cache
+from member_cache import member_cache
+from deposit_addresses import assign_deposit_address, deposit_address_of
+from reputation import RATING_RANGE, average, recent, is_risky
+from messages import catalog_for, format_minute
+from money import fee_schedule, format_units
+import logging_setup
 import logging
-import os
-import aiofiles
 import uuid
-import mimetypes
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -19,43 +23,31 @@ logger = logging.getLogger(__name__)
 
 async def start(update: Update, context: CallbackContext):
     """Send welcome message with animation."""
+    messages = catalog_for(update)
     try:
         logger.info("Start command received from user %s", update.effective_user.id)
-        await send_welcome_message(update.effective_chat.id, context)
+        await send_welcome_message(update.effective_chat.id, context, messages)
     except Exception as e:
         logger.error("Error in start command: %s", str(e), exc_info=True)
         if update.message:
-            await update.message.reply_text("⚠️ Failed to load welcome message. Please try again.")
+            await update.message.reply_text(messages.text('welcome_failed'))
 
-async def send_welcome_message(chat_id: int, context: CallbackContext):
+async def send_welcome_message(chat_id: int, context: CallbackContext, messages=None):
     """Helper function to send welcome message."""
+    messages = messages or catalog_for()
     try:
-        welcome_message = (
-            "👋 Welcome to GengarEscrow Bot! 👻💼\n\n"
-            "Secure BTC/LTC escrow service with:\n"
-            "• Instant transaction setup\n"
-            "• Multi-signature wallets\n"
-            "• Automated dispute resolution\n\n"
-            "📌 Get started with /transaction"
-        )
+        welcome_message = messages.text('welcome')
+        reply_markup = messages.keyboard('welcome')
 
-        keyboard = [
-            [InlineKeyboardButton("📚 How It Works", callback_data='show_escrow_info'),
-             InlineKeyboardButton("💼 Start Transaction", callback_data='start_transaction')],
-            [InlineKeyboardButton("📝 Terms of Service", callback_data='show_terms')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        gif_path = os.path.join('attached_assets', 'gengar.gif.mp4')
-        if os.path.exists(gif_path):
-            async with aiofiles.open(gif_path, 'rb') as gif:
-                await context.bot.send_animation(
-                    chat_id=chat_id,
-                    animation=InputFile(await gif.read()),
-                    caption=welcome_message,
-                    reply_markup=reply_markup
-                )
-        else:
+        message = await asset_cache.send(
+            WELCOME_ANIMATION,
+            context.bot.send_animation,
+            'animation',
+            chat_id=chat_id,
+            caption=welcome_message,
+            reply_markup=reply_markup
+        )
+        if message is None:
             await context.bot.send_message(
                 chat_id=chat_id,
                 text=welcome_message,
@@ -66,145 +58,165 @@ async def send_welcome_message(chat_id: int, context: CallbackContext):
         logger.error("Error in send_welcome_message: %s", str(e))
         await context.bot.send_message(
             chat_id=chat_id,
-            text="Welcome to Gengar Escrow Service!"
+            text=messages.text('welcome_fallback')
         )
 
 # ======================== TRANSACTION FLOW ========================
 
 async def transaction(update: Update, context: CallbackContext):
-    """Initiate or view transaction"""
+    """Initiate a transaction, listing the user's active ones first"""
     if await group_required(update):
         return
 
+    messages = catalog_for(update)
     user_id = update.effective_user.id
-    existing = storage.get_user_transaction(user_id)
-
-    if existing:
-        status_message = (
-            f"📦 Active Transaction:\n"
-            f"ID: {existing.id}\n"
-            f"Currency: {existing.currency}\n"
-            f"Status: {existing.status.value.capitalize()}\n"
-            f"Created: {existing.created_at.strftime('%Y-%m-%d %H:%M')}"
-        )
-        await update.message.reply_text(status_message)
-        return
+    active = await async_storage.get_user_transactions(user_id)
 
-# Directly trigger button-based selection
-await select_currency(update, context)
+    if active:
+        lines = [
+            messages.render(
+                'active_transaction_line', id=t.id, currency=t.currency,
+                status=messages.status(t.status), created=format_minute(t.created_at)
+            )
+            for t in active
+        ]
+        await update.message.reply_text(messages.render('active_transactions', lines="\n".join(lines)))
+
+    # Directly trigger button-based selection
+    await select_currency(update, context)
 
 async def select_currency(update: Update, context: CallbackContext):
     """Handle currency selection via buttons"""
-    keyboard = [
-        [InlineKeyboardButton("BTC", callback_data='currency_btc'),
-         InlineKeyboardButton("LTC", callback_data='currency_ltc')]
-    ]
-   async def select_currency(update: Update, context: CallbackContext):
-    """Handle currency selection via buttons"""
-    keyboard = [
-        [InlineKeyboardButton("BTC", callback_data='currency_btc'),  # Fixed callback_data
-         InlineKeyboardButton("LTC", callback_data='currency_ltc')]
-    ]
+    messages = catalog_for(update)
     await update.message.reply_text(
-        "Select cryptocurrency:",
-        reply_markup=InlineKeyboardMarkup(keyboard)  # Added closing )
+        messages.text('select_currency'),
+        reply_markup=messages.keyboard('currency')
     )
 
 async def set_buyer(update: Update, context: CallbackContext):
     """Set buyer address"""
+    messages = catalog_for(update)
     if not context.args:
-        await update.message.reply_text("Usage: /set_buyer [address]")
+        await update.message.reply_text(messages.text('usage_set_buyer'))
         return
 
     address = context.args[0]
     user_id = update.effective_user.id
-    transaction = storage.get_user_transaction(user_id)
+    transaction = await find_transaction(update, context, arg_index=1, join=True)
 
     if not transaction:
-        await update.message.reply_text("❌ No active transaction. Start with /transaction")
+        await update.message.reply_text(messages.text('no_active_start'))
         return
+    expected = transaction.status
+    logging_setup.bind(transaction_id=transaction.id)
 
     if transaction.buyer_address:
-        await update.message.reply_text("⚠️ Buyer address already set. Use /restart to reset.")
+        await update.message.reply_text(messages.text('buyer_already_set'))
         return
 
     if not CryptoMock.verify_address(transaction.currency, address):
-        await update.message.reply_text("❌ Invalid address format for selected currency")
+        await update.message.reply_text(messages.text('invalid_address'))
         return
 
-    transaction.buyer_address = address
-    transaction.status = TransactionStatus.BUYER_SET
-    await update.message.reply_text(f"✅ Buyer address set:\n`{address}`", parse_mode=ParseMode.MARKDOWN)
+    changes = {'buyer_address': address}
+    if user_id != transaction.user_id:
+        # A counterparty joining by transaction id takes this role
+        changes['buyer_id'] = user_id
+    if not await async_storage.transition(transaction.id, expected, TransactionStatus.BUYER_SET, **changes):
+        await update.message.reply_text(messages.text('transaction_locked'))
+        return
+    await update.message.reply_text(messages.render('buyer_set', address=address), parse_mode=ParseMode.MARKDOWN)
+    if 'buyer_id' in changes:
+        await warn_if_risky(update, messages, (transaction.user_id, user_id))
 
 async def set_seller(update: Update, context: CallbackContext):
     """Set seller address"""
+    messages = catalog_for(update)
     if not context.args:
-        await update.message.reply_text("Usage: /set_seller [address]")
+        await update.message.reply_text(messages.text('usage_set_seller'))
         return
 
     address = context.args[0]
     user_id = update.effective_user.id
-    transaction = storage.get_user_transaction(user_id)
+    transaction = await find_transaction(update, context, arg_index=1, join=True)
 
     if not transaction:
-        await update.message.reply_text("❌ No active transaction. Start with /transaction")
+        await update.message.reply_text(messages.text('no_active_start'))
         return
+    expected = transaction.status
+    logging_setup.bind(transaction_id=transaction.id)
 
     if transaction.seller_address:
-        await update.message.reply_text("⚠️ Seller address already set. Use /restart to reset.")
+        await update.message.reply_text(messages.text('seller_already_set'))
         return
 
     if not CryptoMock.verify_address(transaction.currency, address):
-        await update.message.reply_text("❌ Invalid address format for selected currency")
+        await update.message.reply_text(messages.text('invalid_address'))
         return
 
-    transaction.seller_address = address
-    transaction.status = TransactionStatus.SELLER_SET
-    await update.message.reply_text(f"✅ Seller address set:\n`{address}`", parse_mode=ParseMode.MARKDOWN)
+    changes = {'seller_address': address}
+    if user_id != transaction.user_id:
+        # A counterparty joining by transaction id takes this role
+        changes['seller_id'] = user_id
+    if not await async_storage.transition(transaction.id, expected, TransactionStatus.SELLER_SET, **changes):
+        await update.message.reply_text(messages.text('transaction_locked'))
+        return
+    await update.message.reply_text(messages.render('seller_set', address=address), parse_mode=ParseMode.MARKDOWN)
+    if 'seller_id' in changes:
+        await warn_if_risky(update, messages, (transaction.user_id, user_id))
 
 # ======================== TRANSACTION ACTIONS ========================
 
+def settlement(transaction, completed):
+    """Formatted amount, fee and payout of a funded transaction being released or refunded"""
+    amount = transaction.amount or 0
+    fee, payout = fee_schedule.settle(transaction.currency, amount, completed)
+    return {
+        'amount': format_units(amount), 'fee': format_units(fee), 'payout': format_units(payout),
+        'currency': transaction.currency
+    }
+
 async def refund_buyer(update: Update, context: CallbackContext):
     """Process refund to buyer"""
-    user_id = update.effective_user.id
-    transaction = storage.get_user_transaction(user_id)
+    messages = catalog_for(update)
+    transaction = await find_transaction(update, context)
 
     if not transaction:
-        await update.message.reply_text("❌ No active transaction")
+        await update.message.reply_text(messages.text('no_active'))
         return
+    logging_setup.bind(transaction_id=transaction.id)
 
-    if transaction.status != TransactionStatus.FUNDED:
-        await update.message.reply_text("⚠️ Funds not verified for refund")
+    # Compare-and-set: of two racing releases or refunds, only one succeeds
+    if not await async_storage.transition(transaction.id, TransactionStatus.FUNDED, TransactionStatus.REFUNDED):
+        await update.message.reply_text(messages.text('refund_unverified'))
         return
-
-    transaction.status = TransactionStatus.REFUNDED
     await update.message.reply_text(
-        f"💸 Refund Initiated!\n\n"
-        f"Amount: {transaction.amount} {transaction.currency}\n"
-        f"To: `{transaction.buyer_address}`\n"
-        f"TX ID: `{uuid.uuid4()}`",
+        messages.render(
+            'refund_done', **settlement(transaction, completed=False),
+            address=transaction.buyer_address, payout_id=uuid.uuid4()
+        ),
         parse_mode=ParseMode.MARKDOWN
     )
 
 async def pay_seller(update: Update, context: CallbackContext):
     """Complete payment to seller"""
-    user_id = update.effective_user.id
-    transaction = storage.get_user_transaction(user_id)
+    messages = catalog_for(update)
+    transaction = await find_transaction(update, context)
 
     if not transaction:
-        await update.message.reply_text("❌ No active transaction")
+        await update.message.reply_text(messages.text('no_active'))
         return
+    logging_setup.bind(transaction_id=transaction.id)
 
-    if transaction.status != TransactionStatus.FUNDED:
-        await update.message.reply_text("⚠️ Funds not verified for payment")
+    # Compare-and-set: of two racing releases or refunds, only one succeeds
+    if not await async_storage.transition(transaction.id, TransactionStatus.FUNDED, TransactionStatus.COMPLETED):
+        await update.message.reply_text(messages.text('payment_unverified'))
         return
-
-    transaction.status = TransactionStatus.COMPLETED
     await update.message.reply_text(
-        f"💸 Payment Released!\n\n"
-        f"Amount: {transaction.amount} {transaction.currency}\n"
-        f"To: `{transaction.seller_address}`\n"
-        f"TX ID: `{uuid.uuid4()}`",
+        messages.render(
+            'payment_done', **settlement(transaction, completed=True),
+            address=transaction.seller_address, payout_id=uuid.uuid4()
+        ),
         parse_mode=ParseMode.MARKDOWN
     )
 
@@ -212,171 +224,231 @@ async def pay_seller(update: Update, context: CallbackContext):
 
 async def review(update: Update, context: CallbackContext):
     """Handle review submissions"""
+    messages = catalog_for(update)
     if not context.args:
-        await update.message.reply_text("Usage: /review [your feedback]")
+        await update.message.reply_text(messages.text('usage_review'))
         return
 
     user_id = update.effective_user.id
-    transaction = storage.get_user_transaction(user_id)
+    transaction = await async_storage.get_user_transaction(user_id)
     
     if not transaction or transaction.status != TransactionStatus.COMPLETED:
-        await update.message.reply_text("❌ You can only review completed transactions")
+        await update.message.reply_text(messages.text('review_completed_only'))
         return
 
-    review_text = ' '.join(context.args)
+    # An optional leading 1-5 is the rating
+    words = context.args
+    rating = None
+    if words[0].isdigit() and int(words[0]) in RATING_RANGE:
+        rating = int(words[0])
+        words = words[1:]
+    review_text = ' '.join(words) or '⭐' * rating
     new_review = Review(
         transaction_id=transaction.id,
         user_id=user_id,
         message=review_text,
-        created_at=datetime.now()
+        created_at=datetime.now(),
+        rating=rating,
+        subject_id=transaction.counterparty_of(user_id)
     )
-    storage.add_review(new_review)
-    
+    if not await async_storage.add_review(new_review):
+        await update.message.reply_text(messages.text('review_duplicate'))
+        return
+
+    await update.message.reply_text(
+        messages.render('review_thanks', text=review_text),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def reputation(update: Update, context: CallbackContext):
+    """Show a user's reviews and reports: the replied-to user, a given id, or oneself"""
+    messages = catalog_for(update)
+    replied = update.message.reply_to_message
+    if replied and replied.from_user:
+        user_id = replied.from_user.id
+    elif context.args and context.args[0].isdigit():
+        user_id = int(context.args[0])
+    else:
+        user_id = update.effective_user.id
+
+    record = await async_storage.get_reputation(user_id)
+    recent_average, _ = recent(record)
     await update.message.reply_text(
-        "⭐ Thank you for your review!\n\n"
-        f"Your feedback: _{review_text}_",
+        messages.render(
+            'reputation', user_id=user_id, reviews=record.reviews, reports=record.reports,
+            average=format_rating(messages, average(record), record.ratings),
+            recent_average=format_rating(messages, recent_average)
+        ),
         parse_mode=ParseMode.MARKDOWN
     )
 
+async def warn_if_risky(update: Update, messages, user_ids):
+    """Warn the chat about deal parties with a poor recent track record."""
+    for user_id in user_ids:
+        record = await async_storage.get_reputation(user_id)
+        if is_risky(record):
+            recent_average, _ = recent(record)
+            await update.message.reply_text(
+                messages.render(
+                    'counterparty_warning', user_id=user_id, reports=record.reports,
+                    recent_average=format_rating(messages, recent_average)
+                ),
+                parse_mode=ParseMode.MARKDOWN
+            )
+
+def format_rating(messages, value, count=None):
+    if value is None:
+        return messages.text('no_ratings')
+    if count is None:
+        return messages.render('recent_rating_value', value=value)
+    return messages.render('rating_value', value=value, count=count)
+
 # ======================== VERIFICATION & SECURITY ========================
 
 async def verify(update: Update, context: CallbackContext):
     """Verify escrow address"""
+    messages = catalog_for(update)
     if not context.args:
-        await update.message.reply_text("Usage: /verify [address]")
+        await update.message.reply_text(messages.text('usage_verify'))
         return
 
     address = context.args[0]
-    is_valid = any(address == addr for addr in ESCROW_WALLETS.values())
-
-    response = ("✅ Verified Gengar Escrow Address" if is_valid 
-                else "❌ Potential Fraudulent Address!")
+    # Shared wallets, or an address derived for one of this bot's deals
+    is_valid = (
+        any(address == addr for addr in ESCROW_WALLETS.values())
+        or await async_storage.get_transaction_by_deposit_address(address) is not None
+    )
 
     await update.message.reply_text(
-        f"{response}\n\n"
-        f"Scanned: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        f"Address: `{address}`",
+        messages.render(
+            'verify_result',
+            verdict=messages.text('verify_ok' if is_valid else 'verify_fraud'),
+            scanned=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            address=address
+        ),
         parse_mode=ParseMode.MARKDOWN
     )
 
 async def real(update: Update, context: CallbackContext):
     """Verify bot authenticity"""
-    verification_msg = (
-        "🔒 **Official Gengar Escrow Bot** 🔒\n\n"
-        "Authentication Marks:\n"
-        "• Verified Telegram Checkmark\n"
-        "• Consistent Branding\n"
-        "• Secure HTTPS Connections\n\n"
-        "⚠️ Report imposters with /report"
-    )
-    await update.message.reply_text(verification_msg, parse_mode=ParseMode.MARKDOWN)
+    await update.message.reply_text(catalog_for(update).text('real'), parse_mode=ParseMode.MARKDOWN)
 
 async def check(update: Update, context: CallbackContext):
     """Check admin privileges"""
+    messages = catalog_for(update)
     try:
         chat_id = update.effective_chat.id
-        bot_member = await context.bot.get_chat_member(chat_id, context.bot.id)
-
-        if bot_member.status in ['administrator', 'creator']:
-            response = "✅ Has Admin Privileges\nFull functionality enabled"
-        else:
-            response = ("⚠️ Limited Functionality\n"
-                       "Required Permissions:\n"
-                       "- Delete Messages\n"
-                       "- Pin Messages\n"
-                       "- Ban Users")
-
-        await update.message.reply_text(
-            f"🛡️ Bot Permission Status:\n\n{response}",
-            parse_mode=ParseMode.MARKDOWN
-        )
+        bot_member = await member_cache.get(context.bot, chat_id, context.bot.id)
+        key = 'check_admin' if bot_member.status in ['administrator', 'creator'] else 'check_limited'
+        await update.message.reply_text(messages.text(key), parse_mode=ParseMode.MARKDOWN)
     except Exception as e:
         logger.error("Admin check failed: %s", e)
-        await update.message.reply_text("❌ Could not verify permissions")
+        await update.message.reply_text(messages.text('check_failed'))
 
 # ======================== OTHER HANDLERS ========================
 
 async def status(update: Update, context: CallbackContext):
     """Show transaction status"""
-    user_id = update.effective_user.id
-    transaction = storage.get_user_transaction(user_id)
+    messages = catalog_for(update)
+    transaction = await find_transaction(update, context, join=True)
 
     if not transaction:
-        await update.message.reply_text("❌ No active transaction")
+        await update.message.reply_text(messages.text('no_active'))
         return
 
-    deposit_address = ESCROW_WALLETS[transaction.currency]
-    status_message = (
-        f"📊 Transaction Status\n\n"
-        f"🔖 ID: `{transaction.id}`\n"
-        f"🕒 Created: {transaction.created_at.strftime('%Y-%m-%d %H:%M')}\n"
-        f"💰 Currency: {transaction.currency}\n"
-        f"📥 Escrow Address:\n`{deposit_address}`\n"
-        f"📈 Status: {transaction.status.value.capitalize()}\n"
-        f"👤 Buyer: {transaction.buyer_address or 'Not set'}\n"
-        f"👥 Seller: {transaction.seller_address or 'Not set'}"
+    not_set = messages.text('not_set')
+    status_message = messages.render(
+        'status',
+        id=transaction.id,
+        created=format_minute(transaction.created_at),
+        currency=transaction.currency,
+        deposit_address=deposit_address_of(transaction),
+        status=messages.status(transaction.status),
+        buyer=transaction.buyer_address or not_set,
+        seller=transaction.seller_address or not_set
     )
     await update.message.reply_text(status_message, parse_mode=ParseMode.MARKDOWN)
 
 async def how(update: Update, context: CallbackContext):
     """Show usage guide"""
-    guide = (
-        "📘 **Gengar Escrow Guide**\n\n"
-        "1. Start: /transaction\n"
-        "2. Set currency: /select_currency\n"
-        "3. Configure addresses:\n"
-        "   - /set_buyer [address]\n"
-        "   - /set_seller [address]\n"
-        "4. Fund escrow wallet\n"
-        "5. Complete transaction:\n"
-        "   - /pay_seller to release funds\n"
-        "   - /refund_buyer to cancel\n\n"
-        "🔍 Check /status anytime\n"
-        "🔄 Reset with /restart"
-    )
-    await update.message.reply_text(guide, parse_mode=ParseMode.MARKDOWN)
+    await update.message.reply_text(catalog_for(update).text('how'), parse_mode=ParseMode.MARKDOWN)
 
 async def restart(update: Update, context: CallbackContext):
     """Reset transaction"""
+    messages = catalog_for(update)
     user_id = update.effective_user.id
-    storage.reset_transaction(user_id)
-    await update.message.reply_text("♻️ Transaction reset. Start new with /transaction")
+    transaction_id = transaction_id_arg(context.args)
+    if not await async_storage.reset_transaction(user_id, transaction_id):
+        await update.message.reply_text(messages.text('reset_none'))
+        return
+    await update.message.reply_text(messages.text('reset_done'))
 
 async def contact(update: Update, context: CallbackContext):
     """Contact support"""
     message = ' '.join(context.args) if context.args else "No message provided"
-    logger.info(f"Contact message from {update.effective_user.id}: {message}")
-    await update.message.reply_text("📩 Message received. Support will respond within 24h.")
+    logger.info("Contact message from %s: %s", update.effective_user.id, message)
+    await update.message.reply_text(catalog_for(update).text('contact_received'))
 
 async def report(update: Update, context: CallbackContext):
     """Report issue"""
+    messages = catalog_for(update)
     if not context.args:
-        await update.message.reply_text("Usage: /report [description]")
+        await update.message.reply_text(messages.text('usage_report'))
         return
 
+    # Replying to someone's message reports that user, if the two share a
+    # deal; anyone else's report reaches the admins without touching the
+    # subject's reputation
+    reporter_id = update.effective_user.id
+    replied = update.message.reply_to_message
+    subject = replied.from_user if replied else None
+    subject_id = None
+    if subject and not subject.is_bot and subject.id != reporter_id:
+        deals = await async_storage.get_user_transactions(reporter_id, active_only=False)
+        if any(subject.id in t.participants() for t in deals):
+            subject_id = subject.id
     report = Report(
-        user_id=update.effective_user.id,
+        user_id=reporter_id,
         message=' '.join(context.args),
-        created_at=datetime.now()
+        created_at=datetime.now(),
+        subject_id=subject_id
     )
-    storage.add_report(report)
-    await update.message.reply_text("🚨 Report filed. Thank you for your vigilance!")
+    await async_storage.add_report(report)
+    await update.message.reply_text(messages.text('report_filed'))
 
 # ======================== HELPER FUNCTIONS ========================
 
+def transaction_id_arg(args, index=0):
+    """The command argument at index if it is a transaction id, else None."""
+    if args and len(args) > index and TRANSACTION_ID_PATTERN.match(args[index].lower()):
+        return args[index].lower()
+    return None
+
+async def find_transaction(update: Update, context: CallbackContext, arg_index=0, join=False):
+    """Transaction named by id in the command arguments, else the user's current one.
+
+    Participants can always reach a transaction by id; with join=True, so can
+    members of the chat it was created in, which lets a counterparty take part.
+    """
+    user_id = update.effective_user.id
+    transaction_id = transaction_id_arg(context.args, arg_index)
+    if transaction_id is None:
+        return await async_storage.get_user_transaction(user_id)
+    transaction = await async_storage.get_transaction(transaction_id)
+    if transaction is None:
+        return None
+    if user_id in transaction.participants():
+        return transaction
+    if join and transaction.chat_id == update.effective_chat.id:
+        return transaction
+    return None
+
 def is_group_chat(update: Update) -> bool:
     return update.effective_chat.type in ['group', 'supergroup']
 
 async def group_required(update: Update) -> bool:
     if not is_group_chat(update):
-        await update.message.reply_text(
-            "⚠️ Group Chat Required\n\n"
-            "This bot functions best in group chats where:\n"
-            "- Multiple participants can verify transactions\n"
-            "- Transparent communication is maintained\n"
-            "- Disputes can be publicly resolved\n\n"
-            "Create a group and add me as admin!"
-        )
+        await update.message.reply_text(catalog_for(update).text('group_required'))
         return True
     return False
 
@@ -385,67 +457,46 @@ async def group_required(update: Update) -> bool:
 async def button_callback(update: Update, context: CallbackContext):
     """Handle all inline button interactions"""
     query = update.callback_query
+    messages = catalog_for(update)
     await query.answer()
     
     try:
-      if query.data.startswith('currency_'):
-    currency = query.data.split('_')[1].upper()
-    user_id = query.from_user.id
-    transaction = storage.create_transaction(user_id, currency)
-    deposit_address = ESCROW_WALLETS[currency]
-    
-    await query.message.reply_text(
-        f"✅ Transaction Created!\n\n"
-        f"🔐 ID: `{transaction.id}`\n"
-        f"💰 Currency: {currency}\n"
-        f"📥 Deposit Address:\n`{deposit_address}`\n\n"
-        "Next Steps:\n"
-        "1. /set_buyer [crypto_address]\n"
-        "2. /set_seller [crypto_address]\n"
-        "3. Send funds to escrow address",
-        parse_mode=ParseMode.MARKDOWN
-    )
-elif query.data == 'show_escrow_info':
-    escrow_info = (
-        "🛡️ How Escrow Works:\n\n"
-        "1. Buyer/seller agree to terms\n"
-        "2. Funds are locked in escrow\n"
-        "3. Goods/services are exchanged\n"
-        "4. Funds released to seller\n\n"
-        "Full guide: /how"
-    )
-    await query.edit_message_text(escrow_info)
-elif query.data == 'show_terms':
-    context.user_data['original_message'] = query.message
-    await terms(update, context)
-    if query.message:
-        await query.message.delete()
-elif query.data == 'start_transaction':
-    context.user_data['original_message'] = query.message
-    await transaction(update, context)
-    if query.message:
-        await query.message.delete()
+        if query.data.startswith('currency_'):
+            currency = query.data.split('_')[1].upper()
+            user_id = query.from_user.id
+            deposit_index, deposit_address = await assign_deposit_address(currency)
+            transaction = await async_storage.create_transaction(
+                user_id, currency, update.effective_chat.id, deposit_address, deposit_index
+            )
+
+            await query.message.reply_text(
+                messages.render(
+                    'transaction_created', id=transaction.id, currency=currency,
+                    deposit_address=deposit_address_of(transaction)
+                ),
+                parse_mode=ParseMode.MARKDOWN
+            )
+        elif query.data == 'show_escrow_info':
+            await query.edit_message_text(messages.text('escrow_info'))
+        elif query.data == 'show_terms':
+            context.user_data['original_message'] = query.message
+            await terms(update, context)
+            if query.message:
+                await query.message.delete()
+        elif query.data == 'start_transaction':
+            context.user_data['original_message'] = query.message
+            await transaction(update, context)
+            if query.message:
+                await query.message.delete()
+    except Exception as e:
+        logger.error("Button callback failed: %s", e, exc_info=True)
 
 # ======================== SYSTEM COMMANDS ========================
 
 async def terms(update: Update, context: CallbackContext):
     """Show terms of service"""
-    terms_text = (
-        "📜 Terms of Service\n\n"
-        "1. Funds held in escrow until mutual agreement\n"
-        "2. 0.5% service fee on completed transactions\n"
-        "3. Users must verify counterparty identities\n"
-        "4. Disputes resolved via multisig arbitration\n"
-        "5. Full logs available upon request\n\n"
-        "By using this service, you agree to these terms."
-    )
-    await update.message.reply_text(terms_text)
+    await update.message.reply_text(catalog_for(update).text('terms'))
 
 async def balance(update: Update, context: CallbackContext):
     """Check balances (stub implementation)"""
-    await update.message.reply_text(
-        "💰 Balance Summary:\n"
-        "BTC: 0.00000000\n"
-        "LTC: 0.00000000\n\n"
-        "Fund escrow wallet to start transactions!"
-    )
+    await update.message.reply_text(catalog_for(update).text('balance'))
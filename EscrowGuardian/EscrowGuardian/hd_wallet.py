@@ -0,0 +1,156 @@
+import functools
+import hashlib
+import hmac
+from address_validation import extended_key_decode, segwit_encode, BECH32_HRPS
+
+# Watch-only BIP32 public derivation: the bot holds account-level extended
+# public keys (m/84'/coin'/0') and derives native segwit receive addresses,
+# so every deal gets its own address while keys stay in the operator's wallet.
+
+# ======================== SECP256K1 ========================
+
+P = 2 ** 256 - 2 ** 32 - 977
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G = (
+    0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+    0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8,
+)
+
+# Points are kept in Jacobian coordinates (X, Y, Z) between additions, so the
+# only modular inversion per derived key is the final conversion to affine.
+INFINITY = (0, 1, 0)
+
+def _double(point):
+    x, y, z = point
+    if not y or not z:
+        return INFINITY
+    yy = y * y % P
+    s = 4 * x * yy % P
+    m = 3 * x * x % P
+    nx = (m * m - 2 * s) % P
+    return nx, (m * (s - nx) - 8 * yy * yy) % P, 2 * y * z % P
+
+def _add_affine(point, affine):
+    """point + affine, where affine is (x, y) with an implicit Z of 1."""
+    x1, y1, z1 = point
+    if not z1:
+        return affine[0], affine[1], 1
+    zz = z1 * z1 % P
+    u2 = affine[0] * zz % P
+    s2 = affine[1] * zz * z1 % P
+    h = (u2 - x1) % P
+    r = (s2 - y1) % P
+    if not h:
+        return _double(point) if not r else INFINITY
+    hh = h * h % P
+    hhh = h * hh % P
+    v = x1 * hh % P
+    nx = (r * r - hhh - 2 * v) % P
+    return nx, (r * (v - nx) - y1 * hhh) % P, z1 * h % P
+
+def _to_affine(point):
+    x, y, z = point
+    if not z:
+        return None
+    inverse = pow(z, -1, P)
+    inverse_squared = inverse * inverse % P
+    return x * inverse_squared % P, y * inverse_squared * inverse % P
+
+@functools.lru_cache(maxsize=1)
+def _generator_table():
+    """2^i * G for every bit of a scalar, in affine form."""
+    table = []
+    point = G + (1,)
+    for _ in range(256):
+        table.append(_to_affine(point))
+        point = _double(point)
+    return table
+
+def _multiply_generator(scalar):
+    point = INFINITY
+    for bit, affine in enumerate(_generator_table()):
+        if scalar >> bit & 1:
+            point = _add_affine(point, affine)
+    return point
+
+def _compress(affine):
+    return bytes([2 + (affine[1] & 1)]) + affine[0].to_bytes(32, 'big')
+
+def _decompress(data):
+    if len(data) != 33 or data[0] not in (2, 3):
+        raise ValueError("Not a compressed public key")
+    x = int.from_bytes(data[1:], 'big')
+    if x >= P:
+        raise ValueError("Public key is not on the curve")
+    y = pow((x * x * x + 7) % P, (P + 1) // 4, P)
+    if (y * y - x * x * x - 7) % P:
+        raise ValueError("Public key is not on the curve")
+    if y & 1 != data[0] & 1:
+        y = P - y
+    return x, y
+
+# ======================== BIP32 ========================
+
+class ExtendedPublicKey:
+    """A public key with its chain code, able to derive non-hardened children."""
+
+    __slots__ = ('point', 'chain_code', 'key')
+
+    def __init__(self, point, chain_code):
+        self.point = point
+        self.chain_code = chain_code
+        self.key = _compress(point)
+
+    @classmethod
+    def parse(cls, text):
+        """Parse an xpub/ypub/zpub (or litecoin equivalent); private keys are refused."""
+        payload = extended_key_decode(text.strip())
+        if payload is None:
+            raise ValueError("Malformed extended public key")
+        key = payload[45:]
+        if key[0] == 0:
+            raise ValueError("Extended private key given; configure the public key instead")
+        return cls(_decompress(key), payload[13:45])
+
+    def child(self, index):
+        """CKDpub; None for the (astronomically rare) indexes BIP32 declares invalid."""
+        if index >= 2 ** 31:
+            raise ValueError("Hardened children cannot be derived from a public key")
+        digest = hmac.new(self.chain_code, self.key + index.to_bytes(4, 'big'), hashlib.sha512).digest()
+        tweak = int.from_bytes(digest[:32], 'big')
+        if tweak >= N:
+            return None
+        point = _to_affine(_add_affine(_multiply_generator(tweak), self.point))
+        if point is None:
+            return None
+        return ExtendedPublicKey(point, digest[32:])
+
+def p2wpkh_address(currency, key):
+    """Native segwit address paying to a compressed public key."""
+    key_hash = hashlib.new('ripemd160', hashlib.sha256(key).digest()).digest()
+    return segwit_encode(BECH32_HRPS[currency], 0, key_hash)
+
+# ======================== DERIVER ========================
+
+class AddressDeriver:
+    """Receive addresses (external chain, m/.../0/i) of one account key."""
+
+    def __init__(self, currency, extended_key):
+        self.currency = currency
+        receive = ExtendedPublicKey.parse(extended_key).child(0)
+        if receive is None:
+            raise ValueError("Account key has no usable receive chain")
+        self._receive = receive
+
+    def address(self, index):
+        child = self._receive.child(index)
+        return p2wpkh_address(self.currency, child.key) if child else None
+
+    def addresses(self, start, count):
+        """(index, address) pairs for indexes start..start+count-1, skipping invalid ones."""
+        pairs = []
+        for index in range(start, start + count):
+            address = self.address(index)
+            if address:
+                pairs.append((index, address))
+        return pairs
@@ -0,0 +1,426 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from models import Transaction, Review, Report, TransactionStatus, FINAL_STATUSES
+from money import to_units
+from config import JOURNAL_FSYNC_INTERVAL, JOURNAL_SNAPSHOT_EVERY, JOURNAL_KEEP_SEGMENTS
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{8})\.log$')
+SNAPSHOT_PATTERN = re.compile(r'^snapshot-(\d{8})\.jsonl$')
+
+# ======================== RECORDS ========================
+
+def _to_timestamp(value):
+    return value.timestamp() if value is not None else None
+
+def _from_timestamp(value):
+    return datetime.fromtimestamp(value) if value is not None else None
+
+def transaction_record(transaction):
+    return {
+        'id': transaction.id,
+        'user_id': transaction.user_id,
+        'currency': transaction.currency,
+        'status': transaction.status.value,
+        'created_at': _to_timestamp(transaction.created_at),
+        'buyer_id': transaction.buyer_id,
+        'seller_id': transaction.seller_id,
+        'buyer_address': transaction.buyer_address,
+        'seller_address': transaction.seller_address,
+        'amount': transaction.amount,
+        'funded_at': _to_timestamp(transaction.funded_at),
+        'chat_id': transaction.chat_id,
+        'deposit_address': transaction.deposit_address,
+        'deposit_index': transaction.deposit_index,
+        'funding_outpoint': transaction.funding_outpoint,
+        'rejected_outpoint': transaction.rejected_outpoint,
+        'rejected_amount': transaction.rejected_amount,
+        'finished_at': _to_timestamp(transaction.finished_at),
+    }
+
+def record_transaction(record):
+    amount = record['amount']
+    return Transaction(**{
+        **record,
+        'status': TransactionStatus(record['status']),
+        'created_at': _from_timestamp(record['created_at']),
+        'funded_at': _from_timestamp(record['funded_at']),
+        # Absent from records written before finish times were kept
+        'finished_at': _from_timestamp(record.get('finished_at')),
+        # Records from before integer amounts hold float coins
+        'amount': to_units(amount) if isinstance(amount, float) else amount,
+    })
+
+def review_record(review):
+    return {
+        'transaction_id': review.transaction_id,
+        'user_id': review.user_id,
+        'message': review.message,
+        'created_at': _to_timestamp(review.created_at),
+        'rating': review.rating,
+        'subject_id': review.subject_id,
+    }
+
+def record_review(record):
+    return Review(**{**record, 'created_at': _from_timestamp(record['created_at'])})
+
+def report_record(report):
+    return {
+        'user_id': report.user_id,
+        'message': report.message,
+        'created_at': _to_timestamp(report.created_at),
+        'resolved': report.resolved,
+        'subject_id': report.subject_id,
+    }
+
+def record_report(record):
+    return Report(**{**record, 'created_at': _from_timestamp(record['created_at'])})
+
+# ======================== JOURNAL ========================
+
+class Journal:
+    """Append-only log of transaction changes, split into segments.
+
+    Appends go to the OS buffer immediately and a background thread fsyncs
+    them in batches, so a crash loses at most JOURNAL_FSYNC_INTERVAL seconds
+    of events. Every JOURNAL_SNAPSHOT_EVERY events, counting those replayed
+    at startup, a new segment is started and a snapshot of the state at that
+    boundary is written; replay loads the newest snapshot and only the
+    segments after it.
+    """
+
+    def __init__(self, directory, fsync_interval=JOURNAL_FSYNC_INTERVAL,
+                 snapshot_every=JOURNAL_SNAPSHOT_EVERY, keep_segments=JOURNAL_KEEP_SEGMENTS):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.keep_segments = keep_segments
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._stopping = False
+        self._dirty = False
+        self._pending_snapshot = None
+        self._events = 0
+        segments = self._list(SEGMENT_PATTERN)
+        # Each process starts a fresh segment, so a torn tail is never appended to
+        self._segment = (segments[-1] + 1) if segments else 1
+        self._file = self._open_segment(self._segment)
+        self._flusher = threading.Thread(target=self._run, name='journal-flusher', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _path(self, kind, number):
+        suffix = 'log' if kind == 'segment' else 'jsonl'
+        return os.path.join(self.directory, f"{kind}-{number:08d}.{suffix}")
+
+    def _list(self, pattern):
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = pattern.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _open_segment(self, number):
+        return open(self._path('segment', number), 'a', encoding='utf-8')
+
+    def _sync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # -------- writing --------
+
+    def append(self, event_type, record, previous_status=None):
+        """Record a 'put' (full transaction record), 'delete', 'archive', 'review' or 'report' event."""
+        line = json.dumps({
+            'ts': time.time(),
+            'type': event_type,
+            'from': previous_status,
+            'tx': record,
+        }, separators=(',', ':'))
+        with self._lock:
+            if self._closed:
+                return
+            self._file.write(line + '\n')
+            self._dirty = True
+            self._events += 1
+            return self._events >= self.snapshot_every
+
+    @property
+    def events(self):
+        """Events appended or replayed since the last snapshot."""
+        return self._events
+
+    def rotate(self, source=None):
+        """Start a new segment and snapshot the state source() returns at its boundary.
+
+        source returns (transactions, reviews, reports); it is called and its
+        result serialized on the flusher thread, so the caller never walks the
+        whole state. Events appended meanwhile land in the new segment and are
+        replayed over the snapshot, so state it captures from after the
+        boundary is overwritten consistently. Without a source the journal is
+        an audit trail that is never replayed, and no snapshot is written.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._segment += 1
+            self._file = self._open_segment(self._segment)
+            self._dirty = False
+            self._events = 0
+            self._pending_snapshot = (self._segment, source)
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.fsync_interval)
+            self._wake.clear()
+            try:
+                self._flush()
+            except Exception:
+                logger.exception("Journal flush failed")
+
+    def _flush(self):
+        self.sync()
+        with self._lock:
+            snapshot, self._pending_snapshot = self._pending_snapshot, None
+        if snapshot is not None:
+            segment, source = snapshot
+            if source is not None:
+                self._write_snapshot(segment, *source())
+            self._prune(segment)
+
+    def sync(self):
+        with self._lock:
+            if self._dirty and not self._closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._dirty = False
+
+    def _write_snapshot(self, segment, transactions, reviews, reports):
+        path = self._path('snapshot', segment)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'segment': segment, 'count': len(transactions), 'reviews': len(reviews), 'reports': len(reports),
+            }) + '\n')
+            # Transactions, then reviews, then reports, as many of each as the header says
+            for records in (
+                map(transaction_record, transactions), map(review_record, reviews), map(report_record, reports)
+            ):
+                for record in records:
+                    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        self._sync_directory()
+        logger.info(
+            "Journal snapshot written: %d transactions, %d reviews, %d reports at segment %d",
+            len(transactions), len(reviews), len(reports), segment
+        )
+
+    def _prune(self, segment):
+        """Remove snapshots, and unless kept as an audit trail segments, older than segment."""
+        for number in self._list(SNAPSHOT_PATTERN):
+            if number < segment:
+                os.remove(self._path('snapshot', number))
+        if not self.keep_segments:
+            for number in self._list(SEGMENT_PATTERN):
+                if number < segment:
+                    os.remove(self._path('segment', number))
+
+    def close(self):
+        """Flush outstanding events and stop the flusher thread."""
+        if self._stopping:
+            return
+        self._stopping = True
+        self._wake.set()
+        self._flusher.join(timeout=10)
+        self._flush()
+        with self._lock:
+            self._closed = True
+            self._file.close()
+
+    # -------- reading --------
+
+    def _read_snapshot(self, segment):
+        """(transaction, review, report) records of a snapshot; older ones hold transactions only."""
+        with open(self._path('snapshot', segment), encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            records = [json.loads(line) for line in f]
+        counts = (header['count'], header.get('reviews', 0), header.get('reports', 0))
+        if len(records) != sum(counts):
+            raise ValueError(f"snapshot {segment} is incomplete")
+        reviews_at = counts[0]
+        reports_at = reviews_at + counts[1]
+        return records[:reviews_at], records[reviews_at:reports_at], records[reports_at:]
+
+    def replay(self):
+        """Rebuild (transactions, reviews, reports) from the newest snapshot and the segments after it."""
+        state = {}
+        reviews, reports = [], []
+        start = 1
+        for segment in reversed(self._list(SNAPSHOT_PATTERN)):
+            try:
+                records, reviews, reports = self._read_snapshot(segment)
+            except (OSError, ValueError) as e:
+                logger.warning("Skipping unreadable journal snapshot %d: %s", segment, e)
+                continue
+            state = {record['id']: record for record in records}
+            start = segment
+            break
+
+        replayed = 0
+        for segment in self._list(SEGMENT_PATTERN):
+            if segment < start or segment == self._segment:
+                continue
+            with open(self._path('segment', segment), encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # A torn final write from a crash; nothing after it was acknowledged
+                        logger.warning("Truncated event at end of journal segment %d", segment)
+                        break
+                    record = event['tx']
+                    if event['type'] in ('delete', 'archive'):
+                        state.pop(record['id'], None)
+                    elif event['type'] == 'review':
+                        reviews.append(record)
+                    elif event['type'] == 'report':
+                        reports.append(record)
+                    else:
+                        state[record['id']] = record
+                    replayed += 1
+        logger.info(
+            "Journal replay: %d transactions, %d reviews, %d reports, %d events after snapshot %d",
+            len(state), len(reviews), len(reports), replayed, start
+        )
+        with self._lock:
+            self._events += replayed
+        return (
+            [record_transaction(record) for record in state.values()],
+            [record_review(record) for record in reviews],
+            [record_report(record) for record in reports],
+        )
+
+# ======================== STORAGE WRAPPER ========================
+
+class JournaledStorage:
+    """Journals every transaction change, review and report made through the wrapped storage.
+
+    With snapshots=False (durable backends, whose journal is an audit trail
+    and never replayed) segments still rotate, but the whole state is never
+    read back to snapshot it.
+    """
+
+    def __init__(self, backend, journal, known=(), snapshots=True):
+        self._backend = backend
+        self._journal = journal
+        self._snapshots = snapshots
+        # Last journaled status per active transaction, since handlers mutate
+        # in place; finished ones leave it, so it is bounded by the open deals
+        self._statuses = {t.id: t.status.value for t in known if t.is_active()}
+        if journal.events:
+            # Snapshot what was replayed, so a process that restarts often
+            # never replays an ever longer tail
+            self._rotate()
+
+    def _rotate(self):
+        if not self._snapshots:
+            self._journal.rotate()
+            return
+        backend = self._backend
+        # Reviews and reports are appended on replay rather than overwritten,
+        # so the snapshot stops at those journaled before the boundary
+        reviews, reports = len(backend.reviews), len(backend.reports)
+        # Runs on the journal's flusher thread: the in-memory backend copies
+        # each collection in one C call under the GIL
+        self._journal.rotate(lambda: (
+            backend.all_transactions(), backend.all_reviews(reviews), backend.all_reports(reports)
+        ))
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+    def _put(self, transaction):
+        if transaction.status in FINAL_STATUSES:
+            previous = self._statuses.pop(transaction.id, None)
+        else:
+            previous = self._statuses.get(transaction.id)
+            self._statuses[transaction.id] = transaction.status.value
+        if self._journal.append('put', transaction_record(transaction), previous):
+            self._rotate()
+
+    def create_transaction(self, user_id, currency, chat_id=None, deposit_address=None, deposit_index=None):
+        transaction = self._backend.create_transaction(user_id, currency, chat_id, deposit_address, deposit_index)
+        self._put(transaction)
+        return transaction
+
+    def save_transaction(self, transaction):
+        """Persist changes made to a transaction returned by this storage."""
+        self._backend.save_transaction(transaction)
+        self._put(transaction)
+
+    def save_transactions(self, transactions):
+        self._backend.save_transactions(transactions)
+        for transaction in transactions:
+            self._put(transaction)
+
+    def add_review(self, review):
+        added = self._backend.add_review(review)
+        if added and self._journal.append('review', review_record(review)):
+            self._rotate()
+        return added
+
+    def add_report(self, report):
+        self._backend.add_report(report)
+        if self._journal.append('report', report_record(report)):
+            self._rotate()
+
+    def transition(self, transaction_id, expected, new, **changes):
+        transaction = self._backend.transition(transaction_id, expected, new, **changes)
+        if transaction is not None:
+            self._put(transaction)
+        return transaction
+
+    def transition_many(self, moves):
+        transactions = self._backend.transition_many(moves)
+        for transaction in transactions:
+            self._put(transaction)
+        return transactions
+
+    def mark_as_funded(self, user_id):
+        transaction = self._backend.get_user_transaction(user_id)
+        if transaction:
+            self.transition(transaction.id, transaction.status, TransactionStatus.FUNDED)
+
+    def archive_finished(self, finished_before, limit):
+        transactions = self._backend.archive_finished(finished_before, limit)
+        for transaction in transactions:
+            # Archived rows leave the replayed state; the archive holds them
+            self._statuses.pop(transaction.id, None)
+            if self._journal.append('archive', {'id': transaction.id}, transaction.status.value):
+                self._rotate()
+        return transactions
+
+    def reset_transaction(self, user_id, transaction_id=None):
+        transaction = self._backend.reset_transaction(user_id, transaction_id)
+        if transaction:
+            self._put(transaction)
+        return transaction
@@ -0,0 +1,54 @@
+import functools
+import logging
+import os
+import socket
+from telegram.ext import CallbackContext
+from storage import async_storage
+from config import LEADER_LEASE_NAME, LEADER_LEASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+class Leadership:
+    """Lease in shared storage deciding which process runs singleton jobs.
+
+    Every process renews on a timer; the holder keeps the lease while it
+    renews, and another process takes over once it has been silent for ttl
+    seconds. With a single process the lease is simply always held.
+    """
+
+    def __init__(self, name=LEADER_LEASE_NAME, ttl=LEADER_LEASE_SECONDS, holder=None):
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+
+    async def renew(self):
+        try:
+            leader = await async_storage.acquire_lease(self.name, self.holder, self.ttl)
+        except Exception as e:
+            # Cannot prove the lease is still ours, so stop acting as leader
+            logger.error("Leader lease renewal failed: %s", e)
+            leader = False
+        if leader != self.is_leader:
+            logger.info("%s leadership of %s", "Acquired" if leader else "Lost", self.name)
+        self.is_leader = leader
+        return leader
+
+    async def release(self):
+        if self.is_leader:
+            self.is_leader = False
+            await async_storage.release_lease(self.name, self.holder)
+
+leadership = Leadership()
+
+async def lease_job(context: CallbackContext):
+    """Job queue entry point renewing the leader lease"""
+    await leadership.renew()
+
+def leader_only(job):
+    """Skip a job callback unless this process holds the leader lease."""
+    @functools.wraps(job)
+    async def wrapper(context: CallbackContext):
+        if leadership.is_leader:
+            return await job(context)
+    return wrapper
@@ -0,0 +1,179 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from config import (
+    LOG_LEVEL, LOG_FILE, LOG_FORMAT, LOG_MAX_BYTES, LOG_ROTATE_INTERVAL_HOURS,
+    LOG_BACKUP_COUNT, LOG_QUEUE_SIZE, LOG_RATE_LIMIT, LOG_RATE_LIMIT_KEYS, LOG_QUIET_LOGGERS
+)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+CONTEXT_FIELDS = ('update_id', 'user_id', 'chat_id', 'transaction_id')
+
+_log_context = contextvars.ContextVar('log_context', default={})
+_listener = None
+
+# ======================== CONTEXT ========================
+
+def bind(**fields):
+    """Attach fields to every log record emitted by the current task."""
+    _log_context.set({**_log_context.get(), **fields})
+
+async def bind_update(update, context):
+    """PTB handler run ahead of all others to tag the update's log lines."""
+    fields = {'update_id': update.update_id}
+    if update.effective_user:
+        fields['user_id'] = update.effective_user.id
+    if update.effective_chat:
+        fields['chat_id'] = update.effective_chat.id
+    _log_context.set(fields)
+
+class ContextFilter(logging.Filter):
+    """Copies the bound context onto records so formatters can use it."""
+
+    def filter(self, record):
+        for key, value in _log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+class RateLimitFilter(logging.Filter):
+    """Caps identical INFO-and-below messages per template and time window.
+
+    Templates are kept in the order their windows opened: those whose window
+    has expired are swept once per window, and past max_keys the oldest are
+    forgotten, so messages built with f-strings cannot grow the table.
+    """
+
+    def __init__(self, limit, window, max_keys=LOG_RATE_LIMIT_KEYS):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._counts = OrderedDict()
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        if now - self._swept_at >= self.window:
+            self._swept_at = now
+            # Oldest window first, so the sweep stops at the first live one
+            while self._counts:
+                key, (window_start, _, _) = next(iter(self._counts.items()))
+                if now - window_start < self.window:
+                    break
+                del self._counts[key]
+        while len(self._counts) > self.max_keys:
+            self._counts.popitem(last=False)
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window_start, emitted, suppressed = self._counts.get(key, (now, 0, 0))
+            if now - window_start >= self.window or not emitted:
+                if suppressed:
+                    record.msg = f"{record.msg} (+{suppressed} similar suppressed)"
+                window_start, emitted, suppressed = now, 0, 0
+                self._counts.pop(key, None)  # Reinserted last: its window is the newest
+            if emitted >= self.limit:
+                self._counts[key] = (window_start, emitted, suppressed + 1)
+                return False
+            self._counts[key] = (window_start, emitted + 1, suppressed)
+            self._evict(now)
+        return True
+
+# ======================== OUTPUT ========================
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class SizeAndTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotates when the file reaches max_bytes or the interval elapses, whichever is first."""
+
+    def __init__(self, filename, max_bytes, interval_seconds, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.interval = interval_seconds
+        self.rollover_at = time.time() + interval_seconds
+
+    def shouldRollover(self, record):
+        if self.interval and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the event loop: records are dropped when the queue is full."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+# ======================== SETUP ========================
+
+def configure_logging():
+    """Route all logging through a queue drained by a background thread. Idempotent."""
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonLinesFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+    outputs = [logging.StreamHandler()]
+    if LOG_FILE:
+        outputs.append(SizeAndTimeRotatingFileHandler(
+            LOG_FILE, LOG_MAX_BYTES, LOG_ROTATE_INTERVAL_HOURS * 3600, LOG_BACKUP_COUNT
+        ))
+    for output in outputs:
+        output.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = _DroppingQueueHandler(log_queue)
+    # Filters run on the caller's task so they see its context variables
+    queue_handler.addFilter(ContextFilter())
+    if LOG_RATE_LIMIT:
+        queue_handler.addFilter(RateLimitFilter(*LOG_RATE_LIMIT))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name in LOG_QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, *outputs, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,10 +1,20 @@
-import uuid
-from flask import Flask, jsonify
+from startup import startup  # First import, so startup phases are timed from here
+import sys
+import logging_setup
+logging_setup.configure_logging()
+
+from flask import Flask, Response, jsonify, request
 import threading
+import logging
 import asyncio
-import bot
+import metrics
+from config import WEBHOOK_PATH, HEALTH_MAX_SILENCE
+from webhook import webhook_bridge, http_response
+from admin_api import admin
 
 app = Flask(__name__)
+app.register_blueprint(admin)
+_bot_thread = None
 
 @app.route('/')
 def index():
@@ -12,22 +22,74 @@ def index():
 
 @app.route('/health')
 def health():
-    return jsonify({"status": "ok"})
+    """Report whether the bot loop is actually running"""
+    heartbeat_age = metrics.heartbeat.age()
+    # The bot module loads on the bot thread while this server already runs
+    processor = getattr(sys.modules.get('bot'), 'update_processor', None)
+    if _bot_thread is None or not _bot_thread.is_alive():
+        status = "down"
+    elif heartbeat_age is None:
+        status = "starting"
+    elif heartbeat_age > HEALTH_MAX_SILENCE:
+        status = "stalled"
+    else:
+        status = "ok"
+
+    body = {
+        "status": status,
+        "heartbeat_age_seconds": heartbeat_age,
+        "updates": processor.stats() if processor else {}
+    }
+    return jsonify(body), 200 if status == "ok" else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.route(WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    """Receive an update from Telegram and queue it for the bot loop"""
+    if not webhook_bridge.check_secret(request.headers.get('X-Telegram-Bot-Api-Secret-Token')):
+        return jsonify({"error": "forbidden"}), 403
+
+    data = request.get_json(silent=True)
+    if data is None:
+        return jsonify({"error": "invalid payload"}), 400
+
+    body, status, headers = http_response(webhook_bridge.submit(data))
+    return jsonify(body), status, headers
 
 def run_bot():
     """Run the Telegram bot with proper async event loop setup"""
     # Create a new event loop for this thread
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    
-    # Run the bot main function
-    bot.main()
+
+    # Run the bot main function; a crash leaves the thread dead and /health failing
+    try:
+        # Imported here so the web server answers while PTB and handlers load
+        import bot
+        bot.main()
+    except Exception:
+        logging.getLogger(__name__).exception("Bot loop crashed")
+
+def start_bot_thread():
+    """Start the bot loop once per process"""
+    global _bot_thread
+    if _bot_thread is None:
+        _bot_thread = threading.Thread(target=run_bot, daemon=True)
+        _bot_thread.start()
+    return _bot_thread
+
+def create_app():
+    """WSGI entry point, e.g. gunicorn --threads 8 'main:create_app()'"""
+    start_bot_thread()
+    return app
 
 if __name__ == '__main__':
     # Start the bot in a separate thread
-    bot_thread = threading.Thread(target=run_bot, daemon=True)
-    bot_thread.start()
-    
+    start_bot_thread()
+
     # Start the Flask server
     print("Starting Flask server on http://0.0.0.0:5000")
-    app.run(host='0.0.0.0', port=5000, use_reloader=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, use_reloader=False)
@@ -0,0 +1,104 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import OrderedDict
+from telegram import ChatMember, Update
+from telegram.ext import CallbackContext
+import metrics
+from config import ADMIN_USER_IDS, MEMBER_CACHE_TTL, MEMBER_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = (ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+
+class ChatMemberCache:
+    """TTL cache of ChatMember objects keyed by (chat_id, user_id).
+
+    Entries are refreshed from ChatMemberUpdated updates as they arrive, so
+    the TTL only bounds staleness for changes the bot was not told about.
+    Concurrent misses for the same key share a single getChatMember call.
+    """
+
+    def __init__(self, ttl=MEMBER_CACHE_TTL, max_entries=MEMBER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def _store(self, key, member):
+        self._entries[key] = (time.monotonic() + self.ttl, member)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def cached(self, chat_id, user_id):
+        """The cached member, or None if absent or expired."""
+        entry = self._entries.get((chat_id, user_id))
+        if entry is None:
+            return None
+        expires_at, member = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[(chat_id, user_id)]
+            return None
+        return member
+
+    async def get(self, bot, chat_id, user_id):
+        """Chat member from the cache, fetching it from Telegram on a miss."""
+        member = self.cached(chat_id, user_id)
+        if member is not None:
+            metrics.member_cache_lookups.inc('hit')
+            return member
+        metrics.member_cache_lookups.inc('miss')
+
+        key = (chat_id, user_id)
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(bot.get_chat_member(chat_id, user_id))
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        member = await asyncio.shield(future)
+        self._store(key, member)
+        return member
+
+    async def is_admin(self, bot, chat_id, user_id):
+        member = await self.get(bot, chat_id, user_id)
+        return member.status in ADMIN_STATUSES
+
+    def invalidate(self, chat_id, user_id=None):
+        """Drop one member, or every cached member of a chat."""
+        if user_id is not None:
+            self._entries.pop((chat_id, user_id), None)
+            return
+        for key in [key for key in self._entries if key[0] == chat_id]:
+            del self._entries[key]
+
+    def apply(self, chat_member_updated):
+        """Replace an entry with the member state carried by a ChatMemberUpdated."""
+        member = chat_member_updated.new_chat_member
+        self._store((chat_member_updated.chat.id, member.user.id), member)
+
+member_cache = ChatMemberCache()
+
+async def track_chat_members(update: Update, context: CallbackContext):
+    """Keep the cache current from chat_member and my_chat_member updates."""
+    change = update.chat_member or update.my_chat_member
+    if change is not None:
+        member_cache.apply(change)
+
+def admin_required(callback):
+    """Restrict a handler to bot admins and administrators of the current group."""
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: CallbackContext):
+        user = update.effective_user
+        chat = update.effective_chat
+        if user is not None and user.id in ADMIN_USER_IDS:
+            return await callback(update, context)
+        if user is not None and chat is not None and chat.type in ('group', 'supergroup'):
+            try:
+                if await member_cache.is_admin(context.bot, chat.id, user.id):
+                    return await callback(update, context)
+            except Exception as e:
+                logger.warning("Admin check for user %s in chat %s failed: %s", user.id, chat.id, e)
+        if update.effective_message:
+            await update.effective_message.reply_text("⛔ This command is restricted to administrators")
+    return wrapper
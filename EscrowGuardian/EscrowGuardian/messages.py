@@ -0,0 +1,231 @@
+from functools import lru_cache
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from models import TransactionStatus
+from config import DEFAULT_LANGUAGE, SUPPORTED_CURRENCIES
+
+# ======================== TEXTS ========================
+
+# Per-language texts. Keys missing from a language fall back to
+# DEFAULT_LANGUAGE when the catalogs are built at import.
+TEXTS = {
+    'en': {
+        'welcome': (
+            "👋 Welcome to GengarEscrow Bot! 👻💼\n\n"
+            "Secure BTC/LTC escrow service with:\n"
+            "• Instant transaction setup\n"
+            "• Multi-signature wallets\n"
+            "• Automated dispute resolution\n\n"
+            "📌 Get started with /transaction"
+        ),
+        'welcome_fallback': "Welcome to Gengar Escrow Service!",
+        'welcome_failed': "⚠️ Failed to load welcome message. Please try again.",
+        'button_how': "📚 How It Works",
+        'button_start': "💼 Start Transaction",
+        'button_terms': "📝 Terms of Service",
+        'select_currency': "Select cryptocurrency:",
+        'group_required': (
+            "⚠️ Group Chat Required\n\n"
+            "This bot functions best in group chats where:\n"
+            "- Multiple participants can verify transactions\n"
+            "- Transparent communication is maintained\n"
+            "- Disputes can be publicly resolved\n\n"
+            "Create a group and add me as admin!"
+        ),
+        'active_transactions': (
+            "📦 Active Transactions:\n{lines}\n\n"
+            "Pass an ID to /status, /pay_seller or /refund_buyer to pick one."
+        ),
+        'active_transaction_line': "• {id} | {currency} | {status} | {created}",
+        'transaction_created': (
+            "✅ Transaction Created!\n\n"
+            "🔐 ID: `{id}`\n"
+            "💰 Currency: {currency}\n"
+            "📥 Deposit Address:\n`{deposit_address}`\n\n"
+            "Next Steps:\n"
+            "1. /set_buyer [crypto_address]\n"
+            "2. /set_seller [crypto_address]\n"
+            "3. Send funds to escrow address"
+        ),
+        'usage_set_buyer': "Usage: /set_buyer [address] [transaction_id]",
+        'usage_set_seller': "Usage: /set_seller [address] [transaction_id]",
+        'no_active_start': "❌ No active transaction. Start with /transaction",
+        'no_active': "❌ No active transaction",
+        'buyer_already_set': "⚠️ Buyer address already set. Use /restart to reset.",
+        'seller_already_set': "⚠️ Seller address already set. Use /restart to reset.",
+        'invalid_address': "❌ Invalid address format for selected currency",
+        'transaction_locked': "⚠️ Transaction can no longer be changed. Check /status",
+        'buyer_set': "✅ Buyer address set:\n`{address}`",
+        'seller_set': "✅ Seller address set:\n`{address}`",
+        'refund_unverified': "⚠️ Funds not verified for refund",
+        'refund_done': (
+            "💸 Refund Initiated!\n\n"
+            "Amount: {amount} {currency}\n"
+            "Fees: {fee} {currency}\n"
+            "Payout: {payout} {currency}\n"
+            "To: `{address}`\n"
+            "TX ID: `{payout_id}`"
+        ),
+        'payment_unverified': "⚠️ Funds not verified for payment",
+        'payment_done': (
+            "💸 Payment Released!\n\n"
+            "Amount: {amount} {currency}\n"
+            "Fees: {fee} {currency}\n"
+            "Payout: {payout} {currency}\n"
+            "To: `{address}`\n"
+            "TX ID: `{payout_id}`"
+        ),
+        'usage_review': "Usage: /review [1-5] [your feedback]",
+        'review_completed_only': "❌ You can only review completed transactions",
+        'review_thanks': "⭐ Thank you for your review!\n\nYour feedback: _{text}_",
+        'review_duplicate': "⚠️ You have already reviewed this transaction",
+        'reputation': (
+            "🏅 Reputation of `{user_id}`\n\n"
+            "Reviews: {reviews}\n"
+            "Average rating: {average}\n"
+            "Recent rating: {recent_average}\n"
+            "Reports: {reports}"
+        ),
+        'rating_value': "{value:.1f}/5 ({count})",
+        'recent_rating_value': "{value:.1f}/5",
+        'no_ratings': "No ratings yet",
+        'counterparty_warning': (
+            "⚠️ Caution: user `{user_id}` has a poor recent track record\n\n"
+            "Reports: {reports}\n"
+            "Recent rating: {recent_average}\n\n"
+            "Check /reputation before funding this deal."
+        ),
+        'usage_verify': "Usage: /verify [address]",
+        'verify_ok': "✅ Verified Gengar Escrow Address",
+        'verify_fraud': "❌ Potential Fraudulent Address!",
+        'verify_result': "{verdict}\n\nScanned: {scanned}\nAddress: `{address}`",
+        'real': (
+            "🔒 **Official Gengar Escrow Bot** 🔒\n\n"
+            "Authentication Marks:\n"
+            "• Verified Telegram Checkmark\n"
+            "• Consistent Branding\n"
+            "• Secure HTTPS Connections\n\n"
+            "⚠️ Report imposters with /report"
+        ),
+        'check_admin': "🛡️ Bot Permission Status:\n\n✅ Has Admin Privileges\nFull functionality enabled",
+        'check_limited': (
+            "🛡️ Bot Permission Status:\n\n"
+            "⚠️ Limited Functionality\n"
+            "Required Permissions:\n"
+            "- Delete Messages\n"
+            "- Pin Messages\n"
+            "- Ban Users"
+        ),
+        'check_failed': "❌ Could not verify permissions",
+        'status': (
+            "📊 Transaction Status\n\n"
+            "🔖 ID: `{id}`\n"
+            "🕒 Created: {created}\n"
+            "💰 Currency: {currency}\n"
+            "📥 Escrow Address:\n`{deposit_address}`\n"
+            "📈 Status: {status}\n"
+            "👤 Buyer: {buyer}\n"
+            "👥 Seller: {seller}"
+        ),
+        'not_set': "Not set",
+        'how': (
+            "📘 **Gengar Escrow Guide**\n\n"
+            "1. Start: /transaction\n"
+            "2. Set currency: /select_currency\n"
+            "3. Configure addresses:\n"
+            "   - /set_buyer [address]\n"
+            "   - /set_seller [address]\n"
+            "4. Fund escrow wallet\n"
+            "5. Complete transaction:\n"
+            "   - /pay_seller to release funds\n"
+            "   - /refund_buyer to cancel\n\n"
+            "🔍 Check /status anytime\n"
+            "🔄 Reset with /restart\n\n"
+            "With several deals open, add the transaction ID, e.g. /status [id]"
+        ),
+        'reset_none': "❌ No unfunded transaction of yours to reset. Funded deals end with /pay_seller or /refund_buyer",
+        'reset_done': "♻️ Transaction reset. Start new with /transaction",
+        'contact_received': "📩 Message received. Support will respond within 24h.",
+        'usage_report': "Usage: /report [description]",
+        'report_filed': "🚨 Report filed. Thank you for your vigilance!",
+        'escrow_info': (
+            "🛡️ How Escrow Works:\n\n"
+            "1. Buyer/seller agree to terms\n"
+            "2. Funds are locked in escrow\n"
+            "3. Goods/services are exchanged\n"
+            "4. Funds released to seller\n\n"
+            "Full guide: /how"
+        ),
+        'terms': (
+            "📜 Terms of Service\n\n"
+            "1. Funds held in escrow until mutual agreement\n"
+            "2. 0.5% service fee on completed transactions\n"
+            "3. Users must verify counterparty identities\n"
+            "4. Disputes resolved via multisig arbitration\n"
+            "5. Full logs available upon request\n\n"
+            "By using this service, you agree to these terms."
+        ),
+        'balance': (
+            "💰 Balance Summary:\n"
+            "BTC: 0.00000000\n"
+            "LTC: 0.00000000\n\n"
+            "Fund escrow wallet to start transactions!"
+        ),
+        'throttled': "⏳ Slow down! Too many requests, please wait a moment.",
+        'statuses': {status: status.value.capitalize() for status in TransactionStatus},
+    },
+}
+
+# ======================== CATALOGS ========================
+
+class Catalog:
+    """Texts, templates and keyboards of one language, all built once at import."""
+
+    def __init__(self, language, texts):
+        self.language = language
+        self.texts = texts
+        # Bound str.format methods skip the attribute lookup on every render
+        self.templates = {key: value.format for key, value in texts.items() if isinstance(value, str)}
+        self.statuses = texts['statuses']
+        # InlineKeyboardMarkup is immutable, so one instance serves every reply
+        self.keyboards = {
+            'welcome': InlineKeyboardMarkup([
+                [InlineKeyboardButton(texts['button_how'], callback_data='show_escrow_info'),
+                 InlineKeyboardButton(texts['button_start'], callback_data='start_transaction')],
+                [InlineKeyboardButton(texts['button_terms'], callback_data='show_terms')],
+            ]),
+            'currency': InlineKeyboardMarkup([[
+                InlineKeyboardButton(currency, callback_data=f'currency_{currency.lower()}')
+                for currency in SUPPORTED_CURRENCIES
+            ]]),
+        }
+
+    def text(self, key):
+        return self.texts[key]
+
+    def render(self, key, **values):
+        return self.templates[key](**values)
+
+    def keyboard(self, key):
+        return self.keyboards[key]
+
+    def status(self, status):
+        return self.statuses[status]
+
+CATALOGS = {
+    language: Catalog(language, {**TEXTS[DEFAULT_LANGUAGE], **texts})
+    for language, texts in TEXTS.items()
+}
+DEFAULT_CATALOG = CATALOGS[DEFAULT_LANGUAGE]
+
+def catalog_for(update=None):
+    """Catalog matching the user's Telegram language, else the default one."""
+    user = getattr(update, 'effective_user', None)
+    code = getattr(user, 'language_code', None)
+    if code:
+        return CATALOGS.get(code) or CATALOGS.get(code.split('-')[0]) or DEFAULT_CATALOG
+    return DEFAULT_CATALOG
+
+@lru_cache(maxsize=4096)
+def format_minute(moment):
+    """Timestamp as shown to users; a transaction's timestamps never change."""
+    return moment.strftime('%Y-%m-%d %H:%M')
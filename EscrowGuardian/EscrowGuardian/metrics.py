@@ -0,0 +1,238 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from telegram.request import HTTPXRequest
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'  # Prometheus text exposition format
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}_total{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in items
+        ]
+
+class Gauge(_Metric):
+    """Gauge whose samples are either set directly or read from a callback at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self):
+        if self.callback is not None:
+            samples = self.callback()
+            items = samples.items() if isinstance(samples, dict) else [((), samples)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in items
+        ]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items()]
+        lines = self.header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', le)])} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+class Heartbeat:
+    """Timestamp of the last sign of life from the bot's event loop."""
+
+    def __init__(self):
+        self.last = None
+
+    def beat(self):
+        self.last = time.monotonic()
+
+    def age(self):
+        return None if self.last is None else time.monotonic() - self.last
+
+# ======================== BOT METRICS ========================
+
+registry = Registry()
+heartbeat = Heartbeat()
+
+handler_calls = registry.register(Counter(
+    'escrow_handler_calls', 'Handler invocations', ('handler',)))
+handler_errors = registry.register(Counter(
+    'escrow_handler_errors', 'Handler invocations that raised', ('handler',)))
+handler_latency = registry.register(Histogram(
+    'escrow_handler_latency_seconds', 'Handler latency', ('handler',)))
+telegram_api_latency = registry.register(Histogram(
+    'escrow_telegram_api_latency_seconds', 'Telegram Bot API request latency', ('method',)))
+telegram_api_errors = registry.register(Counter(
+    'escrow_telegram_api_errors', 'Telegram Bot API requests that failed', ('method',)))
+telegram_api_retries = registry.register(Counter(
+    'escrow_telegram_api_retries', 'Telegram Bot API requests retried', ('method',)))
+member_cache_lookups = registry.register(Counter(
+    'escrow_member_cache_lookups', 'Chat member lookups by cache result', ('result',)))
+storage_latency = registry.register(Histogram(
+    'escrow_storage_latency_seconds', 'Storage operation latency', ('operation',),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)))
+throttled_updates = registry.register(Counter(
+    'escrow_throttled_updates', 'Inbound updates dropped by the throttle', ('scope',)))
+rejected_deposits = registry.register(Counter(
+    'escrow_rejected_deposits', 'Confirmed deposits that did not fund their deal', ('reason',)))
+db_pool_wait = registry.register(Histogram(
+    'escrow_db_pool_wait_seconds', 'Time spent waiting for a pooled database connection',
+    buckets=(0.0001, 0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)))
+dead_letter_rows = registry.register(Counter(
+    'escrow_dead_letter_rows', 'Buffered rows given up on and written to the dead-letter log', ('table',)))
+db_query_latency = registry.register(Histogram(
+    'escrow_db_query_latency_seconds', 'Database statement latency', ('statement',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)))
+
+def register_gauge(name, documentation, callback, labelnames=()):
+    """Expose a value computed at scrape time, e.g. a queue depth."""
+    return registry.register(Gauge(name, documentation, labelnames, callback=callback))
+
+def instrument_handler(name, callback):
+    """Wrap a PTB callback with call, error and latency accounting."""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        heartbeat.beat()
+        handler_calls.inc(name)
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - start, name)
+    return wrapper
+
+class InstrumentedStorage:
+    """Times every public storage method while forwarding everything else."""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __getattr__(self, name):
+        attribute = getattr(self._backend, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def timed(*args, **kwargs):
+            with storage_latency.time(name):
+                return attribute(*args, **kwargs)
+        # Cache so later lookups skip __getattr__
+        setattr(self, name, timed)
+        return timed
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records Bot API latency and failures per method."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        start = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            telegram_api_errors.inc(api_method)
+            raise
+        finally:
+            telegram_api_latency.observe(time.perf_counter() - start, api_method)
+        heartbeat.beat()
+        if code >= 400:
+            telegram_api_errors.inc(api_method)
+        return code, payload
@@ -1,3 +1,5 @@
+import re
+import sys
 from enum import Enum
 from dataclasses import dataclass
 from datetime import datetime
@@ -13,7 +15,71 @@ class TransactionStatus(Enum):
         CANCELLED = "cancelled"
         REFUNDED = "refunded"
 
-@dataclass
+# Compact integer codes for columnar storage; new statuses must be appended
+STATUS_CODES = {status: code for code, status in enumerate(TransactionStatus)}
+STATUS_BY_CODE = tuple(TransactionStatus)
+
+# Statuses the timeout sweeper may still act on
+SWEEPABLE_STATUSES = (
+        TransactionStatus.CREATED,
+        TransactionStatus.BUYER_SET,
+        TransactionStatus.SELLER_SET,
+        TransactionStatus.FUNDED,
+)
+
+# Statuses from which the creator may cancel a deal with /restart; nothing has been paid yet
+RESETTABLE_STATUSES = (
+        TransactionStatus.CREATED,
+        TransactionStatus.BUYER_SET,
+        TransactionStatus.SELLER_SET,
+)
+
+# Statuses after which a transaction no longer counts as active
+FINAL_STATUSES = (
+        TransactionStatus.COMPLETED,
+        TransactionStatus.CANCELLED,
+        TransactionStatus.REFUNDED,
+)
+
+# Legal status changes; anything not listed is rejected before storage is touched.
+# An active status may move to itself, which records a rejected deposit.
+TRANSITIONS = {
+        TransactionStatus.CREATED: frozenset({
+                TransactionStatus.CREATED, TransactionStatus.BUYER_SET, TransactionStatus.SELLER_SET,
+                TransactionStatus.CANCELLED,
+        }),
+        TransactionStatus.BUYER_SET: frozenset({
+                TransactionStatus.BUYER_SET, TransactionStatus.SELLER_SET, TransactionStatus.FUNDED,
+                TransactionStatus.CANCELLED,
+        }),
+        TransactionStatus.SELLER_SET: frozenset({
+                TransactionStatus.SELLER_SET, TransactionStatus.BUYER_SET, TransactionStatus.FUNDED,
+                TransactionStatus.CANCELLED,
+        }),
+        TransactionStatus.FUNDED: frozenset({
+                TransactionStatus.FUNDED, TransactionStatus.IN_PROGRESS, TransactionStatus.COMPLETED,
+                TransactionStatus.REFUNDED,
+        }),
+        TransactionStatus.IN_PROGRESS: frozenset({
+                TransactionStatus.IN_PROGRESS, TransactionStatus.COMPLETED, TransactionStatus.REFUNDED,
+        }),
+        TransactionStatus.COMPLETED: frozenset(),
+        TransactionStatus.CANCELLED: frozenset(),
+        TransactionStatus.REFUNDED: frozenset(),
+}
+
+# Fields that may change together with the status in one transition
+TRANSITION_FIELDS = frozenset({
+        'buyer_id', 'seller_id', 'buyer_address', 'seller_address', 'amount', 'funded_at', 'funding_outpoint',
+        'rejected_outpoint', 'rejected_amount', 'finished_at',
+})
+
+def can_transition(current, new):
+        return new in TRANSITIONS[current]
+
+TRANSACTION_ID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+@dataclass(slots=True)
 class Transaction:
         id: str
         user_id: int
@@ -24,19 +90,81 @@ class Transaction:
         seller_id: Optional[int] = None
         buyer_address: Optional[str] = None
         seller_address: Optional[str] = None
-        amount: Optional[float] = None
+        amount: Optional[int] = None  # Base units (satoshis / litoshis)
         funded_at: Optional[datetime] = None
-@dataclass
+        chat_id: Optional[int] = None
+        # Per-deal address derived from the currency's account key, and its index
+        deposit_address: Optional[str] = None
+        deposit_index: Optional[int] = None
+        # 'txid:vout' of the payment that funded the deal; unique across transactions
+        funding_outpoint: Optional[str] = None
+        # Latest payment refused for breaking the fee rules, kept for the operator to refund
+        rejected_outpoint: Optional[str] = None
+        rejected_amount: Optional[int] = None  # Base units
+        # When the deal reached a final status; set by every backend's transition
+        finished_at: Optional[datetime] = None
+
+        def __post_init__(self):
+                # A handful of currency codes shared by every instance
+                self.currency = sys.intern(self.currency)
+
+        def participants(self):
+                """User ids that can act on this transaction."""
+                return {uid for uid in (self.user_id, self.buyer_id, self.seller_id) if uid is not None}
+
+        def is_active(self):
+                return self.status not in FINAL_STATUSES
+
+        def timeout_start(self):
+                """When the escrow timeout starts counting: funding for a funded deal, else creation."""
+                return self.funded_at or self.created_at
+
+        def counterparty_of(self, user_id):
+                """The other side of the deal from user_id's point of view, if known."""
+                if user_id == self.buyer_id:
+                        other = self.seller_id or self.user_id
+                elif user_id == self.seller_id:
+                        other = self.buyer_id or self.user_id
+                elif user_id == self.user_id:
+                        other = self.buyer_id or self.seller_id
+                else:
+                        return None
+                return other if other != user_id else None
+
+@dataclass(slots=True, frozen=True)
 class Review:
         transaction_id: str
         user_id: int
         message: str
         created_at: datetime
         rating: Optional[int] = None
+        # The counterparty being reviewed
+        subject_id: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Report:
         user_id: int
         message: str
         created_at: datetime
-        resolved: bool = False
\ No newline at end of file
+        resolved: bool = False
+        # The user reported, when the report replies to one of their messages
+        # and the reporter shares a deal with them
+        subject_id: Optional[int] = None
+
+@dataclass(slots=True)
+class Reputation:
+        """Per-user aggregates of the reviews and reports about them.
+
+        The recent_* fields are decayed sums: each event's weight halves every
+        half-life, so they describe recent behaviour without keeping a window
+        of events. They are as of updated_at.
+        """
+        user_id: int
+        reviews: int = 0
+        ratings: int = 0
+        rating_sum: int = 0
+        reports: int = 0
+        recent_ratings: float = 0.0
+        recent_rating_sum: float = 0.0
+        recent_reports: float = 0.0
+        updated_at: Optional[datetime] = None
\ No newline at end of file
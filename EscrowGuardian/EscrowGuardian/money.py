@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import math
+from array import array
+from dataclasses import dataclass, replace
+from decimal import Decimal, ROUND_HALF_UP
+from telegram.ext import CallbackContext
+import metrics
+from chain import create_chain_backend
+from config import (
+    SUPPORTED_CURRENCIES, TRANSACTION_FEES, MAX_TRANSACTION_AMOUNT, SERVICE_FEE_BPS,
+    FEE_SOURCE, FEE_TARGET_BLOCKS, PAYOUT_VSIZE
+)
+
+logger = logging.getLogger(__name__)
+
+# Amounts are integers of base units everywhere past the edges: coin strings
+# from config are converted once, and only display formats them back.
+
+BASE_UNITS = 10 ** 8  # Satoshis per BTC, litoshis per LTC
+BPS = 10000  # Basis points per whole
+
+# ======================== UNITS ========================
+
+def to_units(value):
+    """Base units of a coin amount given as str, Decimal, int or float, rounded half up."""
+    return int((Decimal(str(value)) * BASE_UNITS).to_integral_value(ROUND_HALF_UP))
+
+def format_units(units):
+    """'0.01000000' for 1_000_000 units, without going through a float."""
+    whole, fraction = divmod(abs(units), BASE_UNITS)
+    return f"{'-' if units < 0 else ''}{whole}.{fraction:08d}"
+
+# ======================== FEE TABLE ========================
+
+@dataclass(slots=True, frozen=True)
+class FeeRule:
+    network_fee: int  # Base units paid to miners per payout
+    service_bps: int  # Escrow fee on completed deals
+    maximum: int  # Largest deposit a deal accepts
+
+def compile_rules(network_fees):
+    """One FeeRule per currency from network fees in base units and the configured limits."""
+    return {
+        currency: FeeRule(network_fees[currency], SERVICE_FEE_BPS, to_units(MAX_TRANSACTION_AMOUNT[currency]))
+        for currency in SUPPORTED_CURRENCIES
+    }
+
+class FeeSchedule:
+    """Fee and limit rules per currency, with network fees refreshed in the background.
+
+    Settling only reads the compiled table, so it never waits on the network;
+    a refresh builds a new table and swaps it in whole, and a failed one
+    keeps the last good rates.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.rules = compile_rules({currency: to_units(fee) for currency, fee in TRANSACTION_FEES.items()})
+
+    async def refresh(self):
+        results = await asyncio.gather(
+            *(self.source.network_fee(currency) for currency in self.rules),
+            return_exceptions=True
+        )
+        rules = dict(self.rules)
+        for currency, result in zip(self.rules, results):
+            if isinstance(result, Exception):
+                logger.warning("Fee refresh for %s failed, keeping %s: %s", currency, rules[currency].network_fee, result)
+            else:
+                rules[currency] = replace(rules[currency], network_fee=result)
+        self.rules = rules
+
+    def fee(self, currency, amount, completed=True):
+        """Total fee in base units; refunds pay the network fee only. Never more than amount."""
+        rule = self.rules[currency]
+        service = -(-amount * rule.service_bps // BPS) if completed else 0  # Rounded up
+        return min(amount, rule.network_fee + service)
+
+    def settle(self, currency, amount, completed=True):
+        """(fee, payout) of a funded deal released (completed) or refunded."""
+        fee = self.fee(currency, amount, completed)
+        return fee, amount - fee
+
+    def total(self, currency, amount):
+        """What a buyer deposits for amount to reach the seller after fees, rounded up."""
+        rule = self.rules[currency]
+        deposit = -(-(amount + rule.network_fee) * BPS // (BPS - rule.service_bps))
+        # The service fee rounds up per deal, which the estimate may miss by a unit
+        while self.settle(currency, deposit)[1] < amount:
+            deposit += 1
+        return deposit
+
+    def violation(self, currency, amount):
+        """None if a deposit is acceptable, else 'above_maximum' or 'below_fee'."""
+        if amount > self.rules[currency].maximum:
+            return 'above_maximum'
+        if amount <= self.fee(currency, amount):
+            return 'below_fee'
+        return None
+
+    def settle_many(self, currencies, amounts, completed=True):
+        """settle() over columns: (fees, payouts) as int64 arrays aligned with amounts.
+
+        Rules are resolved once per currency instead of once per row, so
+        archive columns can be fed in directly for reports.
+        """
+        parameters = {
+            currency: (rule.network_fee, rule.service_bps if completed else 0)
+            for currency, rule in self.rules.items()
+        }
+        fees = array('q', bytes(8 * len(amounts)))
+        payouts = array('q', fees)
+        for row, (currency, amount) in enumerate(zip(currencies, amounts)):
+            network_fee, service_bps = parameters[currency]
+            fee = min(amount, network_fee - (-amount * service_bps // BPS))
+            fees[row] = fee
+            payouts[row] = amount - fee
+        return fees, payouts
+
+    async def close(self):
+        await self.source.close()
+
+# ======================== FEE SOURCES ========================
+
+class StaticFeeSource:
+    """Local stand-in: the configured TRANSACTION_FEES, no network calls."""
+
+    async def network_fee(self, currency):
+        return to_units(TRANSACTION_FEES[currency])
+
+    async def close(self):
+        pass
+
+class ChainFeeSource:
+    """Fee of a typical payout from the chain backends' fee rate estimates."""
+
+    def __init__(self, backends, target_blocks=FEE_TARGET_BLOCKS, vsize=PAYOUT_VSIZE):
+        self.backends = backends
+        self.target_blocks = target_blocks
+        self.vsize = vsize
+
+    async def network_fee(self, currency):
+        return math.ceil(await self.backends[currency].get_fee_rate(self.target_blocks) * self.vsize)
+
+    async def close(self):
+        for backend in self.backends.values():
+            await backend.close()
+
+def create_fee_source(source=FEE_SOURCE):
+    """Build the fee rate source selected by configuration."""
+    if source == 'static':
+        return StaticFeeSource()
+    if source == 'chain':
+        return ChainFeeSource({currency: create_chain_backend(currency) for currency in SUPPORTED_CURRENCIES})
+    raise ValueError(f"Unknown fee source: {source}")
+
+fee_schedule = FeeSchedule(create_fee_source())
+
+metrics.register_gauge(
+    'escrow_network_fee_units', 'Network fee charged per payout in base units',
+    lambda: {(currency,): rule.network_fee for currency, rule in fee_schedule.rules.items()},
+    labelnames=('currency',)
+)
+
+async def fee_job(context: CallbackContext):
+    """Job queue entry point for refreshing network fees"""
+    await fee_schedule.refresh()
@@ -0,0 +1,725 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import datetime
+from functools import lru_cache
+import psycopg2
+from psycopg2 import extensions, extras, pool
+from models import (
+    Transaction, Review, Report, Reputation, TransactionStatus, SWEEPABLE_STATUSES, FINAL_STATUSES, RESETTABLE_STATUSES,
+    TRANSITION_FIELDS, can_transition
+)
+import metrics
+from reputation import HALF_LIFE_SECONDS, merge_deltas, review_delta, report_delta
+
+logger = logging.getLogger(__name__)
+
+SWEEPABLE_SQL = ", ".join(f"'{status.value}'" for status in SWEEPABLE_STATUSES)
+FINAL_SQL = ", ".join(f"'{status.value}'" for status in FINAL_STATUSES)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    currency TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    buyer_id BIGINT,
+    seller_id BIGINT,
+    buyer_address TEXT,
+    seller_address TEXT,
+    amount BIGINT,
+    funded_at TIMESTAMP,
+    chat_id BIGINT,
+    deposit_address TEXT,
+    deposit_index BIGINT,
+    funding_outpoint TEXT,
+    rejected_outpoint TEXT,
+    rejected_amount BIGINT,
+    finished_at TIMESTAMP
+);
+-- Columns added after the first release
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS deposit_address TEXT;
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS deposit_index BIGINT;
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS funding_outpoint TEXT;
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS rejected_outpoint TEXT;
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS rejected_amount BIGINT;
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS finished_at TIMESTAMP;
+-- Amounts were float coins; they are integer base units now
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'transactions' AND column_name = 'amount'
+    ) = 'double precision' THEN
+        ALTER TABLE transactions ALTER COLUMN amount TYPE BIGINT USING round(amount * 100000000);
+    END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS idx_transactions_user ON transactions (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_buyer ON transactions (buyer_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_seller ON transactions (seller_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_buyer_address ON transactions (buyer_address);
+CREATE INDEX IF NOT EXISTS idx_transactions_seller_address ON transactions (seller_address);
+CREATE INDEX IF NOT EXISTS idx_transactions_deposit_address ON transactions (deposit_address);
+-- A payment funds at most one deal, whichever worker or restart sees it
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_funding ON transactions (funding_outpoint);
+CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions (created_at, id);
+-- Open deals by when their timeout started: funding, else creation
+DROP INDEX IF EXISTS idx_transactions_open;
+CREATE INDEX IF NOT EXISTS idx_transactions_expiry ON transactions ((COALESCE(funded_at, created_at)))
+    WHERE status IN ({sweepable});
+
+CREATE TABLE IF NOT EXISTS reviews (
+    id BIGSERIAL PRIMARY KEY,
+    transaction_id TEXT NOT NULL,
+    user_id BIGINT NOT NULL,
+    message TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    rating INTEGER,
+    subject_id BIGINT
+);
+ALTER TABLE reviews ADD COLUMN IF NOT EXISTS subject_id BIGINT;
+CREATE INDEX IF NOT EXISTS idx_reviews_transaction ON reviews (transaction_id);
+CREATE INDEX IF NOT EXISTS idx_reviews_subject ON reviews (subject_id);
+CREATE INDEX IF NOT EXISTS idx_reviews_created ON reviews (created_at, id);
+-- One review per author and deal: repeats from before the index are dropped, the first one stays
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE schemaname = current_schema() AND indexname = 'idx_reviews_author') THEN
+        DELETE FROM reviews WHERE id NOT IN (SELECT MIN(id) FROM reviews GROUP BY transaction_id, user_id);
+        CREATE UNIQUE INDEX idx_reviews_author ON reviews (transaction_id, user_id);
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS reports (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    message TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    resolved BOOLEAN NOT NULL DEFAULT FALSE,
+    subject_id BIGINT
+);
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS subject_id BIGINT;
+CREATE INDEX IF NOT EXISTS idx_reports_user ON reports (user_id);
+CREATE INDEX IF NOT EXISTS idx_reports_subject ON reports (subject_id);
+CREATE INDEX IF NOT EXISTS idx_reports_created ON reports (created_at, id);
+
+CREATE TABLE IF NOT EXISTS reputations (
+    user_id BIGINT PRIMARY KEY,
+    reviews INTEGER NOT NULL,
+    ratings INTEGER NOT NULL,
+    rating_sum INTEGER NOT NULL,
+    reports INTEGER NOT NULL,
+    recent_ratings DOUBLE PRECISION NOT NULL,
+    recent_rating_sum DOUBLE PRECISION NOT NULL,
+    recent_reports DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value BIGINT NOT NULL
+);
+""".format(sweepable=SWEEPABLE_SQL)
+
+# Server-side prepared statements, created per connection on first use and
+# then run with EXECUTE so Postgres parses and plans each one only once.
+TRANSACTION_COLUMNS = (
+    "id, user_id, currency, status, created_at, buyer_id, seller_id, "
+    "buyer_address, seller_address, amount, funded_at, chat_id, deposit_address, deposit_index, funding_outpoint, "
+    "rejected_outpoint, rejected_amount, finished_at"
+)
+UPSERT_ASSIGNMENTS = ", ".join(
+    f"{column} = EXCLUDED.{column}" for column in TRANSACTION_COLUMNS.split(", ")[1:]
+)
+STATEMENTS = {
+    'insert_transaction': (
+        f"INSERT INTO transactions ({TRANSACTION_COLUMNS}) "
+        f"VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17, $18) "
+        f"ON CONFLICT (id) DO UPDATE SET {UPSERT_ASSIGNMENTS}"
+    ),
+    'select_by_id': f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE id = $1",
+    # Each branch of the union is served by its own participant index
+    'select_by_participant': (
+        f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE user_id = $1 "
+        f"UNION SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE buyer_id = $1 "
+        f"UNION SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE seller_id = $1 "
+        f"ORDER BY created_at DESC"
+    ),
+    'select_active_by_participant': (
+        f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE user_id = $1 AND status NOT IN ({FINAL_SQL}) "
+        f"UNION SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE buyer_id = $1 AND status NOT IN ({FINAL_SQL}) "
+        f"UNION SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE seller_id = $1 AND status NOT IN ({FINAL_SQL}) "
+        f"ORDER BY created_at DESC"
+    ),
+    'select_all': f"SELECT {TRANSACTION_COLUMNS} FROM transactions",
+    # A NULL limit means no limit
+    'select_by_status': (
+        f"SELECT {TRANSACTION_COLUMNS} FROM transactions "
+        f"WHERE status = $1 AND created_at < $2 ORDER BY created_at LIMIT $3"
+    ),
+    # Matches idx_transactions_expiry, so the sweep is an ordered range scan on the partial index
+    'select_expired': (
+        f"SELECT {TRANSACTION_COLUMNS} FROM transactions "
+        f"WHERE status IN ({SWEEPABLE_SQL}) AND COALESCE(funded_at, created_at) < $1 "
+        f"ORDER BY COALESCE(funded_at, created_at) LIMIT $2"
+    ),
+    'select_by_address': (
+        f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE buyer_address = $1 "
+        f"UNION SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE seller_address = $1"
+    ),
+    'select_by_deposit_address': f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE deposit_address = $1",
+    'select_by_deposit_addresses': f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE deposit_address = ANY($1)",
+    'select_by_outpoint': f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE funding_outpoint = $1",
+    # Lease expiry uses the database clock, so hosts need not agree on the time
+    'acquire_lease': (
+        "INSERT INTO leases (name, holder, expires_at) VALUES ($1, $2, now() + $3 * interval '1 second') "
+        "ON CONFLICT (name) DO UPDATE SET holder = EXCLUDED.holder, expires_at = EXCLUDED.expires_at "
+        "WHERE leases.holder = EXCLUDED.holder OR leases.expires_at < now()"
+    ),
+    'release_lease': "DELETE FROM leases WHERE name = $1 AND holder = $2",
+    'select_reputation': (
+        "SELECT user_id, reviews, ratings, rating_sum, reports, "
+        "recent_ratings, recent_rating_sum, recent_reports, updated_at FROM reputations WHERE user_id = $1"
+    ),
+    # Row-locked increment, so concurrent workers never claim the same range
+    'advance_counter': (
+        "INSERT INTO counters (name, value) VALUES ($1, $2) "
+        "ON CONFLICT (name) DO UPDATE SET value = counters.value + EXCLUDED.value RETURNING value"
+    ),
+    'select_counter': "SELECT value FROM counters WHERE name = $1",
+    'select_review_exists': "SELECT 1 FROM reviews WHERE transaction_id = $1 AND user_id = $2",
+    'set_counter': (
+        "INSERT INTO counters (name, value) VALUES ($1, $2) "
+        "ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value"
+    ),
+}
+# Reviews and reports are buffered and written with one multi-row INSERT
+# Only reviews actually inserted are returned, and only those count towards reputations
+INSERT_REVIEWS = (
+    "INSERT INTO reviews (transaction_id, user_id, message, created_at, rating, subject_id) VALUES %s "
+    "ON CONFLICT (transaction_id, user_id) DO NOTHING RETURNING transaction_id, user_id"
+)
+INSERT_REPORTS = "INSERT INTO reports (user_id, message, created_at, resolved, subject_id) VALUES %s"
+# Each batch's events are summed per user first: one statement may not
+# update the same row twice
+DECAYED = (
+    "reputations.{column} * power(0.5, GREATEST(0, EXTRACT(EPOCH FROM EXCLUDED.updated_at - "
+    "reputations.updated_at)) / {half_life}) + EXCLUDED.{column}"
+)
+UPSERT_REPUTATIONS = (
+    "INSERT INTO reputations (user_id, reviews, ratings, rating_sum, reports, "
+    "recent_ratings, recent_rating_sum, recent_reports, updated_at) VALUES %s "
+    "ON CONFLICT (user_id) DO UPDATE SET "
+    "reviews = reputations.reviews + EXCLUDED.reviews, ratings = reputations.ratings + EXCLUDED.ratings, "
+    "rating_sum = reputations.rating_sum + EXCLUDED.rating_sum, reports = reputations.reports + EXCLUDED.reports, "
+    + ", ".join(
+        f"{column} = " + DECAYED.format(column=column, half_life=HALF_LIFE_SECONDS)
+        for column in ('recent_ratings', 'recent_rating_sum', 'recent_reports')
+    )
+    + ", updated_at = GREATEST(reputations.updated_at, EXCLUDED.updated_at)"
+)
+REVIEW_COLUMNS = "id, transaction_id, user_id, message, created_at, rating, subject_id"
+REPORT_COLUMNS = "id, user_id, message, created_at, resolved, subject_id"
+# Exports page by (created_at, id): resuming after the last row seen is an
+# index range scan however deep into the table the export has got
+PAGE_FILTERS = {
+    'status': "status = ${}",
+    'currency': "currency = ${}",
+    'created_from': "created_at >= ${}",
+    'created_to': "created_at < ${}",
+}
+PARAMETER = re.compile(r'\$(\d+)')
+
+@lru_cache(maxsize=None)
+def _commands(name, sql):
+    """PREPARE and EXECUTE commands of a named statement."""
+    count = len(set(PARAMETER.findall(sql)))
+    arguments = f" ({', '.join(['%s'] * count)})" if count else ""
+    return f"PREPARE {name} AS {sql}", f"EXECUTE {name}{arguments}"
+
+@lru_cache(maxsize=None)
+def _transition_statement(fields):
+    """Conditional UPDATE that also sets the given columns; one statement per field set."""
+    assignments = ''.join(f", {field} = ${number}" for number, field in enumerate(fields, start=2))
+    id_number = len(fields) + 2
+    sql = (
+        f"UPDATE transactions SET status = $1{assignments} "
+        f"WHERE id = ${id_number} AND status = ${id_number + 1} RETURNING {TRANSACTION_COLUMNS}"
+    )
+    return '_'.join(('transition',) + fields), sql
+
+@lru_cache(maxsize=None)
+def _page_statement(table, columns, keyed, filters):
+    """One keyset page of a table; one statement per combination of filters."""
+    conditions = ["(created_at, id) > ($1, $2)"] if keyed else []
+    first = 3 if keyed else 1
+    conditions += [PAGE_FILTERS[name].format(number) for number, name in enumerate(filters, start=first)]
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f"SELECT {columns} FROM {table}{where} ORDER BY created_at, id LIMIT ${first + len(filters)}"
+    return '_'.join((f'page_{table}', 'after' if keyed else 'start') + filters), sql
+
+def _transaction_row(transaction):
+    return (
+        transaction.id,
+        transaction.user_id,
+        transaction.currency,
+        transaction.status.value,
+        transaction.created_at,
+        transaction.buyer_id,
+        transaction.seller_id,
+        transaction.buyer_address,
+        transaction.seller_address,
+        transaction.amount,
+        transaction.funded_at,
+        transaction.chat_id,
+        transaction.deposit_address,
+        transaction.deposit_index,
+        transaction.funding_outpoint,
+        transaction.rejected_outpoint,
+        transaction.rejected_amount,
+        transaction.finished_at,
+    )
+
+def _row_transaction(row):
+    return Transaction(
+        id=row[0],
+        user_id=row[1],
+        currency=row[2],
+        status=TransactionStatus(row[3]),
+        created_at=row[4],
+        buyer_id=row[5],
+        seller_id=row[6],
+        buyer_address=row[7],
+        seller_address=row[8],
+        amount=row[9],
+        funded_at=row[10],
+        chat_id=row[11],
+        deposit_address=row[12],
+        deposit_index=row[13],
+        funding_outpoint=row[14],
+        rejected_outpoint=row[15],
+        rejected_amount=row[16],
+        finished_at=row[17],
+    )
+
+class _Connection(extensions.connection):
+    """psycopg2 connection remembering which statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+class PostgresStorage:
+    """Postgres storage exposing the same API as the in-memory Storage.
+
+    Calls block on the network, so event loop code goes through
+    AsyncStorage, which runs them on a thread pool as wide as the
+    connection pool. Reviews and reports are buffered for up to
+    batch_interval seconds and inserted in batches by a background thread;
+    a batch that keeps failing is set aside in a dead-letter log.
+    """
+
+    blocking = True
+
+    def __init__(self, dsn, pool_size, pool_timeout=10, batch_interval=0.2, batch_size=500,
+                 flush_retries=8, dead_letter_path=None):
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.flush_retries = flush_retries
+        self.dead_letter_path = dead_letter_path
+        # Failed batches as [reviews, reports, attempts, retry at (monotonic)]; flusher thread only
+        self._retries = []
+        self._pool = pool.ThreadedConnectionPool(1, pool_size, dsn, connection_factory=_Connection)
+        # ThreadedConnectionPool fails instead of waiting when exhausted
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._in_use = 0
+        self._usage_lock = threading.Lock()
+        self._reviews = []
+        self._reports = []
+        self._batch_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closing = False
+        with self._connection() as conn:
+            conn.cursor().execute(SCHEMA)
+        self._flusher = threading.Thread(target=self._flush_loop, name="postgres-batch", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+        metrics.register_gauge(
+            'escrow_db_pool_connections', 'Pooled database connections by state',
+            lambda: {('in_use',): self._in_use, ('size',): self.pool_size},
+            labelnames=('state',)
+        )
+
+    @contextmanager
+    def _connection(self):
+        """A pooled connection inside a transaction, committed on success."""
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.pool_timeout):
+            raise pool.PoolError(f"No database connection free after {self.pool_timeout}s")
+        metrics.db_pool_wait.observe(time.perf_counter() - start)
+        with self._usage_lock:
+            self._in_use += 1
+        try:
+            conn = self._pool.getconn()
+            try:
+                with conn:
+                    yield conn
+            finally:
+                # Broken connections are dropped; the pool opens new ones on demand
+                self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            with self._usage_lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def _execute(self, conn, name, sql, params=()):
+        prepare, execute = _commands(name, sql)
+        cursor = conn.cursor()
+        if name not in conn.prepared:
+            # Prepared statements outlive the transaction, even a rolled back one
+            cursor.execute(prepare)
+            conn.prepared.add(name)
+        with metrics.db_query_latency.time(name):
+            cursor.execute(execute, params)
+        return cursor
+
+    def _fetch_all(self, name, params=()):
+        with self._connection() as conn:
+            rows = self._execute(conn, name, STATEMENTS[name], params).fetchall()
+        return [_row_transaction(row) for row in rows]
+
+    def _fetch_one(self, name, params):
+        with self._connection() as conn:
+            row = self._execute(conn, name, STATEMENTS[name], params).fetchone()
+        return _row_transaction(row) if row else None
+
+    def create_transaction(self, user_id, currency, chat_id=None, deposit_address=None, deposit_index=None):
+        transaction = Transaction(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            currency=currency,
+            status=TransactionStatus.CREATED,
+            created_at=datetime.now(),
+            chat_id=chat_id,
+            deposit_address=deposit_address,
+            deposit_index=deposit_index
+        )
+        self.save_transaction(transaction)
+        return transaction
+
+    def get_user_transactions(self, user_id, active_only=True):
+        """Transactions the user takes part in, newest first."""
+        name = 'select_active_by_participant' if active_only else 'select_by_participant'
+        return self._fetch_all(name, (user_id,))
+
+    def get_user_transaction(self, user_id):
+        """The user's newest active transaction, else their newest one."""
+        transactions = self.get_user_transactions(user_id, active_only=False)
+        return next((t for t in transactions if t.is_active()), transactions[0] if transactions else None)
+
+    def get_transaction(self, transaction_id):
+        return self._fetch_one('select_by_id', (transaction_id,))
+
+    def all_transactions(self):
+        return self._fetch_all('select_all')
+
+    def get_transactions_by_status(self, status, created_before=None, limit=None):
+        return self._fetch_all('select_by_status', (status.value, created_before or datetime.max, limit))
+
+    def get_transactions_by_address(self, address):
+        return self._fetch_all('select_by_address', (address,))
+
+    def get_transaction_by_deposit_address(self, address):
+        return self._fetch_one('select_by_deposit_address', (address,))
+
+    def get_transactions_by_deposit_addresses(self, addresses):
+        """Transactions owning any of the derived deposit addresses, in one query."""
+        return self._fetch_all('select_by_deposit_addresses', (list(addresses),))
+
+    def get_transaction_by_outpoint(self, outpoint):
+        return self._fetch_one('select_by_outpoint', (outpoint,))
+
+    def get_chain_cursor(self, currency):
+        """Block height the deposit watcher resumes from, None before its first poll."""
+        with self._connection() as conn:
+            row = self._execute(
+                conn, 'select_counter', STATEMENTS['select_counter'], (f"chain_cursor:{currency}",)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_chain_cursor(self, currency, height):
+        with self._connection() as conn:
+            self._execute(conn, 'set_counter', STATEMENTS['set_counter'], (f"chain_cursor:{currency}", height))
+
+    def reserve_deposit_indexes(self, currency, count):
+        """Claim count consecutive unused derivation indexes; returns the first."""
+        with self._connection() as conn:
+            (end,) = self._execute(
+                conn, 'advance_counter', STATEMENTS['advance_counter'], (f"deposit_index:{currency}", count)
+            ).fetchone()
+        return end - count
+
+    def get_expired_transactions(self, started_before, limit):
+        """Oldest sweepable transactions whose timeout started before the cutoff."""
+        return self._fetch_all('select_expired', (started_before, limit))
+
+    def save_transaction(self, transaction):
+        """Persist changes made to a transaction returned by this storage."""
+        with self._connection() as conn:
+            self._execute(conn, 'insert_transaction', STATEMENTS['insert_transaction'], _transaction_row(transaction))
+
+    def save_transactions(self, transactions):
+        with self._connection() as conn:
+            for transaction in transactions:
+                self._execute(conn, 'insert_transaction', STATEMENTS['insert_transaction'], _transaction_row(transaction))
+
+    def _transition(self, conn, transaction_id, expected, new, changes):
+        if new in FINAL_STATUSES:
+            changes = {'finished_at': datetime.now(), **changes}
+        fields = tuple(sorted(changes))
+        name, sql = _transition_statement(fields)
+        params = (new.value, *(changes[f] for f in fields), transaction_id, expected.value)
+        # Status check, write and re-read are one statement, so concurrent
+        # writers cannot both succeed
+        row = self._execute(conn, name, sql, params).fetchone()
+        return _row_transaction(row) if row else None
+
+    def transition(self, transaction_id, expected, new, **changes):
+        """Move a transaction from the expected status to a new one, atomically.
+
+        Returns the updated transaction, or None if the move is illegal or the
+        status is no longer the expected one.
+        """
+        if not can_transition(expected, new):
+            return None
+        if not TRANSITION_FIELDS.issuperset(changes):
+            raise ValueError(f"Fields cannot change in a transition: {set(changes) - TRANSITION_FIELDS}")
+        with self._connection() as conn:
+            return self._transition(conn, transaction_id, expected, new, changes)
+
+    def transition_many(self, moves):
+        """Apply (transaction_id, expected, new) moves; return the transactions that changed."""
+        changed = []
+        with self._connection() as conn:
+            for transaction_id, expected, new in moves:
+                if can_transition(expected, new):
+                    transaction = self._transition(conn, transaction_id, expected, new, {})
+                    if transaction is not None:
+                        changed.append(transaction)
+        return changed
+
+    def archive_finished(self, finished_before, limit):
+        """Rows already live on disk, so nothing is moved out of memory."""
+        return []
+
+    def mark_as_funded(self, user_id):
+        transaction = self.get_user_transaction(user_id)
+        if transaction:
+            self.transition(transaction.id, transaction.status, TransactionStatus.FUNDED)
+
+    def add_review(self, review):
+        """Buffer a review; False if its author already reviewed the deal.
+
+        Two reviews racing from different workers both pass this check; the
+        unique index keeps one when the batch is written.
+        """
+        key = (review.transaction_id, review.user_id)
+        with self._batch_lock:
+            pending = any((r.transaction_id, r.user_id) == key for r in self._reviews)
+        if pending:
+            return False
+        with self._connection() as conn:
+            if self._execute(conn, 'select_review_exists', STATEMENTS['select_review_exists'], key).fetchone():
+                return False
+        self._buffer(self._reviews, review)
+        return True
+
+    def add_report(self, report):
+        self._buffer(self._reports, report)
+
+    def get_reputation(self, user_id):
+        """Aggregated reviews and reports about a user; batched events land within batch_interval."""
+        with self._connection() as conn:
+            row = self._execute(conn, 'select_reputation', STATEMENTS['select_reputation'], (user_id,)).fetchone()
+        return Reputation(*row) if row else Reputation(user_id)
+
+    def _buffer(self, rows, row):
+        with self._batch_lock:
+            rows.append(row)
+            full = len(rows) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _flush_loop(self):
+        while not self._closing:
+            self._wake.wait(self.batch_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self, final=False):
+        """Write buffered reviews and reports, one multi-row INSERT per table.
+
+        A failed batch is retried on its own, with exponential backoff, up
+        to flush_retries times and then written to the dead-letter log, so
+        a row Postgres rejects cannot hold up every later batch. On close
+        (final) nothing is retried: whatever fails goes to the log at once.
+        """
+        with self._batch_lock:
+            reviews, self._reviews = self._reviews, []
+            reports, self._reports = self._reports, []
+        now = time.monotonic()
+        batches, self._retries = self._retries, []
+        if reviews or reports:
+            batches.append([reviews, reports, 0, now])
+        for batch in batches:
+            reviews, reports, attempts, retry_at = batch
+            if retry_at > now and not final:
+                self._retries.append(batch)
+                continue
+            try:
+                self._write_events(reviews, reports)
+            except (psycopg2.Error, ValueError) as e:  # ValueError: text psycopg2 cannot send, e.g. NUL
+                attempts += 1
+                if final or attempts > self.flush_retries:
+                    logger.error(
+                        "Writing %d reviews and %d reports failed %d times, dead-lettering them: %s",
+                        len(reviews), len(reports), attempts, e
+                    )
+                    self._dead_letter(reviews, reports, e)
+                else:
+                    delay = self.batch_interval * 2 ** attempts
+                    logger.warning(
+                        "Writing %d reviews and %d reports failed, retrying in %.1fs: %s",
+                        len(reviews), len(reports), delay, e
+                    )
+                    self._retries.append([reviews, reports, attempts, now + delay])
+
+    def _write_events(self, reviews, reports):
+        review_rows = [
+            (r.transaction_id, r.user_id, r.message, r.created_at, r.rating, r.subject_id) for r in reviews
+        ]
+        report_rows = [(r.user_id, r.message, r.created_at, r.resolved, r.subject_id) for r in reports]
+        # Rows and aggregates commit together, so a retry never double counts
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            inserted = set()
+            if review_rows:
+                with metrics.db_query_latency.time('insert_reviews'):
+                    inserted = set(extras.execute_values(
+                        cursor, INSERT_REVIEWS, review_rows, page_size=self.batch_size, fetch=True
+                    ))
+            if report_rows:
+                with metrics.db_query_latency.time('insert_reports'):
+                    extras.execute_values(cursor, INSERT_REPORTS, report_rows, page_size=self.batch_size)
+            events = []
+            for r in reviews:
+                key = (r.transaction_id, r.user_id)
+                # A repeat within the batch is skipped along with the rows already stored
+                if key in inserted:
+                    inserted.discard(key)
+                    if r.subject_id is not None:
+                        events.append((r.subject_id, r.created_at, review_delta(r)))
+            events += [(r.subject_id, r.created_at, report_delta(r)) for r in reports if r.subject_id is not None]
+            reputation_rows = [
+                (r.user_id, r.reviews, r.ratings, r.rating_sum, r.reports,
+                 r.recent_ratings, r.recent_rating_sum, r.recent_reports, r.updated_at)
+                for r in merge_deltas(events)
+            ]
+            if reputation_rows:
+                with metrics.db_query_latency.time('upsert_reputations'):
+                    extras.execute_values(cursor, UPSERT_REPUTATIONS, reputation_rows, page_size=self.batch_size)
+
+    def _dead_letter(self, reviews, reports, error):
+        """Append rows that could not be written as JSON lines, for an operator to replay."""
+        for table, rows in (('reviews', reviews), ('reports', reports)):
+            if rows:
+                metrics.dead_letter_rows.inc(table, amount=len(rows))
+        if self.dead_letter_path is None:
+            return
+        failed_at = datetime.now().isoformat()
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            for table, rows in (('reviews', reviews), ('reports', reports)):
+                for row in rows:
+                    f.write(json.dumps({
+                        'failed_at': failed_at, 'error': str(error).strip(), 'table': table, 'row': asdict(row),
+                    }, default=datetime.isoformat, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _page(self, table, columns, after, limit, filters):
+        present = tuple(name for name, value in filters.items() if value is not None)
+        params = list(after) if after is not None else []
+        params += [filters[name] for name in present]
+        params.append(limit)
+        name, sql = _page_statement(table, columns, after is not None, present)
+        with self._connection() as conn:
+            return self._execute(conn, name, sql, params).fetchall()
+
+    def page_transactions(self, after=None, limit=1000, status=None, currency=None,
+                          created_from=None, created_to=None):
+        """Up to limit transactions ordered by (created_at, id), starting after the key after."""
+        rows = self._page('transactions', TRANSACTION_COLUMNS, after, limit, {
+            'status': status.value if status is not None else None, 'currency': currency,
+            'created_from': created_from, 'created_to': created_to,
+        })
+        return [_row_transaction(row) for row in rows]
+
+    def page_reviews(self, after=None, limit=1000, created_from=None, created_to=None):
+        """Up to limit (id, review) pairs ordered by (created_at, id), starting after the key after."""
+        rows = self._page('reviews', REVIEW_COLUMNS, after, limit, {'created_from': created_from, 'created_to': created_to})
+        return [(row[0], Review(*row[1:])) for row in rows]
+
+    def page_reports(self, after=None, limit=1000, created_from=None, created_to=None):
+        """Up to limit (id, report) pairs ordered by (created_at, id), starting after the key after."""
+        rows = self._page('reports', REPORT_COLUMNS, after, limit, {'created_from': created_from, 'created_to': created_to})
+        return [(row[0], Report(*row[1:])) for row in rows]
+
+    def reset_transaction(self, user_id, transaction_id=None):
+        """Cancel a transaction created by the user (their newest active one by default).
+
+        Only a deal that has not been funded can be reset, and the move to
+        CANCELLED is a compare and set, so it never races a release, a refund
+        or a deposit; returns None if there is nothing that may be reset.
+        """
+        if transaction_id is None:
+            created = (t for t in self.get_user_transactions(user_id) if t.user_id == user_id)
+            transaction = next(created, None)
+        else:
+            transaction = self.get_transaction(transaction_id)
+        if transaction is None or transaction.user_id != user_id or transaction.status not in RESETTABLE_STATUSES:
+            return None
+        return self.transition(transaction.id, transaction.status, TransactionStatus.CANCELLED)
+
+    def acquire_lease(self, name, holder, ttl):
+        """Take or renew a named lease shared by every process using this database."""
+        with self._connection() as conn:
+            return self._execute(conn, 'acquire_lease', STATEMENTS['acquire_lease'], (name, holder, ttl)).rowcount == 1
+
+    def release_lease(self, name, holder):
+        with self._connection() as conn:
+            self._execute(conn, 'release_lease', STATEMENTS['release_lease'], (name, holder))
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._wake.set()
+        self._flusher.join()
+        self.flush(final=True)
+        self._pool.closeall()
@@ -0,0 +1,193 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+import httpx
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.ext import BaseRateLimiter
+import metrics
+from config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_PRIVATE_CHAT_RATE, TELEGRAM_GROUP_CHAT_RATE,
+    TELEGRAM_MAX_RETRIES, TELEGRAM_RETRY_BASE_DELAY, TELEGRAM_RETRY_MAX_DELAY,
+    TELEGRAM_MAX_RETRY_AFTER
+)
+
+logger = logging.getLogger(__name__)
+
+# Lower value = served first when the global budget is contended
+PRIORITY_TRANSACTIONAL = 0
+PRIORITY_NORMAL = 1
+PRIORITY_COSMETIC = 2
+
+COSMETIC_ENDPOINTS = {
+    'setMyName', 'setMyDescription', 'setMyShortDescription', 'setMyCommands',
+    'setChatPhoto', 'setChatTitle', 'setChatDescription', 'deleteMyCommands',
+}
+# Endpoints that count against Telegram's message limits
+MESSAGE_PREFIXES = ('send', 'edit', 'copyMessage', 'forwardMessage')
+# Endpoints that are safe to repeat even if the first call may have reached Telegram
+IDEMPOTENT_PREFIXES = ('get', 'set')
+# Transport failures that mean the request never left: retrying cannot duplicate it
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def peek(self):
+        """Return 0 if a token is available, else the seconds to wait; consumes nothing."""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Consume a token; return 0, or the seconds to wait if none is available."""
+        delay = self.peek()
+        if delay == 0:
+            self.tokens -= 1
+        return delay
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def idle(self):
+        return self.tokens >= self.capacity and time.monotonic() >= self.blocked_until
+
+class OutboundScheduler(BaseRateLimiter):
+    """Central scheduler for every Bot API call made through the application.
+
+    Sends are throttled by a global token bucket and a bucket per chat. When
+    the global budget is contended, waiters are served in priority order, so
+    transactional replies overtake cosmetic calls such as profile updates.
+    RetryAfter is honoured exactly. Network errors are retried with jittered
+    exponential backoff only when repeating the call is safe: the request
+    never reached Telegram, or the endpoint is idempotent. A message send
+    that timed out may have been delivered, so it is never sent again.
+    """
+
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, private_rate=TELEGRAM_PRIVATE_CHAT_RATE,
+                 group_rate=TELEGRAM_GROUP_CHAT_RATE, max_retries=TELEGRAM_MAX_RETRIES):
+        self.global_bucket = TokenBucket(*global_rate)
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._chat_buckets.clear()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                # Full buckets carry no state worth keeping
+                self._chat_buckets = {k: b for k, b in self._chat_buckets.items() if not b.idle()}
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = self._chat_buckets[chat_id] = TokenBucket(*(self.group_rate if is_group else self.private_rate))
+        return bucket
+
+    @staticmethod
+    def priority_for(endpoint, rate_limit_args):
+        if rate_limit_args and 'priority' in rate_limit_args:
+            return rate_limit_args['priority']
+        if endpoint in COSMETIC_ENDPOINTS:
+            return PRIORITY_COSMETIC
+        if endpoint.startswith(MESSAGE_PREFIXES):
+            return PRIORITY_TRANSACTIONAL
+        return PRIORITY_NORMAL
+
+    def _wake_head(self):
+        if self._waiters:
+            self._waiters[0][2].set()
+
+    async def _acquire_global(self, priority):
+        # Only the head of the queue polls the bucket; the rest sleep until
+        # they become the head, and each hand-over wakes exactly that waiter
+        entry = (priority, next(self._sequence), asyncio.Event())
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                delay = None
+                if self._waiters[0] is entry:
+                    delay = self.global_bucket.take()
+                    if delay == 0:
+                        heapq.heappop(self._waiters)
+                        self._wake_head()
+                        return
+                entry[2].clear()
+                try:
+                    await asyncio.wait_for(entry[2].wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if entry in self._waiters:
+                was_head = self._waiters[0] is entry
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                if was_head:
+                    self._wake_head()
+            raise
+
+    async def _acquire_chat(self, chat_id):
+        bucket = self._chat_bucket(chat_id)
+        while True:
+            delay = bucket.take()
+            if delay == 0:
+                return
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def retryable(endpoint, error):
+        """Whether a call that failed with a network error may be repeated."""
+        if isinstance(error.__cause__, UNSENT_ERRORS):
+            return True
+        return endpoint.startswith(IDEMPOTENT_PREFIXES)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        priority = self.priority_for(endpoint, rate_limit_args)
+        limited = endpoint.startswith(MESSAGE_PREFIXES) or priority == PRIORITY_COSMETIC
+
+        for attempt in range(self.max_retries + 1):
+            if limited:
+                if chat_id is not None:
+                    await self._acquire_chat(chat_id)
+                await self._acquire_global(priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if hasattr(retry_after, 'total_seconds'):
+                    retry_after = retry_after.total_seconds()
+                bucket = self._chat_bucket(chat_id) if chat_id is not None else self.global_bucket
+                bucket.block(retry_after)
+                if attempt == self.max_retries or retry_after > TELEGRAM_MAX_RETRY_AFTER:
+                    raise
+                logger.warning("Flood control on %s: retrying in %.1fs", endpoint, retry_after)
+                await asyncio.sleep(retry_after)
+            except BadRequest:
+                raise
+            except NetworkError as e:
+                # Includes TimedOut, after which a send may already have been delivered
+                if attempt == self.max_retries or not self.retryable(endpoint, e):
+                    raise
+                delay = random.uniform(0, min(TELEGRAM_RETRY_MAX_DELAY, TELEGRAM_RETRY_BASE_DELAY * 2 ** attempt))
+                logger.warning("%s failed (%s): retry %d in %.2fs", endpoint, e, attempt + 1, delay)
+                await asyncio.sleep(delay)
+            metrics.telegram_api_retries.inc(endpoint)
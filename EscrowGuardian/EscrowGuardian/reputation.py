@@ -0,0 +1,77 @@
+from datetime import datetime
+from models import Reputation
+from config import (
+    REPUTATION_HALF_LIFE_DAYS, REPUTATION_WARN_REPORTS, REPUTATION_WARN_AVERAGE, REPUTATION_MIN_RATINGS
+)
+
+# Aggregates are folded forward one event at a time, by the in-memory
+# storage here and by an UPSERT in the SQL backends, so reading a user's
+# reputation is a single lookup however many reviews they have.
+
+HALF_LIFE_SECONDS = REPUTATION_HALF_LIFE_DAYS * 86400
+RATING_RANGE = range(1, 6)
+
+# ======================== AGGREGATION ========================
+
+def decay(value, elapsed):
+    """A decayed sum elapsed seconds later; time running backwards counts as none."""
+    if not value or elapsed <= 0:
+        return value
+    return value * 0.5 ** (elapsed / HALF_LIFE_SECONDS)
+
+def review_delta(review):
+    """Aggregate increments a review adds to its subject."""
+    rated = review.rating is not None
+    return {'reviews': 1, 'ratings': int(rated), 'rating_sum': review.rating if rated else 0, 'reports': 0}
+
+def report_delta(report):
+    return {'reviews': 0, 'ratings': 0, 'rating_sum': 0, 'reports': 1}
+
+def merge_deltas(events):
+    """Fold (subject_id, at, delta) events into one Reputation per subject, e.g. for a batched UPSERT."""
+    merged = {}
+    for subject_id, at, delta in sorted(events, key=lambda event: event[1]):
+        reputation = merged.get(subject_id)
+        if reputation is None:
+            reputation = merged[subject_id] = Reputation(subject_id)
+        apply_delta(reputation, at, delta)
+    return list(merged.values())
+
+def apply_delta(reputation, at, delta):
+    """Fold one event into an aggregate in place."""
+    elapsed = (at - reputation.updated_at).total_seconds() if reputation.updated_at else 0
+    reputation.recent_ratings = decay(reputation.recent_ratings, elapsed) + delta['ratings']
+    reputation.recent_rating_sum = decay(reputation.recent_rating_sum, elapsed) + delta['rating_sum']
+    reputation.recent_reports = decay(reputation.recent_reports, elapsed) + delta['reports']
+    reputation.reviews += delta['reviews']
+    reputation.ratings += delta['ratings']
+    reputation.rating_sum += delta['rating_sum']
+    reputation.reports += delta['reports']
+    if reputation.updated_at is None or at > reputation.updated_at:
+        reputation.updated_at = at
+
+# ======================== READING ========================
+
+def average(reputation):
+    return reputation.rating_sum / reputation.ratings if reputation.ratings else None
+
+def recent(reputation, now=None):
+    """(recent average rating or None, decayed report weight) as of now."""
+    if reputation.updated_at is None:
+        return None, 0.0
+    elapsed = ((now or datetime.now()) - reputation.updated_at).total_seconds()
+    weight = decay(reputation.recent_ratings, elapsed)
+    # Both sums decay alike, so their ratio is the recency-weighted average
+    recent_average = reputation.recent_rating_sum / reputation.recent_ratings if weight >= 0.5 else None
+    return recent_average, decay(reputation.recent_reports, elapsed)
+
+def is_risky(reputation, now=None):
+    """Whether a counterparty deserves a warning before funds move."""
+    recent_average, recent_reports = recent(reputation, now)
+    if recent_reports >= REPUTATION_WARN_REPORTS:
+        return True
+    return (
+        reputation.ratings >= REPUTATION_MIN_RATINGS
+        and recent_average is not None
+        and recent_average < REPUTATION_WARN_AVERAGE
+    )
@@ -0,0 +1,564 @@
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from reputation import decay, review_delta, report_delta
+from models import (
+    Transaction, Review, Report, Reputation, TransactionStatus, SWEEPABLE_STATUSES, FINAL_STATUSES, RESETTABLE_STATUSES,
+    TRANSITION_FIELDS, can_transition
+)
+
+SWEEPABLE_SQL = ", ".join(f"'{status.value}'" for status in SWEEPABLE_STATUSES)
+FINAL_SQL = ", ".join(f"'{status.value}'" for status in FINAL_STATUSES)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    currency TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    buyer_id INTEGER,
+    seller_id INTEGER,
+    buyer_address TEXT,
+    seller_address TEXT,
+    amount INTEGER,
+    funded_at REAL,
+    chat_id INTEGER,
+    deposit_address TEXT,
+    deposit_index INTEGER,
+    funding_outpoint TEXT,
+    rejected_outpoint TEXT,
+    rejected_amount INTEGER,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_user ON transactions (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_buyer ON transactions (buyer_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_seller ON transactions (seller_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions (created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_buyer_address ON transactions (buyer_address);
+CREATE INDEX IF NOT EXISTS idx_transactions_seller_address ON transactions (seller_address);
+CREATE INDEX IF NOT EXISTS idx_transactions_deposit_address ON transactions (deposit_address);
+-- A payment funds at most one deal, whichever process or restart sees it
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_funding ON transactions (funding_outpoint);
+-- Open deals by when their timeout started: funding, else creation
+CREATE INDEX IF NOT EXISTS idx_transactions_expiry ON transactions (COALESCE(funded_at, created_at))
+    WHERE status IN ({sweepable});
+
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_id TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    rating INTEGER,
+    subject_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_reviews_transaction ON reviews (transaction_id);
+CREATE INDEX IF NOT EXISTS idx_reviews_subject ON reviews (subject_id);
+CREATE INDEX IF NOT EXISTS idx_reviews_created ON reviews (created_at, id);
+
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    resolved INTEGER NOT NULL DEFAULT 0,
+    subject_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_reports_user ON reports (user_id);
+CREATE INDEX IF NOT EXISTS idx_reports_subject ON reports (subject_id);
+CREATE INDEX IF NOT EXISTS idx_reports_created ON reports (created_at, id);
+
+CREATE TABLE IF NOT EXISTS reputations (
+    user_id INTEGER PRIMARY KEY,
+    reviews INTEGER NOT NULL,
+    ratings INTEGER NOT NULL,
+    rating_sum INTEGER NOT NULL,
+    reports INTEGER NOT NULL,
+    recent_ratings REAL NOT NULL,
+    recent_rating_sum REAL NOT NULL,
+    recent_reports REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+""".format(sweepable=SWEEPABLE_SQL)
+
+# Columns added after the first release, applied to existing databases on open
+MIGRATIONS = (
+    ("transactions", "chat_id", "INTEGER"),
+    ("transactions", "deposit_address", "TEXT"),
+    ("transactions", "deposit_index", "INTEGER"),
+    ("transactions", "funding_outpoint", "TEXT"),
+    ("transactions", "rejected_outpoint", "TEXT"),
+    ("transactions", "rejected_amount", "INTEGER"),
+    ("transactions", "finished_at", "REAL"),
+    ("reviews", "subject_id", "INTEGER"),
+    ("reports", "subject_id", "INTEGER"),
+)
+
+# Data rewrites applied once per database, in order; user_version counts those done
+DATA_MIGRATIONS = (
+    # Amounts were float coins; they are integer base units now
+    "UPDATE transactions SET amount = round(amount * 100000000) WHERE amount IS NOT NULL",
+    # One review per author and deal: repeats are dropped, the first one stays
+    "DELETE FROM reviews WHERE id NOT IN (SELECT MIN(id) FROM reviews GROUP BY transaction_id, user_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_reviews_author ON reviews (transaction_id, user_id)",
+    # Replaced by idx_transactions_expiry once funded deals timed out from funding
+    "DROP INDEX IF EXISTS idx_transactions_open",
+)
+
+# Statements are kept as module constants so sqlite3's per-connection
+# statement cache always hits and each query is prepared only once.
+TRANSACTION_COLUMNS = (
+    "id, user_id, currency, status, created_at, buyer_id, seller_id, "
+    "buyer_address, seller_address, amount, funded_at, chat_id, deposit_address, deposit_index, funding_outpoint, "
+    "rejected_outpoint, rejected_amount, finished_at"
+)
+# An upsert rather than INSERT OR REPLACE, which would silently delete
+# another row holding the same funding outpoint
+INSERT_TRANSACTION = (
+    f"INSERT INTO transactions ({TRANSACTION_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET "
+    + ", ".join(f"{column} = excluded.{column}" for column in TRANSACTION_COLUMNS.split(", ")[1:])
+)
+SELECT_BY_ID = f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE id = ?"
+# Each branch of the compound select is served by its own participant index
+SELECT_BY_PARTICIPANT = (
+    f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE user_id = ? "
+    f"UNION SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE buyer_id = ? "
+    f"UNION SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE seller_id = ? "
+    f"ORDER BY created_at DESC"
+)
+SELECT_ACTIVE_BY_PARTICIPANT = (
+    f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE user_id = ? AND status NOT IN ({FINAL_SQL}) "
+    f"UNION SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE buyer_id = ? AND status NOT IN ({FINAL_SQL}) "
+    f"UNION SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE seller_id = ? AND status NOT IN ({FINAL_SQL}) "
+    f"ORDER BY created_at DESC"
+)
+SELECT_ALL = f"SELECT {TRANSACTION_COLUMNS} FROM transactions"
+SELECT_BY_STATUS = f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE status = ? AND created_at < ? ORDER BY created_at LIMIT ?"
+# Matches idx_transactions_expiry exactly; the sweep is an ordered range scan on the partial index
+SELECT_EXPIRED = (
+    f"SELECT {TRANSACTION_COLUMNS} FROM transactions INDEXED BY idx_transactions_expiry "
+    f"WHERE status IN ({SWEEPABLE_SQL}) AND COALESCE(funded_at, created_at) < ? "
+    f"ORDER BY COALESCE(funded_at, created_at) LIMIT ?"
+)
+SELECT_BY_ADDRESS = (
+    f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE buyer_address = ? "
+    f"UNION SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE seller_address = ?"
+)
+SELECT_BY_DEPOSIT_ADDRESS = f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE deposit_address = ?"
+# Block scans look up thousands of addresses at once; short batches are
+# padded with NULLs, which match nothing, so one statement serves them all
+DEPOSIT_ADDRESS_BATCH = 500
+SELECT_BY_DEPOSIT_ADDRESSES = (
+    f"SELECT {TRANSACTION_COLUMNS} FROM transactions "
+    f"WHERE deposit_address IN ({', '.join('?' * DEPOSIT_ADDRESS_BATCH)})"
+)
+SELECT_BY_OUTPOINT = f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE funding_outpoint = ?"
+TRANSITION = "UPDATE transactions SET status = ? WHERE id = ? AND status = ?"
+# Takes the lease if free, expired or already ours; rowcount is 0 otherwise
+ACQUIRE_LEASE = (
+    "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+    "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+    "WHERE leases.holder = excluded.holder OR leases.expires_at < ?"
+)
+RELEASE_LEASE = "DELETE FROM leases WHERE name = ? AND holder = ?"
+# Advances a counter and returns its new value in one statement, so processes
+# sharing the database never claim the same range
+ADVANCE_COUNTER = (
+    "INSERT INTO counters (name, value) VALUES (?, ?) "
+    "ON CONFLICT(name) DO UPDATE SET value = counters.value + excluded.value RETURNING value"
+)
+SELECT_COUNTER = "SELECT value FROM counters WHERE name = ?"
+SET_COUNTER = "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value"
+INSERT_REVIEW = (
+    "INSERT INTO reviews (transaction_id, user_id, message, created_at, rating, subject_id) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(transaction_id, user_id) DO NOTHING"
+)
+INSERT_REPORT = "INSERT INTO reports (user_id, message, created_at, resolved, subject_id) VALUES (?, ?, ?, ?, ?)"
+REPUTATION_COLUMNS = (
+    "user_id, reviews, ratings, rating_sum, reports, "
+    "recent_ratings, recent_rating_sum, recent_reports, updated_at"
+)
+# Folds one event into the aggregate in the same statement that reads it;
+# decay() is registered on every connection
+ADD_REPUTATION = (
+    f"INSERT INTO reputations ({REPUTATION_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET "
+    "reviews = reviews + excluded.reviews, ratings = ratings + excluded.ratings, "
+    "rating_sum = rating_sum + excluded.rating_sum, reports = reports + excluded.reports, "
+    "recent_ratings = decay(recent_ratings, excluded.updated_at - updated_at) + excluded.recent_ratings, "
+    "recent_rating_sum = decay(recent_rating_sum, excluded.updated_at - updated_at) + excluded.recent_rating_sum, "
+    "recent_reports = decay(recent_reports, excluded.updated_at - updated_at) + excluded.recent_reports, "
+    "updated_at = max(updated_at, excluded.updated_at)"
+)
+SELECT_REPUTATION = f"SELECT {REPUTATION_COLUMNS} FROM reputations WHERE user_id = ?"
+REVIEW_COLUMNS = "id, transaction_id, user_id, message, created_at, rating, subject_id"
+REPORT_COLUMNS = "id, user_id, message, created_at, resolved, subject_id"
+# Exports page by (created_at, id): resuming after the last row seen is an
+# index range scan however deep into the table the export has got
+PAGE_AFTER = "created_at >= ? AND (created_at > ? OR id > ?)"
+PAGE_FILTERS = {
+    'status': "status = ?",
+    'currency': "currency = ?",
+    'created_from': "created_at >= ?",
+    'created_to': "created_at < ?",
+}
+
+def _to_timestamp(value):
+    return value.timestamp() if value is not None else None
+
+def _from_timestamp(value):
+    return datetime.fromtimestamp(value) if value is not None else None
+
+@lru_cache(maxsize=None)
+def _transition_sql(fields):
+    """Conditional UPDATE that also sets the given columns; one statement per field set."""
+    if not fields:
+        return TRANSITION
+    assignments = ''.join(f", {field} = ?" for field in fields)
+    return f"UPDATE transactions SET status = ?{assignments} WHERE id = ? AND status = ?"
+
+@lru_cache(maxsize=None)
+def _page_sql(table, columns, keyed, filters):
+    """One keyset page of a table; one statement per combination of filters."""
+    conditions = ([PAGE_AFTER] if keyed else []) + [PAGE_FILTERS[name] for name in filters]
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT {columns} FROM {table}{where} ORDER BY created_at, id LIMIT ?"
+
+def _column_value(value):
+    return _to_timestamp(value) if isinstance(value, datetime) else value
+
+def _transaction_row(transaction):
+    return (
+        transaction.id,
+        transaction.user_id,
+        transaction.currency,
+        transaction.status.value,
+        _to_timestamp(transaction.created_at),
+        transaction.buyer_id,
+        transaction.seller_id,
+        transaction.buyer_address,
+        transaction.seller_address,
+        transaction.amount,
+        _to_timestamp(transaction.funded_at),
+        transaction.chat_id,
+        transaction.deposit_address,
+        transaction.deposit_index,
+        transaction.funding_outpoint,
+        transaction.rejected_outpoint,
+        transaction.rejected_amount,
+        _to_timestamp(transaction.finished_at),
+    )
+
+def _row_transaction(row):
+    return Transaction(
+        id=row[0],
+        user_id=row[1],
+        currency=row[2],
+        status=TransactionStatus(row[3]),
+        created_at=_from_timestamp(row[4]),
+        buyer_id=row[5],
+        seller_id=row[6],
+        buyer_address=row[7],
+        seller_address=row[8],
+        # Databases upgraded from float coins keep a REAL column
+        amount=None if row[9] is None else int(row[9]),
+        funded_at=_from_timestamp(row[10]),
+        chat_id=row[11],
+        deposit_address=row[12],
+        deposit_index=row[13],
+        funding_outpoint=row[14],
+        rejected_outpoint=row[15],
+        rejected_amount=row[16],
+        finished_at=_from_timestamp(row[17]),
+    )
+
+class SQLiteStorage:
+    """Durable SQLite storage exposing the same API as the in-memory Storage."""
+
+    def __init__(self, path, busy_timeout=10):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        with self._connection() as conn:
+            self._migrate(conn)
+            conn.executescript(SCHEMA)
+        self._upgrade(self._connection())
+
+    def _connection(self):
+        # One connection per thread: the bot loop and the Flask thread never
+        # share a cursor, and WAL lets their readers run concurrently. Cluster
+        # workers in other processes wait up to busy_timeout for the write lock.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, cached_statements=128)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.create_function("decay", 2, decay, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self, conn):
+        for table, column, column_type in MIGRATIONS:
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if columns and column not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def _upgrade(self, conn):
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= len(DATA_MIGRATIONS):
+            return
+        # Re-read under the write lock, so of several processes opening an old
+        # database only the first rewrites it
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for statement in DATA_MIGRATIONS[version:]:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {len(DATA_MIGRATIONS)}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _fetch_all(self, sql, params):
+        rows = self._connection().execute(sql, params).fetchall()
+        return [_row_transaction(row) for row in rows]
+
+    def _fetch_one(self, sql, params):
+        row = self._connection().execute(sql, params).fetchone()
+        return _row_transaction(row) if row else None
+
+    def create_transaction(self, user_id, currency, chat_id=None, deposit_address=None, deposit_index=None):
+        transaction = Transaction(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            currency=currency,
+            status=TransactionStatus.CREATED,
+            created_at=datetime.now(),
+            chat_id=chat_id,
+            deposit_address=deposit_address,
+            deposit_index=deposit_index
+        )
+        self.save_transaction(transaction)
+        return transaction
+
+    def get_user_transactions(self, user_id, active_only=True):
+        """Transactions the user takes part in, newest first."""
+        sql = SELECT_ACTIVE_BY_PARTICIPANT if active_only else SELECT_BY_PARTICIPANT
+        return self._fetch_all(sql, (user_id, user_id, user_id))
+
+    def get_user_transaction(self, user_id):
+        """The user's newest active transaction, else their newest one."""
+        transactions = self.get_user_transactions(user_id, active_only=False)
+        return next((t for t in transactions if t.is_active()), transactions[0] if transactions else None)
+
+    def get_transaction(self, transaction_id):
+        return self._fetch_one(SELECT_BY_ID, (transaction_id,))
+
+    def all_transactions(self):
+        return self._fetch_all(SELECT_ALL, ())
+
+    def get_transactions_by_status(self, status, created_before=None, limit=None):
+        before = _to_timestamp(created_before) if created_before else float('inf')
+        return self._fetch_all(SELECT_BY_STATUS, (status.value, before, limit if limit is not None else -1))
+
+    def get_transactions_by_address(self, address):
+        return self._fetch_all(SELECT_BY_ADDRESS, (address, address))
+
+    def get_transaction_by_deposit_address(self, address):
+        return self._fetch_one(SELECT_BY_DEPOSIT_ADDRESS, (address,))
+
+    def get_transactions_by_deposit_addresses(self, addresses):
+        """Transactions owning any of the derived deposit addresses."""
+        addresses = list(addresses)
+        found = []
+        for start in range(0, len(addresses), DEPOSIT_ADDRESS_BATCH):
+            batch = addresses[start:start + DEPOSIT_ADDRESS_BATCH]
+            batch += [None] * (DEPOSIT_ADDRESS_BATCH - len(batch))
+            found.extend(self._fetch_all(SELECT_BY_DEPOSIT_ADDRESSES, batch))
+        return found
+
+    def get_transaction_by_outpoint(self, outpoint):
+        return self._fetch_one(SELECT_BY_OUTPOINT, (outpoint,))
+
+    def get_chain_cursor(self, currency):
+        """Block height the deposit watcher resumes from, None before its first poll."""
+        row = self._connection().execute(SELECT_COUNTER, (f"chain_cursor:{currency}",)).fetchone()
+        return row[0] if row else None
+
+    def set_chain_cursor(self, currency, height):
+        with self._connection() as conn:
+            conn.execute(SET_COUNTER, (f"chain_cursor:{currency}", height))
+
+    def reserve_deposit_indexes(self, currency, count):
+        """Claim count consecutive unused derivation indexes; returns the first."""
+        with self._connection() as conn:
+            (end,) = conn.execute(ADVANCE_COUNTER, (f"deposit_index:{currency}", count)).fetchone()
+        return end - count
+
+    def get_expired_transactions(self, started_before, limit):
+        """Oldest sweepable transactions whose timeout started before the cutoff."""
+        return self._fetch_all(SELECT_EXPIRED, (_to_timestamp(started_before), limit))
+
+    def save_transaction(self, transaction):
+        """Persist changes made to a transaction returned by this storage."""
+        with self._connection() as conn:
+            conn.execute(INSERT_TRANSACTION, _transaction_row(transaction))
+
+    def save_transactions(self, transactions):
+        with self._connection() as conn:
+            conn.executemany(INSERT_TRANSACTION, [_transaction_row(t) for t in transactions])
+
+    def _transition(self, conn, transaction_id, expected, new, changes):
+        if new in FINAL_STATUSES:
+            changes = {'finished_at': datetime.now(), **changes}
+        fields = tuple(sorted(changes))
+        params = (new.value, *(_column_value(changes[f]) for f in fields), transaction_id, expected.value)
+        # The status check and the write are one statement, so concurrent
+        # writers on other connections cannot both succeed
+        return conn.execute(_transition_sql(fields), params).rowcount == 1
+
+    def transition(self, transaction_id, expected, new, **changes):
+        """Move a transaction from the expected status to a new one, atomically.
+
+        Returns the updated transaction, or None if the move is illegal or the
+        status is no longer the expected one.
+        """
+        if not can_transition(expected, new):
+            return None
+        if not TRANSITION_FIELDS.issuperset(changes):
+            raise ValueError(f"Fields cannot change in a transition: {set(changes) - TRANSITION_FIELDS}")
+        with self._connection() as conn:
+            if not self._transition(conn, transaction_id, expected, new, changes):
+                return None
+        return self.get_transaction(transaction_id)
+
+    def transition_many(self, moves):
+        """Apply (transaction_id, expected, new) moves; return the transactions that changed."""
+        changed = []
+        with self._connection() as conn:
+            for transaction_id, expected, new in moves:
+                if can_transition(expected, new) and self._transition(conn, transaction_id, expected, new, {}):
+                    changed.append(transaction_id)
+        return [self.get_transaction(transaction_id) for transaction_id in changed]
+
+    def archive_finished(self, finished_before, limit):
+        """Rows already live on disk, so nothing is moved out of memory."""
+        return []
+
+    def mark_as_funded(self, user_id):
+        transaction = self.get_user_transaction(user_id)
+        if transaction:
+            self.transition(transaction.id, transaction.status, TransactionStatus.FUNDED)
+
+    def add_review(self, review):
+        """Store a review; False if its author already reviewed the deal."""
+        with self._connection() as conn:
+            inserted = conn.execute(INSERT_REVIEW, (
+                review.transaction_id, review.user_id, review.message,
+                _to_timestamp(review.created_at), review.rating, review.subject_id
+            )).rowcount
+            if inserted:
+                self._add_reputation(conn, review.subject_id, review.created_at, review_delta(review))
+        return bool(inserted)
+
+    def add_report(self, report):
+        with self._connection() as conn:
+            conn.execute(INSERT_REPORT, (
+                report.user_id, report.message,
+                _to_timestamp(report.created_at), int(report.resolved), report.subject_id
+            ))
+            self._add_reputation(conn, report.subject_id, report.created_at, report_delta(report))
+
+    def _add_reputation(self, conn, user_id, at, delta):
+        if user_id is None:
+            return
+        conn.execute(ADD_REPUTATION, (
+            user_id, delta['reviews'], delta['ratings'], delta['rating_sum'], delta['reports'],
+            delta['ratings'], delta['rating_sum'], delta['reports'], _to_timestamp(at)
+        ))
+
+    def get_reputation(self, user_id):
+        """Aggregated reviews and reports about a user."""
+        row = self._connection().execute(SELECT_REPUTATION, (user_id,)).fetchone()
+        if row is None:
+            return Reputation(user_id)
+        return Reputation(*row[:8], updated_at=_from_timestamp(row[8]))
+
+    def _page(self, table, columns, after, limit, filters):
+        present = tuple(name for name, value in filters.items() if value is not None)
+        params = []
+        if after is not None:
+            created_at = _to_timestamp(after[0])
+            params += [created_at, created_at, after[1]]
+        params += [_column_value(filters[name]) for name in present]
+        params.append(limit)
+        return self._connection().execute(_page_sql(table, columns, after is not None, present), params).fetchall()
+
+    def page_transactions(self, after=None, limit=1000, status=None, currency=None,
+                          created_from=None, created_to=None):
+        """Up to limit transactions ordered by (created_at, id), starting after the key after."""
+        rows = self._page('transactions', TRANSACTION_COLUMNS, after, limit, {
+            'status': status.value if status is not None else None, 'currency': currency,
+            'created_from': created_from, 'created_to': created_to,
+        })
+        return [_row_transaction(row) for row in rows]
+
+    def page_reviews(self, after=None, limit=1000, created_from=None, created_to=None):
+        """Up to limit (id, review) pairs ordered by (created_at, id), starting after the key after."""
+        rows = self._page('reviews', REVIEW_COLUMNS, after, limit, {'created_from': created_from, 'created_to': created_to})
+        return [(row[0], Review(row[1], row[2], row[3], _from_timestamp(row[4]), row[5], row[6])) for row in rows]
+
+    def page_reports(self, after=None, limit=1000, created_from=None, created_to=None):
+        """Up to limit (id, report) pairs ordered by (created_at, id), starting after the key after."""
+        rows = self._page('reports', REPORT_COLUMNS, after, limit, {'created_from': created_from, 'created_to': created_to})
+        return [(row[0], Report(row[1], row[2], _from_timestamp(row[3]), bool(row[4]), row[5])) for row in rows]
+
+    def reset_transaction(self, user_id, transaction_id=None):
+        """Cancel a transaction created by the user (their newest active one by default).
+
+        Only a deal that has not been funded can be reset, and the move to
+        CANCELLED is a compare and set, so it never races a release, a refund
+        or a deposit; returns None if there is nothing that may be reset.
+        """
+        if transaction_id is None:
+            created = (t for t in self.get_user_transactions(user_id) if t.user_id == user_id)
+            transaction = next(created, None)
+        else:
+            transaction = self.get_transaction(transaction_id)
+        if transaction is None or transaction.user_id != user_id or transaction.status not in RESETTABLE_STATUSES:
+            return None
+        return self.transition(transaction.id, transaction.status, TransactionStatus.CANCELLED)
+
+    def acquire_lease(self, name, holder, ttl):
+        """Take or renew a named lease shared by every process using this database."""
+        now = time.time()
+        with self._connection() as conn:
+            return conn.execute(ACQUIRE_LEASE, (name, holder, now + ttl, now)).rowcount == 1
+
+    def release_lease(self, name, holder):
+        with self._connection() as conn:
+            conn.execute(RELEASE_LEASE, (name, holder))
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
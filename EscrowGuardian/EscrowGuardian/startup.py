@@ -0,0 +1,38 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class StartupTimer:
+    """Times startup phases from the first import of this module.
+
+    Import it before anything heavy so the first phase covers module
+    loading. Each phase is logged as it ends and kept for /metrics, along
+    with the time to the first update, to track cold starts across releases.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = {}
+        self.first_update = None
+
+    def phase(self, name):
+        """End the running phase and record it under name."""
+        now = time.perf_counter()
+        self.phases[name] = now - self._last
+        self._last = now
+        logger.info("Startup phase %s took %.3fs (%.3fs since start)", name, self.phases[name], now - self.started)
+
+    def update_received(self):
+        if self.first_update is None:
+            self.first_update = time.perf_counter() - self.started
+            logger.info("First update received %.3fs after start", self.first_update)
+
+    def samples(self):
+        samples = {(name,): round(seconds, 6) for name, seconds in self.phases.items()}
+        if self.first_update is not None:
+            samples[('first_update',)] = round(self.first_update, 6)
+        return samples
+
+startup = StartupTimer()
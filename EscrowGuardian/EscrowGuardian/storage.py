@@ -1,42 +1,530 @@
-from models import Transaction, Review, Report, TransactionStatus
+from models import (
+    Transaction, Review, Report, Reputation, TransactionStatus, SWEEPABLE_STATUSES, FINAL_STATUSES, RESETTABLE_STATUSES,
+    TRANSITION_FIELDS, can_transition
+)
+from config import (
+    STORAGE_BACKEND, SQLITE_PATH, SQLITE_BUSY_TIMEOUT, JOURNAL_ENABLED, JOURNAL_DIR, ARCHIVE_DIR, CHAIN_CURSOR_PATH,
+    POSTGRES_DSN, POSTGRES_POOL_SIZE, POSTGRES_POOL_TIMEOUT, POSTGRES_BATCH_INTERVAL, POSTGRES_BATCH_SIZE,
+    POSTGRES_FLUSH_RETRIES, POSTGRES_DEAD_LETTER_PATH
+)
+from metrics import InstrumentedStorage
+from reputation import apply_delta, review_delta, report_delta
+import asyncio
+import bisect
+import functools
+import heapq
+import json
+import os
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 class Storage:
     """In-memory storage with transaction management."""
 
-    def __init__(self):
+    def __init__(self, archive=None, counters_path=None):
+        # Transactions by id, plus indexes by participant and by address
         self.transactions = {}
+        # Finished transactions are moved here to keep the live dicts small
+        self.archive = archive
+        self._by_user = {}
+        self._by_address = {}
+        self._by_deposit_address = {}
+        self._by_outpoint = {}
+        # Named counters, as in the SQL backends' counters table: deposit
+        # watcher heights and next unused derivation index per currency, kept
+        # in a small JSON file if a path is given
+        self.counters_path = counters_path
+        self._counters = self._load_counters()
         self.reviews = []
         self.reports = []
+        # (transaction_id, user_id) of every review: one review per author and deal
+        self._reviewed = set()
+        # Aggregates of reviews and reports by the user they are about
+        self.reputations = {}
+        # Min-heap of (timeout_start, id) so sweeps only touch the oldest entries
+        self._deadlines = []
+        # Min-heap of (finished_at, id) so archiving only touches the oldest finished deals
+        self._finished = []
+        # Sorted (created_at, id) keys for exports; entries of removed
+        # transactions are skipped and compacted away once they are the majority
+        self._created = []
+        self._removed = 0
+        self._leases = {}
 
-    def create_transaction(self, user_id, currency):
+    def _index(self, transaction):
+        for user_id in transaction.participants():
+            # Dicts keep insertion order, i.e. creation order per user
+            self._by_user.setdefault(user_id, {})[transaction.id] = None
+        for address in (transaction.buyer_address, transaction.seller_address):
+            if address:
+                self._by_address.setdefault(address, set()).add(transaction.id)
+        if transaction.deposit_address:
+            self._by_deposit_address[transaction.deposit_address] = transaction.id
+        if transaction.funding_outpoint:
+            self._by_outpoint[transaction.funding_outpoint] = transaction.id
+
+    def _unindex(self, transaction):
+        for user_id in transaction.participants():
+            ids = self._by_user.get(user_id)
+            if ids is not None:
+                ids.pop(transaction.id, None)
+                if not ids:
+                    del self._by_user[user_id]
+        for address in (transaction.buyer_address, transaction.seller_address):
+            ids = self._by_address.get(address)
+            if ids is not None:
+                ids.discard(transaction.id)
+                if not ids:
+                    del self._by_address[address]
+        self._by_deposit_address.pop(transaction.deposit_address, None)
+        self._by_outpoint.pop(transaction.funding_outpoint, None)
+
+    def create_transaction(self, user_id, currency, chat_id=None, deposit_address=None, deposit_index=None):
         transaction = Transaction(
             id=str(uuid.uuid4()),
             user_id=user_id,
             currency=currency,
             status=TransactionStatus.CREATED,
-            created_at=datetime.now()
+            created_at=datetime.now(),
+            chat_id=chat_id,
+            deposit_address=deposit_address,
+            deposit_index=deposit_index
         )
-        self.transactions[user_id] = transaction
+        self.transactions[transaction.id] = transaction
+        self._index(transaction)
+        heapq.heappush(self._deadlines, (transaction.timeout_start(), transaction.id))
+        self._add_created(transaction)
         return transaction
 
+    def _add_created(self, transaction):
+        key = (transaction.created_at, transaction.id)
+        if not self._created or key > self._created[-1]:
+            self._created.append(key)  # The clock moves forward, so this is the usual case
+        else:
+            bisect.insort(self._created, key)
+
+    @staticmethod
+    def _finished_key(transaction):
+        # Deals finished before finish times were kept count from creation
+        return transaction.finished_at or transaction.created_at, transaction.id
+
+    def _drop_created(self):
+        self._removed += 1
+        if self._removed > len(self._created) // 2:
+            # A new list, so a page being read on another thread keeps its own
+            self._created = [key for key in self._created if key[1] in self.transactions]
+            self._removed = 0
+
+    def get_user_transactions(self, user_id, active_only=True):
+        """Transactions the user takes part in, newest first."""
+        ids = self._by_user.get(user_id, ())
+        transactions = (self.transactions.get(transaction_id) for transaction_id in reversed(ids))
+        # Entries left by reset transactions or replaced participants are skipped
+        live = [
+            t for t in transactions
+            if t and user_id in t.participants() and (t.is_active() or not active_only)
+        ]
+        if active_only or self.archive is None:
+            return live
+        archived = self.archive.find_by_participant(user_id)
+        return sorted(live + archived, key=lambda t: t.created_at, reverse=True)
+
     def get_user_transaction(self, user_id):
-        return self.transactions.get(user_id)
+        """The user's newest active transaction, else their newest one."""
+        active = self.get_user_transactions(user_id)
+        if active:
+            return active[0]
+        transactions = self.get_user_transactions(user_id, active_only=False)
+        return transactions[0] if transactions else None
+
+    def get_transaction(self, transaction_id):
+        transaction = self.transactions.get(transaction_id)
+        if transaction is None and self.archive is not None:
+            return self.archive.get(transaction_id)
+        return transaction
+
+    def all_transactions(self):
+        return list(self.transactions.values())
+
+    def all_reviews(self, limit=None):
+        return self.reviews[:limit]
+
+    def all_reports(self, limit=None):
+        return self.reports[:limit]
+
+    def load_transactions(self, transactions):
+        """Restore transactions, e.g. replayed from the journal, with their indexes."""
+        for transaction in transactions:
+            self.transactions[transaction.id] = transaction
+            self._index(transaction)
+            heapq.heappush(self._deadlines, (transaction.timeout_start(), transaction.id))
+        self._created = sorted((t.created_at, t.id) for t in self.transactions.values())
+        self._removed = 0
+        self._finished = [self._finished_key(t) for t in self.transactions.values() if not t.is_active()]
+        heapq.heapify(self._finished)
+
+    def load_events(self, reviews, reports):
+        """Restore reviews and reports, e.g. replayed from the journal, and the reputations they add up to."""
+        for review in reviews:
+            self.add_review(review)
+        for report in reports:
+            self.add_report(report)
+
+    def get_transactions_by_status(self, status, created_before=None, limit=None):
+        matches = [
+            t for t in self.transactions.values()
+            if t.status == status and (created_before is None or t.created_at < created_before)
+        ]
+        matches.sort(key=lambda t: t.created_at)
+        return matches[:limit] if limit is not None else matches
+
+    def page_transactions(self, after=None, limit=1000, status=None, currency=None,
+                          created_from=None, created_to=None):
+        """Up to limit transactions ordered by (created_at, id), starting after the key after.
+
+        Live rows come from the sorted key list, starting at the key after
+        found by bisection, so a full export reads each key about once. It
+        may run on another thread while the bot loop inserts keys: keys not
+        above the last one taken are skipped, so a shifted list never
+        repeats a row.
+        """
+        keys = self._created
+        lower = after
+        if created_from is not None and (lower is None or (created_from, '') > lower):
+            lower = (created_from, '')
+        page = []
+        last = lower
+        # The list only grows in place; compaction replaces it with a new one
+        for position in range(bisect.bisect_right(keys, lower) if lower is not None else 0, len(keys)):
+            key = keys[position]
+            if created_to is not None and key[0] >= created_to:
+                break
+            if last is not None and key <= last:
+                continue
+            last = key
+            transaction = self.transactions.get(key[1])
+            if transaction is None:
+                continue
+            if (status is None or transaction.status == status) and (currency is None or transaction.currency == currency):
+                page.append(transaction)
+                if len(page) == limit:
+                    break
+        if self.archive is not None:
+            archived = self.archive.page(after, limit, status, currency, created_from, created_to)
+            page = heapq.nsmallest(limit, page + archived, key=lambda t: (t.created_at, t.id))
+        return page
+
+    def _page_events(self, events, after, limit, created_from, created_to):
+        # The lists are append-only, so a position is a stable keyset
+        page = []
+        for position in range(after[1] if after else 0, len(events)):
+            event = events[position]
+            if created_from is not None and event.created_at < created_from:
+                continue
+            if created_to is not None and event.created_at >= created_to:
+                continue
+            page.append((position + 1, event))
+            if len(page) == limit:
+                break
+        return page
+
+    def page_reviews(self, after=None, limit=1000, created_from=None, created_to=None):
+        """Up to limit (id, review) pairs in creation order, starting after the (created_at, id) key."""
+        return self._page_events(self.reviews, after, limit, created_from, created_to)
+
+    def page_reports(self, after=None, limit=1000, created_from=None, created_to=None):
+        """Up to limit (id, report) pairs in creation order, starting after the (created_at, id) key."""
+        return self._page_events(self.reports, after, limit, created_from, created_to)
+
+    def get_transactions_by_address(self, address):
+        transactions = (self.transactions.get(i) for i in self._by_address.get(address, ()))
+        # Entries of reset transactions or overwritten addresses are filtered here
+        return [t for t in transactions if t and address in (t.buyer_address, t.seller_address)]
+
+    def get_transaction_by_deposit_address(self, address):
+        """The live transaction a derived deposit address was assigned to."""
+        transaction_id = self._by_deposit_address.get(address)
+        return self.transactions.get(transaction_id) if transaction_id else None
+
+    def get_transactions_by_deposit_addresses(self, addresses):
+        """Live transactions owning any of the derived deposit addresses."""
+        ids = (self._by_deposit_address.get(address) for address in addresses)
+        return [self.transactions[i] for i in ids if i in self.transactions]
+
+    def get_transaction_by_outpoint(self, outpoint):
+        """The live or archived transaction a payment 'txid:vout' funded."""
+        transaction = self.transactions.get(self._by_outpoint.get(outpoint))
+        if transaction is None and self.archive is not None:
+            return self.archive.get_by_outpoint(outpoint)
+        return transaction
+
+    def _load_counters(self):
+        if self.counters_path is None:
+            return {}
+        try:
+            with open(self.counters_path, 'r', encoding='utf-8') as f:
+                counters = json.load(f)
+        except FileNotFoundError:
+            return {}
+        # Files written before the deposit counters held bare currency heights
+        return {(name if ':' in name else f"chain_cursor:{name}"): value for name, value in counters.items()}
+
+    def _set_counter(self, name, value):
+        self._counters[name] = value
+        if self.counters_path is None:
+            return
+        tmp_path = f"{self.counters_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._counters, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.counters_path)
+
+    def get_chain_cursor(self, currency):
+        """Block height the deposit watcher resumes from, None before its first poll."""
+        return self._counters.get(f"chain_cursor:{currency}")
+
+    def set_chain_cursor(self, currency, height):
+        if self.get_chain_cursor(currency) != height:
+            self._set_counter(f"chain_cursor:{currency}", height)
+
+    def reserve_deposit_indexes(self, currency, count):
+        """Claim count consecutive unused derivation indexes; returns the first.
+
+        The counter only grows and is on disk before the range is handed out,
+        so no index is reused after a restart, even one whose deal is gone.
+        Without a counter yet (a fresh file, or one written before the
+        counters) it starts above the highest index of a live or archived
+        transaction.
+        """
+        name = f"deposit_index:{currency}"
+        start = self._counters.get(name)
+        if start is None:
+            highest = max(
+                (t.deposit_index for t in self.transactions.values()
+                 if t.currency == currency and t.deposit_index is not None),
+                default=-1
+            )
+            if self.archive is not None:
+                highest = max(highest, self.archive.max_deposit_index(currency))
+            start = highest + 1
+        self._set_counter(name, start + count)
+        return start
+
+    def get_expired_transactions(self, started_before, limit):
+        """Oldest sweepable transactions whose timeout started before the cutoff."""
+        expired = {}
+        while self._deadlines and len(expired) < limit:
+            started_at, transaction_id = self._deadlines[0]
+            if started_at >= started_before:
+                break
+            heapq.heappop(self._deadlines)
+            transaction = self.transactions.get(transaction_id)
+            # Entries for reset, finished or since funded transactions, and
+            # repeats, are dropped lazily
+            if transaction and transaction.status in SWEEPABLE_STATUSES and transaction.timeout_start() == started_at:
+                expired[transaction_id] = transaction
+        for transaction in expired.values():
+            heapq.heappush(self._deadlines, (transaction.timeout_start(), transaction.id))
+        return list(expired.values())
+
+    def save_transaction(self, transaction):
+        """Persist changes made to a transaction returned by this storage."""
+        if transaction.id not in self.transactions:
+            self._add_created(transaction)
+        self.transactions[transaction.id] = transaction
+        self._index(transaction)
+        # Repeated entries are skipped when sweeping and archiving
+        if transaction.status in SWEEPABLE_STATUSES:
+            heapq.heappush(self._deadlines, (transaction.timeout_start(), transaction.id))
+        if not transaction.is_active():
+            heapq.heappush(self._finished, self._finished_key(transaction))
+
+    def save_transactions(self, transactions):
+        for transaction in transactions:
+            self.save_transaction(transaction)
+
+    def transition(self, transaction_id, expected, new, **changes):
+        """Move a transaction from the expected status to a new one, atomically.
+
+        Returns the updated transaction, or None if the move is illegal or the
+        status is no longer the expected one. Every writer runs on the bot's
+        event loop and nothing here awaits, so compare and set cannot
+        interleave with another update and no lock is needed.
+        """
+        if not can_transition(expected, new):
+            return None
+        if not TRANSITION_FIELDS.issuperset(changes):
+            raise ValueError(f"Fields cannot change in a transition: {set(changes) - TRANSITION_FIELDS}")
+        transaction = self.transactions.get(transaction_id)
+        if transaction is None or transaction.status != expected:
+            return None
+        if new in FINAL_STATUSES:
+            changes.setdefault('finished_at', datetime.now())
+        transaction.status = new
+        for field, value in changes.items():
+            setattr(transaction, field, value)
+        if changes:
+            self._index(transaction)
+        if 'funded_at' in changes and new in SWEEPABLE_STATUSES:
+            # The timeout restarts at funding; the creation-time entry goes stale
+            heapq.heappush(self._deadlines, (transaction.timeout_start(), transaction.id))
+        if new in FINAL_STATUSES:
+            heapq.heappush(self._finished, self._finished_key(transaction))
+        return transaction
+
+    def transition_many(self, moves):
+        """Apply (transaction_id, expected, new) moves; return the transactions that changed."""
+        results = (self.transition(*move) for move in moves)
+        return [transaction for transaction in results if transaction is not None]
 
     def mark_as_funded(self, user_id):
-        transaction = self.transactions.get(user_id)
+        transaction = self.get_user_transaction(user_id)
         if transaction:
-            transaction.status = TransactionStatus.FUNDED
+            self.transition(transaction.id, transaction.status, TransactionStatus.FUNDED)
+
+    def archive_finished(self, finished_before, limit):
+        """Move transactions finished before the cutoff into the archive, oldest first."""
+        if self.archive is None:
+            return []
+        batch = {}
+        while self._finished and len(batch) < limit and self._finished[0][0] < finished_before:
+            _, transaction_id = heapq.heappop(self._finished)
+            transaction = self.transactions.get(transaction_id)
+            # Entries of transactions already archived are dropped lazily
+            if transaction is not None and not transaction.is_active():
+                batch[transaction_id] = transaction
+        batch = list(batch.values())
+        try:
+            # Written and synced before the live copies are dropped
+            self.archive.write(batch)
+        except BaseException:
+            for transaction in batch:
+                heapq.heappush(self._finished, self._finished_key(transaction))
+            raise
+        for transaction in batch:
+            self._unindex(transaction)
+            del self.transactions[transaction.id]
+            self._drop_created()
+        return batch
+
+    def acquire_lease(self, name, holder, ttl):
+        """Take or renew a named lease; only meaningful within this process."""
+        now = time.time()
+        current = self._leases.get(name)
+        if current is not None and current[0] != holder and current[1] >= now:
+            return False
+        self._leases[name] = (holder, now + ttl)
+        return True
+
+    def release_lease(self, name, holder):
+        if self._leases.get(name, (None,))[0] == holder:
+            del self._leases[name]
 
     def add_review(self, review):
+        """Store a review; False if its author already reviewed the deal."""
+        key = (review.transaction_id, review.user_id)
+        if key in self._reviewed:
+            return False
+        self._reviewed.add(key)
         self.reviews.append(review)
+        self._add_reputation(review.subject_id, review.created_at, review_delta(review))
+        return True
 
     def add_report(self, report):
         self.reports.append(report)
+        self._add_reputation(report.subject_id, report.created_at, report_delta(report))
+
+    def _add_reputation(self, user_id, at, delta):
+        if user_id is None:
+            return
+        reputation = self.reputations.get(user_id)
+        if reputation is None:
+            reputation = self.reputations[user_id] = Reputation(user_id)
+        apply_delta(reputation, at, delta)
+
+    def get_reputation(self, user_id):
+        """Aggregated reviews and reports about a user."""
+        return self.reputations.get(user_id) or Reputation(user_id)
+
+    def reset_transaction(self, user_id, transaction_id=None):
+        """Cancel a transaction created by the user (their newest active one by default).
+
+        Only a deal that has not been funded can be reset, and the move to
+        CANCELLED is a compare and set, so it never races a release, a refund
+        or a deposit; returns None if there is nothing that may be reset.
+        """
+        if transaction_id is None:
+            created = (t for t in self.get_user_transactions(user_id) if t.user_id == user_id)
+            transaction = next(created, None)
+        else:
+            transaction = self.transactions.get(transaction_id)
+        if transaction is None or transaction.user_id != user_id or transaction.status not in RESETTABLE_STATUSES:
+            return None
+        return self.transition(transaction.id, transaction.status, TransactionStatus.CANCELLED)
+
+def create_storage(backend=STORAGE_BACKEND):
+    """Build the storage engine selected by configuration."""
+    if backend == 'memory':
+        from archive import TransactionArchive
+        engine = Storage(TransactionArchive(ARCHIVE_DIR), CHAIN_CURSOR_PATH)
+    elif backend == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        engine = SQLiteStorage(SQLITE_PATH, SQLITE_BUSY_TIMEOUT)
+    elif backend == 'postgres':
+        from postgres_storage import PostgresStorage
+        # Postgres has its own write-ahead log, so it is never journaled here
+        return PostgresStorage(
+            POSTGRES_DSN, POSTGRES_POOL_SIZE, POSTGRES_POOL_TIMEOUT,
+            POSTGRES_BATCH_INTERVAL, POSTGRES_BATCH_SIZE, POSTGRES_FLUSH_RETRIES, POSTGRES_DEAD_LETTER_PATH
+        )
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+
+    if not JOURNAL_ENABLED:
+        return engine
+    from journal import Journal, JournaledStorage
+    journal = Journal(JOURNAL_DIR)
+    if backend != 'memory':
+        # SQLite is durable on its own: its journal is an audit trail that is
+        # never replayed, so the table is never read back for snapshots
+        return JournaledStorage(engine, journal, snapshots=False)
+    transactions, reviews, reports = journal.replay()
+    engine.load_transactions(transactions)
+    engine.load_events(reviews, reports)
+    return JournaledStorage(engine, journal, transactions)
+
+class AsyncStorage:
+    """Awaitable view of a storage backend for code on the event loop.
+
+    Backends doing network I/O set blocking = True; their calls run on a
+    thread pool as wide as their connection pool. Local backends answer in
+    microseconds and are called inline.
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._executor = None
+        if getattr(backend, 'blocking', False):
+            self._executor = ThreadPoolExecutor(backend.pool_size, thread_name_prefix="storage")
+
+    def __getattr__(self, name):
+        attribute = getattr(self._backend, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+        executor = self._executor
 
-    def reset_transaction(self, user_id):
-        if user_id in self.transactions:
-            del self.transactions[user_id]
+        @functools.wraps(attribute)
+        async def call(*args, **kwargs):
+            if executor is None:
+                return attribute(*args, **kwargs)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, functools.partial(attribute, *args, **kwargs))
+        # Cache so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
 
-storage = Storage()
\ No newline at end of file
+storage = InstrumentedStorage(create_storage())
+async_storage = AsyncStorage(storage)
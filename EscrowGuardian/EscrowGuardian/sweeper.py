@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from telegram.constants import ParseMode
+from telegram.ext import CallbackContext
+from models import TransactionStatus
+from storage import async_storage
+from config import ESCROW_TIMEOUT_HOURS, SWEEP_BATCH_SIZE, ARCHIVE_AFTER_HOURS, ARCHIVE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+def expiry_status(transaction):
+    """Timeout outcome: funded deals are refunded, unfunded ones cancelled.
+
+    A funded deal's timeout counts from funding (Transaction.timeout_start),
+    so a deposit made just before the deadline still gets the full window.
+    """
+    if transaction.status == TransactionStatus.FUNDED:
+        return TransactionStatus.REFUNDED
+    return TransactionStatus.CANCELLED
+
+async def sweep_expired(now=None, batch_size=SWEEP_BATCH_SIZE):
+    """Expire every transaction whose timeout has run out, in batches, and return them."""
+    cutoff = (now or datetime.now()) - timedelta(hours=ESCROW_TIMEOUT_HOURS)
+    expired = []
+    while True:
+        batch = await async_storage.get_expired_transactions(cutoff, batch_size)
+        if not batch:
+            break
+        # Deals released or refunded since the read are skipped by the compare-and-set
+        expired.extend(await async_storage.transition_many(
+            [(t.id, t.status, expiry_status(t)) for t in batch]
+        ))
+        if len(batch) < batch_size:
+            break
+    return expired
+
+def group_by_chat(transactions):
+    chats = defaultdict(list)
+    for transaction in transactions:
+        chats[transaction.chat_id or transaction.user_id].append(transaction)
+    return chats
+
+async def notify_expired(bot, transactions):
+    """Send one summary message per affected chat."""
+    async def notify(chat_id, expired):
+        lines = [
+            f"• `{t.id}` — {t.status.value.capitalize()}"
+            for t in expired
+        ]
+        await bot.send_message(
+            chat_id=chat_id,
+            text=(
+                f"⏰ Escrow timeout ({ESCROW_TIMEOUT_HOURS}h) reached:\n\n"
+                + "\n".join(lines)
+                + "\n\nStart a new deal with /transaction"
+            ),
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    chats = group_by_chat(transactions)
+    results = await asyncio.gather(
+        *(notify(chat_id, expired) for chat_id, expired in chats.items()),
+        return_exceptions=True
+    )
+    for chat_id, result in zip(chats, results):
+        if isinstance(result, Exception):
+            logger.warning("Could not notify chat %s about expired deals: %s", chat_id, result)
+
+async def sweep_job(context: CallbackContext):
+    """Job queue entry point for the escrow timeout sweep"""
+    expired = await sweep_expired()
+    if expired:
+        logger.info("Expired %d stale transactions", len(expired))
+        await notify_expired(context.bot, expired)
+
+async def archive_job(context: CallbackContext):
+    """Job queue entry point moving old finished transactions to the archive"""
+    cutoff = datetime.now() - timedelta(hours=ARCHIVE_AFTER_HOURS)
+    archived = 0
+    while True:
+        batch = await async_storage.archive_finished(cutoff, ARCHIVE_BATCH_SIZE)
+        archived += len(batch)
+        if len(batch) < ARCHIVE_BATCH_SIZE:
+            break
+    if archived:
+        logger.info("Archived %d finished transactions", archived)
@@ -0,0 +1,32 @@
+import logging
+import os
+import sys
+import tempfile
+import pytest
+
+# Modules read their configuration and build singletons at import time, so
+# the environment is pinned before any of them is imported: in-memory
+# storage without a journal, a mock chain and no log file.
+_state = tempfile.mkdtemp(prefix='escrow-tests-')
+os.environ.update({
+    'STORAGE_BACKEND': 'memory',
+    'JOURNAL_ENABLED': 'false',
+    'ARCHIVE_DIR': os.path.join(_state, 'archive'),
+    'CHAIN_CURSOR_PATH': os.path.join(_state, 'chain_cursors.json'),
+    'CHAIN_BACKEND': 'mock',
+    'FEE_SOURCE': 'static',
+    'LOG_FILE': '',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope='session')
+def web_app():
+    """main's Flask app; the process-wide logging main sets up on import is undone afterwards."""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    import logging_setup
+    import main
+    yield main.app
+    logging_setup.shutdown_logging()
+    root.handlers[:] = handlers
+    root.setLevel(level)
@@ -0,0 +1,29 @@
+import pytest
+from address_validation import address_type, segwit_encode, verify_address, verify_many
+
+@pytest.mark.parametrize('currency, address, kind', [
+    ('BTC', '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa', 'p2pkh'),
+    ('BTC', '3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy', 'p2sh'),
+    ('BTC', 'bc1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyu', 'p2wpkh'),
+    ('BTC', 'BC1QCR8TE4KR609GCAWUTMRZA0J4XV80JY8Z306FYU', 'p2wpkh'),
+    ('BTC', 'bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0', 'p2tr'),
+    ('LTC', 'ltc1qwl8qe05cyr6phmn484nnc6rw7af335fh0q4kv7', 'p2wpkh'),
+])
+def test_valid_addresses(currency, address, kind):
+    assert address_type(currency, address) == kind
+
+@pytest.mark.parametrize('currency, address', [
+    ('BTC', '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb'),  # Bad checksum
+    ('BTC', 'bc1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyv'),
+    ('BTC', 'bC1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyu'),  # Mixed case
+    ('LTC', 'bc1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyu'),  # Other network
+    ('BTC', ''),
+    ('DOGE', '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa'),
+])
+def test_invalid_addresses(currency, address):
+    assert not verify_address(currency, address)
+
+def test_segwit_round_trip_and_batches():
+    address = segwit_encode('bc', 0, bytes(32))
+    assert address_type('BTC', address) == 'p2wsh'
+    assert verify_many('BTC', [address, address[:-1] + 'x', '3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy']) == [True, False, True]
@@ -0,0 +1,53 @@
+import uuid
+from datetime import datetime, timedelta
+from archive import TransactionArchive
+from models import Transaction, TransactionStatus
+from storage import Storage
+
+NOW = datetime(2026, 1, 1)
+
+def _finished(number, created_at=NOW, finished_at=None):
+    return Transaction(
+        id=str(uuid.UUID(int=number)), user_id=number, currency='BTC', status=TransactionStatus.COMPLETED,
+        created_at=created_at, buyer_id=1000 + number, seller_id=2000 + number,
+        buyer_address=f"bc1buyer{number}", seller_address=f"bc1seller{number}", amount=number * 1000,
+        funded_at=created_at + timedelta(hours=1), deposit_address=f"bc1derived{number}", deposit_index=number,
+        funding_outpoint=f"{number:064x}:0", finished_at=finished_at or created_at + timedelta(hours=2),
+    )
+
+def test_round_trip_through_segments_and_blooms(tmp_path):
+    archive = TransactionArchive(str(tmp_path))
+    first = [_finished(n) for n in range(1, 6)]
+    second = [_finished(n) for n in range(6, 9)]
+    archive.write(first)
+    archive.write(second)
+
+    # A fresh instance reads the filters back from the segment files
+    reopened = TransactionArchive(str(tmp_path))
+    for transaction in first + second:
+        assert reopened.get(transaction.id) == transaction
+    assert reopened.get_by_outpoint(second[0].funding_outpoint) == second[0]
+    assert reopened.find_by_participant(first[2].buyer_id) == [first[2]]
+    assert reopened.max_deposit_index('BTC') == 8
+
+    missing = str(uuid.UUID(int=99))
+    assert reopened.get(missing) is None
+    # The id filters rule the segments out without mapping them
+    assert not any(reopened._may_hold(number, 'id', uuid.UUID(missing).bytes) for number in reopened._numbers)
+
+def test_archive_finished_goes_by_finish_time(tmp_path):
+    storage = Storage(TransactionArchive(str(tmp_path)))
+    old = storage.create_transaction(1, 'BTC')
+    new = storage.create_transaction(2, 'BTC')
+    active = storage.create_transaction(3, 'BTC')
+    storage.transition(old.id, TransactionStatus.CREATED, TransactionStatus.CANCELLED, finished_at=NOW)
+    storage.transition(new.id, TransactionStatus.CREATED, TransactionStatus.CANCELLED)
+
+    # The older deal finished recently, so it stays live
+    assert storage.archive_finished(datetime.now() - timedelta(hours=1), 10) == [old]
+    assert storage.archive_finished(datetime.now() - timedelta(hours=1), 10) == []
+    assert set(storage.transactions) == {new.id, active.id}
+    assert storage.get_transaction(old.id).finished_at == NOW
+
+    assert storage.archive_finished(datetime.now() + timedelta(seconds=1), 10) == [new]
+    assert list(storage.transactions) == [active.id]
@@ -0,0 +1,58 @@
+import asyncio
+from types import SimpleNamespace
+from telegram import InputFile
+from telegram.error import BadRequest
+from asset_cache import AssetCache
+
+class FakeBot:
+    """send_photo stand-in: records what was sent, answers with a new file_id per upload."""
+
+    def __init__(self, reject=(), prefix='photo'):
+        self.sent = []
+        self.reject = set(reject)
+        self.prefix = prefix
+
+    async def send_photo(self, photo, chat_id):
+        self.sent.append(photo)
+        if photo in self.reject:
+            raise BadRequest("Wrong file identifier")
+        uploads = sum(isinstance(sent, InputFile) for sent in self.sent)
+        sizes = [SimpleNamespace(file_id=f"thumb-{uploads}"), SimpleNamespace(file_id=f"{self.prefix}-{uploads}")]
+        return SimpleNamespace(effective_attachment=sizes)
+
+def _cache(tmp_path):
+    return AssetCache(str(tmp_path / 'asset_cache.json'), str(tmp_path))
+
+def _send(cache, bot, name='logo.png'):
+    return asyncio.run(cache.send(name, bot.send_photo, 'photo', chat_id=1))
+
+def test_uploads_once_and_reuses_the_file_id_after_a_restart(tmp_path):
+    (tmp_path / 'logo.png').write_bytes(b'v1')
+    bot = FakeBot()
+    _send(_cache(tmp_path), bot)
+    _send(_cache(tmp_path), bot)
+    assert isinstance(bot.sent[0], InputFile)
+    # The largest size's file_id is the one reused
+    assert bot.sent[1] == 'photo-1'
+
+def test_changed_content_is_uploaded_again(tmp_path):
+    (tmp_path / 'logo.png').write_bytes(b'v1')
+    bot = FakeBot()
+    _send(_cache(tmp_path), bot)
+    (tmp_path / 'logo.png').write_bytes(b'v2')
+    _send(_cache(tmp_path), bot)
+    assert [isinstance(sent, InputFile) for sent in bot.sent] == [True, True]
+
+def test_rejected_file_id_is_replaced(tmp_path):
+    (tmp_path / 'logo.png').write_bytes(b'v1')
+    _send(_cache(tmp_path), FakeBot())
+    bot = FakeBot(reject={'photo-1'}, prefix='fresh')
+    cache = _cache(tmp_path)
+    _send(cache, bot)
+    assert bot.sent[0] == 'photo-1' and isinstance(bot.sent[1], InputFile)
+    assert cache.get_file_id('logo.png') == 'fresh-1'
+
+def test_missing_asset_is_not_sent(tmp_path):
+    bot = FakeBot()
+    assert _send(_cache(tmp_path), bot, 'missing.png') is None
+    assert bot.sent == []
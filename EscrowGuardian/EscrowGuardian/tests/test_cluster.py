@@ -0,0 +1,80 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+import leader
+from cluster import merge_metrics, shard_for
+from leader import Leadership, leader_only
+from sqlite_storage import SQLiteStorage
+from storage import AsyncStorage
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    engine = SQLiteStorage(str(tmp_path / 'escrow.db'))
+    monkeypatch.setattr(leader, 'async_storage', AsyncStorage(engine))
+    yield engine
+    engine.close()
+
+def test_one_holder_leads_until_it_goes_silent(storage):
+    first = Leadership('jobs', ttl=0.05, holder='first')
+    second = Leadership('jobs', ttl=60, holder='second')
+    assert asyncio.run(first.renew()) and not asyncio.run(second.renew())
+
+    time.sleep(0.1)
+    assert asyncio.run(second.renew()) and not asyncio.run(first.renew())
+    assert not first.is_leader and second.is_leader
+
+    asyncio.run(second.release())
+    assert asyncio.run(first.renew())
+
+def test_failed_renewal_gives_up_leadership(storage, monkeypatch):
+    leadership = Leadership('jobs', ttl=60, holder='only')
+    assert asyncio.run(leadership.renew())
+
+    def broken(name, holder, ttl):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(storage, 'acquire_lease', broken)
+    monkeypatch.setattr(leader, 'async_storage', AsyncStorage(storage))
+    assert not asyncio.run(leadership.renew()) and not leadership.is_leader
+
+def test_leader_only_jobs_run_on_the_leader(monkeypatch):
+    runs = []
+
+    @leader_only
+    async def job(context):
+        runs.append(context)
+
+    monkeypatch.setattr(leader.leadership, 'is_leader', False)
+    asyncio.run(job('skipped'))
+    monkeypatch.setattr(leader.leadership, 'is_leader', True)
+    asyncio.run(job('ran'))
+    assert runs == ['ran']
+
+def _update(chat_id=None, user_id=1):
+    chat = SimpleNamespace(id=chat_id) if chat_id is not None else None
+    return SimpleNamespace(effective_chat=chat, effective_user=SimpleNamespace(id=user_id))
+
+def test_updates_of_one_chat_go_to_one_worker():
+    assert len({shard_for(_update(-100, user_id), 4) for user_id in range(20)}) == 1
+    assert len({shard_for(_update(-chat_id), 4) for chat_id in range(100, 120)}) > 1
+    # Updates without a chat are spread by sender
+    assert shard_for(_update(user_id=7), 4) == shard_for(_update(user_id=7), 4)
+
+def test_worker_metrics_are_merged_per_family():
+    exposition = (
+        "# HELP escrow_updates_total Updates\n"
+        "# TYPE escrow_updates_total counter\n"
+        "escrow_updates_total 3\n"
+        'escrow_handler_calls_total{handler="start"} 2\n'
+    )
+    lines = merge_metrics({0: exposition, 1: exposition.replace(' 3', ' 5'), 2: None}).splitlines()
+    assert 'escrow_cluster_worker_up{worker="2"} 0' in lines
+    assert lines.count('# HELP escrow_updates_total Updates') == 1
+    start = lines.index('# TYPE escrow_updates_total counter')
+    assert lines[start + 1:start + 5] == [
+        'escrow_updates_total{worker="0"} 3',
+        'escrow_handler_calls_total{worker="0",handler="start"} 2',
+        'escrow_updates_total{worker="1"} 5',
+        'escrow_handler_calls_total{worker="1",handler="start"} 2',
+    ]
@@ -0,0 +1,90 @@
+import asyncio
+from chain import MockNode
+from config import ESCROW_WALLETS
+from deposit_watcher import DepositWatcher, deposit_text
+from models import TransactionStatus
+from money import fee_schedule
+from storage import storage
+
+def _deal(user_id, address):
+    transaction = storage.create_transaction(user_id, 'BTC', deposit_address=address, deposit_index=user_id)
+    return storage.transition(
+        transaction.id, TransactionStatus.CREATED, TransactionStatus.BUYER_SET,
+        buyer_address=f"bc1buyer{user_id}"
+    )
+
+def _watcher(node, min_confirmations=1):
+    """A watcher that reads from the node's next block on."""
+    storage.set_chain_cursor('BTC', node.height + 1)
+    return DepositWatcher({'BTC': node}, min_confirmations=min_confirmations)
+
+def test_deposit_funds_its_deal_once_deep_enough():
+    node = MockNode(height=200)
+    watcher = _watcher(node, min_confirmations=3)
+    transaction = _deal(9101, 'bc1dealaddress')
+    txid = node.send('bc1somebody', 'bc1dealaddress', 2_000_000)
+    node.send('bc1somebody', 'bc1notours', 5_000_000)
+    node.mine(2)
+    assert asyncio.run(watcher.poll()) == []
+    node.mine()
+
+    [(funded, deposit, violation)] = asyncio.run(watcher.poll())
+    assert (funded.id, deposit.txid, violation) == (transaction.id, txid, None)
+    stored = storage.get_transaction(transaction.id)
+    assert stored.status == TransactionStatus.FUNDED and stored.amount == 2_000_000
+    assert stored.funding_outpoint == f"{txid}:0"
+    assert storage.get_chain_cursor('BTC') == 202
+
+def test_shared_wallet_deposit_matches_the_senders_deal():
+    node = MockNode(height=300)
+    watcher = _watcher(node)
+    transaction = _deal(9201, None)
+    node.send('bc1buyer9201', ESCROW_WALLETS['BTC'], 3_000_000)
+    node.mine()
+    [(funded, _, violation)] = asyncio.run(watcher.poll())
+    assert funded.id == transaction.id and violation is None
+
+def test_deposit_is_not_credited_twice_after_a_restart():
+    node = MockNode(height=400)
+    watcher = _watcher(node)
+    deals = {_deal(9301, None).id, _deal(9301, None).id}
+    node.send('bc1buyer9301', ESCROW_WALLETS['BTC'], 2_000_000)
+    node.mine()
+    [(funded, _, _)] = asyncio.run(watcher.poll())
+    [other] = deals - {funded.id}
+    # A restart that lost the cursor reads the block again; the payment must not fund the buyer's other deal
+    assert asyncio.run(_watcher(MockNode(height=400)).credit('BTC', node._blocks[401])) == []
+    assert storage.get_transaction(other).status == TransactionStatus.BUYER_SET
+
+def test_rejected_deposit_is_recorded_and_reported():
+    node = MockNode(height=100)
+    watcher = _watcher(node)
+    transaction = _deal(9001, 'bc1rejected')
+    too_much = fee_schedule.rules['BTC'].maximum + 1
+    txid = node.send('bc1buyer9001', 'bc1rejected', too_much)
+    node.mine()
+
+    [(reported, deposit, violation)] = asyncio.run(watcher.poll())
+    assert violation == 'above_maximum' and deposit.txid == txid
+    stored = storage.get_transaction(transaction.id)
+    assert stored.status == TransactionStatus.BUYER_SET
+    assert (stored.rejected_outpoint, stored.rejected_amount) == (f"{txid}:0", too_much)
+    assert reported.rejected_outpoint == stored.rejected_outpoint
+    assert "Not Accepted" in deposit_text(reported, deposit, violation)
+
+    # Seen again after a restart lost the cursor: not reported twice
+    assert asyncio.run(_watcher(node).credit('BTC', [deposit])) == []
+
+def test_deposit_before_the_parties_are_set_is_recorded():
+    node = MockNode(height=500)
+    watcher = _watcher(node)
+    transaction = storage.create_transaction(9401, 'BTC', deposit_address='bc1early', deposit_index=9401)
+    txid = node.send('bc1somebody', 'bc1early', 2_000_000)
+    node.mine()
+
+    [(reported, _, violation)] = asyncio.run(watcher.poll())
+    assert reported.id == transaction.id and violation == 'not_ready'
+    stored = storage.get_transaction(transaction.id)
+    assert stored.status == TransactionStatus.CREATED
+    assert (stored.rejected_outpoint, stored.rejected_amount) == (f"{txid}:0", 2_000_000)
+    assert storage.get_chain_cursor('BTC') == 502
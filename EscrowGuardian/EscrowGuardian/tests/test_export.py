@@ -0,0 +1,72 @@
+import csv
+import io
+import uuid
+from datetime import datetime, timedelta, timezone
+import pytest
+import admin_api
+import storage as storage_module
+from archive import TransactionArchive
+from export import decode_cursor, encode_cursor, parse_time
+from models import Transaction, TransactionStatus
+from storage import Storage
+
+NOW = datetime(2026, 1, 1)
+AUTH = {'Authorization': 'Bearer secret'}
+
+def _deal(number, status):
+    created_at = NOW + timedelta(minutes=number)
+    return Transaction(
+        id=str(uuid.UUID(int=number)), user_id=number, currency='BTC', status=status, created_at=created_at,
+        finished_at=created_at + timedelta(hours=1) if status == TransactionStatus.COMPLETED else None,
+    )
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    engine = Storage(archive=TransactionArchive(str(tmp_path)))
+    # Odd deals are completed and archived, even ones stay live
+    for number in range(1, 10):
+        engine.save_transaction(_deal(number, TransactionStatus.COMPLETED if number % 2 else TransactionStatus.CREATED))
+    assert len(engine.archive_finished(NOW + timedelta(days=1), 100)) == 5
+    monkeypatch.setattr(storage_module, 'storage', engine)
+    monkeypatch.setattr(admin_api, 'ADMIN_API_TOKEN', 'secret')
+    return engine
+
+@pytest.fixture
+def client(web_app):
+    return web_app.test_client()
+
+def _pages(client, query):
+    ids, cursor = [], None
+    while True:
+        url = f"/admin/transactions?{query}" + (f"&cursor={cursor}" if cursor else '')
+        body = client.get(url, headers=AUTH).get_json()
+        ids += [row['user_id'] for row in body['items']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            return ids
+
+def test_pages_merge_live_and_archived_deals_in_order(storage, client):
+    assert _pages(client, 'limit=2') == list(range(1, 10))
+    assert _pages(client, 'limit=2&status=completed') == [1, 3, 5, 7, 9]
+    created_from = (NOW + timedelta(minutes=4)).isoformat()
+    assert _pages(client, f'limit=3&from={created_from}') == [4, 5, 6, 7, 8, 9]
+
+def test_csv_export_streams_every_row(storage, client):
+    response = client.get('/admin/transactions/export?format=csv', headers=AUTH)
+    assert response.status_code == 200 and response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [int(row['user_id']) for row in rows] == list(range(1, 10))
+    assert rows[0]['finished_at'] and not rows[1]['finished_at']
+
+def test_bad_requests_are_refused(storage, client):
+    assert client.get('/admin/transactions').status_code == 403
+    assert client.get('/admin/transactions?cursor=nope', headers=AUTH).status_code == 400
+    assert client.get('/admin/transactions?currency=DOGE', headers=AUTH).status_code == 400
+    assert client.get('/admin/transactions/export?format=xml', headers=AUTH).status_code == 400
+    assert client.get('/admin/reviews?status=funded', headers=AUTH).status_code == 400
+
+def test_cursors_round_trip_and_offsets_are_converted():
+    key = (NOW, str(uuid.UUID(int=1)))
+    assert decode_cursor(encode_cursor(key)) == key
+    aware = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+    assert parse_time(aware.isoformat()) == aware.astimezone().replace(tzinfo=None)
@@ -0,0 +1,39 @@
+import json
+import pytest
+from address_validation import address_type
+from hd_wallet import AddressDeriver, ExtendedPublicKey
+from storage import Storage
+
+# BIP84 test vector: account 0 of the "abandon ... about" mnemonic
+ZPUB = 'zpub6rFR7y4Q2AijBEqTUquhVz398htDFrtymD9xYYfG1m4wAcvPhXNfE3EfH1r1ADqtfSdVCToUG868RvUUkgDKf31mGDtKsAYz2oz2AGutZYs'
+
+def test_bip84_receive_addresses():
+    deriver = AddressDeriver('BTC', ZPUB)
+    assert deriver.address(0) == 'bc1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyu'
+    assert deriver.address(1) == 'bc1qnjg0jd8228aq7egyzacy8cys3knf9xvrerkf9g'
+    assert deriver.addresses(0, 2) == [(0, deriver.address(0)), (1, deriver.address(1))]
+
+def test_derived_addresses_validate_for_their_currency():
+    for currency, prefix in (('BTC', 'bc1q'), ('LTC', 'ltc1q')):
+        address = AddressDeriver(currency, ZPUB).address(7)
+        assert address.startswith(prefix) and address_type(currency, address) == 'p2wpkh'
+
+def test_bad_keys_are_refused():
+    with pytest.raises(ValueError):
+        ExtendedPublicKey.parse(ZPUB[:-1] + ('t' if ZPUB[-1] != 't' else 'u'))
+    with pytest.raises(ValueError):
+        ExtendedPublicKey.parse(ZPUB).child(2 ** 31)
+
+def test_memory_deposit_index_counter_survives_restart(tmp_path):
+    path = str(tmp_path / 'counters.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'BTC': 840000}, f)
+    storage = Storage(counters_path=path)
+    assert storage.get_chain_cursor('BTC') == 840000
+    assert storage.reserve_deposit_indexes('BTC', 5) == 0
+    assert storage.reserve_deposit_indexes('BTC', 1) == 5
+    # No deal holds an index after a restart, yet none is handed out again
+    restarted = Storage(counters_path=path)
+    assert restarted.reserve_deposit_indexes('BTC', 1) == 6
+    assert restarted.reserve_deposit_indexes('LTC', 1) == 0
+    assert restarted.get_chain_cursor('BTC') == 840000
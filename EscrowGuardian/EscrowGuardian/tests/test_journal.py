@@ -0,0 +1,73 @@
+import os
+from datetime import datetime
+from journal import Journal, JournaledStorage
+from models import Review, Report, TransactionStatus
+from sqlite_storage import SQLiteStorage
+from storage import Storage
+
+NOW = datetime(2026, 1, 1)
+
+def _journaled(directory, snapshot_every=1000):
+    journal = Journal(str(directory), fsync_interval=0.01, snapshot_every=snapshot_every)
+    transactions, reviews, reports = journal.replay()
+    engine = Storage()
+    engine.load_transactions(transactions)
+    engine.load_events(reviews, reports)
+    return JournaledStorage(engine, journal, transactions), journal
+
+def _write_history(storage, journal):
+    """A transition, a deleted deal, a review and a report; returns (kept, deleted) ids."""
+    kept = storage.create_transaction(1, 'BTC')
+    storage.transition(
+        kept.id, TransactionStatus.CREATED, TransactionStatus.BUYER_SET, buyer_id=2, buyer_address="bc1buyer"
+    )
+    deleted = storage.create_transaction(3, 'BTC')
+    # Deletes are what /restart journaled before it became a cancel; older
+    # journals still hold them
+    storage._unindex(deleted)
+    del storage.transactions[deleted.id]
+    storage._drop_created()
+    journal.append('delete', {'id': deleted.id}, deleted.status.value)
+    storage.add_review(Review(kept.id, 2, "fine", NOW, rating=4, subject_id=1))
+    storage.add_report(Report(2, "slow", NOW, subject_id=1))
+    return kept.id, deleted.id
+
+def _assert_restored(storage, kept, deleted):
+    transaction = storage.get_transaction(kept)
+    assert transaction.status == TransactionStatus.BUYER_SET and transaction.buyer_id == 2
+    assert storage.get_transaction(deleted) is None
+    reputation = storage.reputations[1]
+    assert (reputation.reviews, reputation.rating_sum, reputation.reports) == (1, 4, 1)
+    # The replayed review still counts against a second one by the same author
+    assert not storage.add_review(Review(kept, 2, "again", NOW, rating=1, subject_id=1))
+
+def test_replay_applies_transitions_deletes_reviews_and_reports(tmp_path):
+    storage, journal = _journaled(tmp_path)
+    kept, deleted = _write_history(storage, journal)
+    journal.close()
+
+    restored, journal = _journaled(tmp_path)
+    _assert_restored(restored, kept, deleted)
+    journal.close()
+
+def test_replay_from_snapshot(tmp_path):
+    storage, journal = _journaled(tmp_path, snapshot_every=2)
+    kept, deleted = _write_history(storage, journal)
+    journal.close()
+    assert any(name.startswith('snapshot-') for name in os.listdir(tmp_path))
+
+    restored, journal = _journaled(tmp_path, snapshot_every=2)
+    _assert_restored(restored, kept, deleted)
+    journal.close()
+
+def test_durable_backend_is_never_snapshotted(tmp_path):
+    engine = SQLiteStorage(str(tmp_path / 'escrow.db'))
+    journal = Journal(str(tmp_path / 'journal'), fsync_interval=0.01, snapshot_every=2)
+    storage = JournaledStorage(engine, journal, snapshots=False)
+    for user_id in range(5):
+        storage.create_transaction(user_id, 'BTC')
+    journal.close()
+    engine.close()
+    names = os.listdir(tmp_path / 'journal')
+    assert not any(name.startswith('snapshot-') for name in names)
+    assert any(name.startswith('segment-') for name in names)
@@ -0,0 +1,21 @@
+import logging
+from logging_setup import RateLimitFilter
+
+def _record(msg):
+    return logging.LogRecord('escrow', logging.INFO, __file__, 1, msg, None, None)
+
+def test_identical_messages_are_capped_per_window():
+    rate_limit = RateLimitFilter(2, 60)
+    assert [rate_limit.filter(_record("same")) for _ in range(4)] == [True, True, False, False]
+    assert rate_limit.filter(logging.LogRecord('escrow', logging.WARNING, __file__, 1, "same", None, None))
+
+def test_templates_are_bounded(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr('logging_setup.time.monotonic', lambda: clock[0])
+    rate_limit = RateLimitFilter(1, 10, max_keys=50)
+    for n in range(200):
+        rate_limit.filter(_record(f"contact from {n}"))
+    assert len(rate_limit._counts) == 50
+    clock[0] = 11.0
+    rate_limit.filter(_record("later"))
+    assert list(rate_limit._counts) == [('escrow', "later")]
@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+from telegram import ChatMember
+import member_cache as member_cache_module
+from member_cache import ChatMemberCache, admin_required
+
+def _member(user_id, status=ChatMember.MEMBER):
+    return SimpleNamespace(user=SimpleNamespace(id=user_id), status=status)
+
+class FakeBot:
+    def __init__(self, statuses=None):
+        self.calls = []
+        self.statuses = statuses or {}
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls.append((chat_id, user_id))
+        await asyncio.sleep(0)
+        return _member(user_id, self.statuses.get(user_id, ChatMember.MEMBER))
+
+def test_concurrent_misses_share_one_request_and_hits_make_none():
+    cache, bot = ChatMemberCache(ttl=60, max_entries=10), FakeBot()
+
+    async def main():
+        first = await asyncio.gather(*(cache.get(bot, -100, 1) for _ in range(5)))
+        return first, await cache.get(bot, -100, 1)
+
+    first, again = asyncio.run(main())
+    assert bot.calls == [(-100, 1)]
+    assert all(member is first[0] for member in first) and again is first[0]
+
+def test_expired_and_evicted_entries_are_fetched_again():
+    bot = FakeBot()
+    expired = ChatMemberCache(ttl=0, max_entries=10)
+    asyncio.run(expired.get(bot, -100, 1))
+    asyncio.run(expired.get(bot, -100, 1))
+    assert len(bot.calls) == 2
+
+    small = ChatMemberCache(ttl=60, max_entries=2)
+    for user_id in (1, 2, 3):
+        asyncio.run(small.get(bot, -100, user_id))
+    assert small.cached(-100, 1) is None and small.cached(-100, 3) is not None
+
+def test_member_updates_replace_entries():
+    cache = ChatMemberCache(ttl=60, max_entries=10)
+    asyncio.run(cache.get(FakeBot(), -100, 1))
+    cache.apply(SimpleNamespace(chat=SimpleNamespace(id=-100), new_chat_member=_member(1, ChatMember.ADMINISTRATOR)))
+    bot = FakeBot()
+    assert asyncio.run(cache.is_admin(bot, -100, 1)) and bot.calls == []
+    cache.invalidate(-100)
+    assert cache.cached(-100, 1) is None
+
+def test_admin_required_asks_the_cache(monkeypatch):
+    monkeypatch.setattr(member_cache_module, 'member_cache', ChatMemberCache(ttl=60, max_entries=10))
+    ran, replies = [], []
+
+    @admin_required
+    async def command(update, context):
+        ran.append(update.effective_user.id)
+
+    async def reply_text(text):
+        replies.append(text)
+
+    context = SimpleNamespace(bot=FakeBot({1: ChatMember.OWNER}))
+    for user_id in (1, 2):
+        update = SimpleNamespace(
+            effective_user=SimpleNamespace(id=user_id),
+            effective_chat=SimpleNamespace(id=-100, type='supergroup'),
+            effective_message=SimpleNamespace(reply_text=reply_text),
+        )
+        asyncio.run(command(update, context))
+    assert ran == [1] and len(replies) == 1
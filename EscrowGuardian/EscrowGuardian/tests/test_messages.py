@@ -0,0 +1,45 @@
+import asyncio
+from types import SimpleNamespace
+import handlers
+import messages
+from messages import CATALOGS, DEFAULT_CATALOG, TEXTS, Catalog, catalog_for, format_minute
+from storage import AsyncStorage, Storage
+
+def _update(language_code, replies):
+    async def reply_text(text, **kwargs):
+        replies.append((text, kwargs))
+
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=1, language_code=language_code),
+        effective_chat=SimpleNamespace(id=-100),
+        message=SimpleNamespace(reply_text=reply_text),
+    )
+
+def test_languages_fall_back_to_the_default_catalog(monkeypatch):
+    german = Catalog('de', {**TEXTS['en'], 'how': "Anleitung"})
+    monkeypatch.setitem(messages.CATALOGS, 'de', german)
+    assert catalog_for(_update('de-AT', [])) is german
+    assert catalog_for(_update('fr', [])) is DEFAULT_CATALOG
+    assert catalog_for(_update(None, [])) is DEFAULT_CATALOG and catalog_for() is DEFAULT_CATALOG
+    # Keys a language lacks come from the default language
+    assert german.text('terms') == DEFAULT_CATALOG.text('terms')
+
+def test_keyboards_are_built_once():
+    catalog = CATALOGS['en']
+    assert catalog.keyboard('welcome') is catalog.keyboard('welcome')
+    buttons = catalog.keyboard('currency').inline_keyboard[0]
+    assert [button.callback_data for button in buttons] == ['currency_btc', 'currency_ltc']
+
+def test_status_reply_is_rendered_from_the_user_catalog(monkeypatch):
+    engine = Storage()
+    monkeypatch.setattr(handlers, 'async_storage', AsyncStorage(engine))
+    german = Catalog('de', {**TEXTS['en'], 'not_set': "Nicht gesetzt"})
+    monkeypatch.setitem(messages.CATALOGS, 'de', german)
+    transaction = engine.create_transaction(1, 'BTC', chat_id=-100, deposit_address="bc1deposit")
+
+    replies = []
+    asyncio.run(handlers.status(_update('de', replies), SimpleNamespace(args=[])))
+    assert replies[0][0] == german.render(
+        'status', id=transaction.id, created=format_minute(transaction.created_at), currency='BTC',
+        deposit_address="bc1deposit", status="Created", buyer="Nicht gesetzt", seller="Nicht gesetzt"
+    )
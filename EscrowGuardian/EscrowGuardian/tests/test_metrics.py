@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+import metrics
+from metrics import CONTENT_TYPE, Histogram, Registry, instrument_handler
+
+def test_instrumented_handlers_are_scraped_from_the_endpoint(web_app):
+    async def ok(update, context):
+        return 'done'
+
+    async def broken(update, context):
+        raise RuntimeError("boom")
+
+    assert asyncio.run(instrument_handler('metrics_test_ok', ok)(None, None)) == 'done'
+    with pytest.raises(RuntimeError):
+        asyncio.run(instrument_handler('metrics_test_broken', broken)(None, None))
+    assert metrics.heartbeat.age() is not None
+
+    response = web_app.test_client().get('/metrics')
+    assert response.status_code == 200 and response.mimetype == CONTENT_TYPE.split(';')[0]
+    lines = response.get_data(as_text=True).splitlines()
+    assert 'escrow_handler_calls_total{handler="metrics_test_ok"} 1' in lines
+    assert 'escrow_handler_calls_total{handler="metrics_test_broken"} 1' in lines
+    assert 'escrow_handler_errors_total{handler="metrics_test_broken"} 1' in lines
+    assert not any('errors' in line and 'metrics_test_ok' in line for line in lines)
+    assert 'escrow_handler_latency_seconds_count{handler="metrics_test_ok"} 1' in lines
+
+def test_histogram_buckets_are_cumulative_and_labels_escaped():
+    registry = Registry()
+    histogram = registry.register(Histogram('test_seconds', "Test", ('name',), buckets=(0.1, 1.0)))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, 'a"b')
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP test_seconds Test', '# TYPE test_seconds histogram']
+    assert lines[2:] == [
+        'test_seconds_bucket{name="a\\"b",le="0.1"} 1',
+        'test_seconds_bucket{name="a\\"b",le="1.0"} 2',
+        'test_seconds_bucket{name="a\\"b",le="+Inf"} 3',
+        'test_seconds_sum{name="a\\"b"} 5.55',
+        'test_seconds_count{name="a\\"b"} 3',
+    ]
+
+def test_health_reports_a_missing_bot_loop(web_app):
+    response = web_app.test_client().get('/health')
+    assert response.status_code == 503 and response.get_json()['status'] == 'down'
@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from money import FeeSchedule, StaticFeeSource, format_units, to_units
+
+BTC_FEE = to_units('0.00015')
+
+@pytest.fixture
+def schedule():
+    return FeeSchedule(StaticFeeSource())
+
+def test_units_round_trip():
+    assert to_units('0.01') == 1_000_000
+    assert to_units(0.1 + 0.2) == 30_000_000
+    assert format_units(1_000_000) == '0.01000000'
+    assert format_units(-5) == '-0.00000005'
+
+def test_fee_and_settle(schedule):
+    # 0.5% of 1 BTC plus the network fee; refunds pay the network fee only
+    assert schedule.fee('BTC', 10 ** 8) == BTC_FEE + 500_000
+    assert schedule.settle('BTC', 10 ** 8, completed=False) == (BTC_FEE, 10 ** 8 - BTC_FEE)
+    # The service fee rounds up, and the fee never exceeds the amount
+    assert schedule.fee('BTC', 100_001) == BTC_FEE + 501
+    assert schedule.settle('BTC', 1000) == (1000, 0)
+
+def test_total_is_the_smallest_sufficient_deposit(schedule):
+    for amount in (1, 12_345, 10 ** 7, 33_333_333):
+        deposit = schedule.total('BTC', amount)
+        assert schedule.settle('BTC', deposit)[1] >= amount
+        assert schedule.settle('BTC', deposit - 1)[1] < amount
+
+def test_violation(schedule):
+    maximum = schedule.rules['BTC'].maximum
+    assert schedule.violation('BTC', maximum) is None
+    assert schedule.violation('BTC', maximum + 1) == 'above_maximum'
+    assert schedule.violation('BTC', BTC_FEE) == 'below_fee'
+
+def test_settle_many_matches_settle(schedule):
+    currencies = ['BTC', 'LTC', 'BTC', 'LTC']
+    amounts = [10 ** 8, 12_345_678, 100, 0]
+    fees, payouts = schedule.settle_many(currencies, amounts)
+    assert list(zip(fees, payouts)) == [schedule.settle(c, a) for c, a in zip(currencies, amounts)]
+
+def test_failed_refresh_keeps_last_rates(schedule):
+    class Source:
+        async def network_fee(self, currency):
+            if currency == 'LTC':
+                raise OSError("unreachable")
+            return 2_000
+
+    litecoin = schedule.rules['LTC']
+    schedule.source = Source()
+    asyncio.run(schedule.refresh())
+    assert schedule.rules['BTC'].network_fee == 2_000
+    assert schedule.rules['LTC'] == litecoin
@@ -0,0 +1,143 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+from models import Review, Report, TransactionStatus
+from postgres_storage import PostgresStorage
+
+TABLES = ('transactions', 'reviews', 'reports', 'reputations', 'leases', 'counters')
+
+@pytest.fixture(scope='module')
+def dsn(tmp_path_factory):
+    """TEST_DATABASE_URL if set, else a throwaway server from pgserver."""
+    if os.getenv('TEST_DATABASE_URL'):
+        return os.environ['TEST_DATABASE_URL']
+    pgserver = pytest.importorskip('pgserver')
+    server = pgserver.get_server(str(tmp_path_factory.mktemp('pgdata')), cleanup_mode='stop')
+    return server.get_uri()
+
+def _truncate(dsn):
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY")
+    conn.close()
+
+@pytest.fixture
+def storage(dsn):
+    engine = PostgresStorage(dsn, 4, batch_interval=0.05)
+    yield engine
+    engine.close()
+    _truncate(dsn)
+
+def _buyer_set(storage, user_id=1, currency='BTC'):
+    transaction = storage.create_transaction(user_id, currency)
+    return storage.transition(
+        transaction.id, TransactionStatus.CREATED, TransactionStatus.BUYER_SET,
+        buyer_id=user_id + 1, buyer_address=f"bc1buyer{user_id}"
+    )
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.02)
+
+def test_create_and_lookup(storage):
+    transaction = storage.create_transaction(7, 'BTC', chat_id=-100, deposit_address='bc1derived', deposit_index=3)
+    assert storage.get_transaction(transaction.id) == transaction
+    assert storage.get_user_transaction(7).id == transaction.id
+    assert storage.get_transaction_by_deposit_address('bc1derived').id == transaction.id
+    assert [t.id for t in storage.get_transactions_by_deposit_addresses(['bc1derived', 'bc1none'])] == [transaction.id]
+
+def test_transition_is_compare_and_set(storage):
+    transaction = _buyer_set(storage)
+    funded = storage.transition(
+        transaction.id, TransactionStatus.BUYER_SET, TransactionStatus.FUNDED, amount=1_000_000
+    )
+    assert funded.status == TransactionStatus.FUNDED and funded.amount == 1_000_000
+    # The expected status is stale now, and FUNDED -> SELLER_SET is never legal
+    assert storage.transition(transaction.id, TransactionStatus.BUYER_SET, TransactionStatus.FUNDED) is None
+    assert storage.transition(transaction.id, TransactionStatus.FUNDED, TransactionStatus.SELLER_SET) is None
+    with pytest.raises(ValueError):
+        storage.transition(transaction.id, TransactionStatus.FUNDED, TransactionStatus.COMPLETED, currency='LTC')
+
+def test_transition_many(storage):
+    first, second = _buyer_set(storage, 1), _buyer_set(storage, 3)
+    changed = storage.transition_many([
+        (first.id, TransactionStatus.BUYER_SET, TransactionStatus.CANCELLED),
+        (second.id, TransactionStatus.CREATED, TransactionStatus.CANCELLED),
+    ])
+    assert [t.id for t in changed] == [first.id]
+    assert storage.get_transaction(second.id).status == TransactionStatus.BUYER_SET
+
+def test_funding_outpoint_is_unique(storage):
+    first, second = _buyer_set(storage, 1), _buyer_set(storage, 3)
+    storage.transition(first.id, TransactionStatus.BUYER_SET, TransactionStatus.FUNDED, funding_outpoint='ab:0')
+    assert storage.get_transaction_by_outpoint('ab:0').id == first.id
+    with pytest.raises(psycopg2.IntegrityError):
+        storage.transition(second.id, TransactionStatus.BUYER_SET, TransactionStatus.FUNDED, funding_outpoint='ab:0')
+
+def test_counters_and_cursors(storage):
+    assert storage.reserve_deposit_indexes('BTC', 5) == 0
+    assert storage.reserve_deposit_indexes('BTC', 2) == 5
+    assert storage.get_chain_cursor('BTC') is None
+    storage.set_chain_cursor('BTC', 120)
+    storage.set_chain_cursor('BTC', 121)
+    assert storage.get_chain_cursor('BTC') == 121
+
+def test_page_transactions_in_key_order(storage):
+    created = [storage.create_transaction(user_id, 'BTC' if user_id % 2 else 'LTC') for user_id in range(7)]
+    expected = sorted(created, key=lambda t: (t.created_at, t.id))
+    seen, after = [], None
+    while True:
+        page = storage.page_transactions(after, 3)
+        seen += page
+        if len(page) < 3:
+            break
+        after = (page[-1].created_at, page[-1].id)
+    assert [t.id for t in seen] == [t.id for t in expected]
+    assert {t.currency for t in storage.page_transactions(limit=10, currency='LTC')} == {'LTC'}
+
+def test_reviews_are_batched_with_reputation(storage):
+    now = datetime.now()
+    storage.add_review(Review('tx-1', 1, "great", now, rating=5, subject_id=2))
+    storage.add_review(Review('tx-2', 3, "fine", now + timedelta(seconds=1), rating=3, subject_id=2))
+    storage.add_report(Report(4, "scam", now, subject_id=2))
+    _wait_for(lambda: storage.get_reputation(2).reviews == 2)
+    reputation = storage.get_reputation(2)
+    assert (reputation.ratings, reputation.rating_sum, reputation.reports) == (2, 8, 1)
+    assert [review.message for _, review in storage.page_reviews()] == ["great", "fine"]
+
+def test_failing_batch_is_dead_lettered(dsn, tmp_path):
+    dead_letters = tmp_path / 'dead.jsonl'
+    storage = PostgresStorage(dsn, 2, batch_interval=0.01, flush_retries=2, dead_letter_path=str(dead_letters))
+    try:
+        # Out of range for the INTEGER column: Postgres rejects it on every attempt
+        storage.add_review(Review('tx-bad', 1, "bad", datetime.now(), rating=2 ** 40, subject_id=9))
+        _wait_for(dead_letters.exists)
+        storage.add_review(Review('tx-good', 1, "good", datetime.now(), rating=4, subject_id=9))
+        _wait_for(lambda: storage.get_reputation(9).reviews == 1)
+        written = [review.transaction_id for _, review in storage.page_reviews()]
+    finally:
+        storage.close()
+        _truncate(dsn)
+    lines = [json.loads(line) for line in dead_letters.read_text().splitlines()]
+    assert [(line['table'], line['row']['transaction_id']) for line in lines] == [('reviews', 'tx-bad')]
+    assert written == ['tx-good']
+
+def test_one_review_per_author_and_deal(storage):
+    now = datetime.now()
+    assert storage.add_review(Review('tx-1', 1, "first", now, rating=5, subject_id=2))
+    assert not storage.add_review(Review('tx-1', 1, "again", now, rating=1, subject_id=2))
+    # Two workers racing past the check: the unique index keeps the first
+    storage._buffer(storage._reviews, Review('tx-2', 1, "one", now, rating=4, subject_id=2))
+    storage._buffer(storage._reviews, Review('tx-2', 1, "two", now, rating=1, subject_id=2))
+    _wait_for(lambda: storage.get_reputation(2).reviews == 2)
+    storage.flush()
+    assert not storage.add_review(Review('tx-1', 1, "later", now, rating=1, subject_id=2))
+    assert [review.message for _, review in storage.page_reviews()] == ["first", "one"]
+    assert storage.get_reputation(2).rating_sum == 9
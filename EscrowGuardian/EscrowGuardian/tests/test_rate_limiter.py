@@ -0,0 +1,51 @@
+import asyncio
+import httpx
+import pytest
+from telegram.error import NetworkError, TimedOut
+from rate_limiter import OutboundScheduler, PRIORITY_COSMETIC, PRIORITY_TRANSACTIONAL
+
+def _failing(error, cause, fail_times=1):
+    calls = []
+
+    async def callback():
+        calls.append(1)
+        if len(calls) <= fail_times:
+            raise error from cause
+        return 'ok'
+    return callback, calls
+
+def _request(scheduler, callback, endpoint):
+    return asyncio.run(scheduler.process_request(callback, (), {}, endpoint, {'chat_id': 1}, None))
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr('rate_limiter.random.uniform', lambda low, high: 0)
+
+def test_send_is_not_repeated_after_timeout():
+    callback, calls = _failing(TimedOut(), httpx.ReadTimeout("read"))
+    with pytest.raises(TimedOut):
+        _request(OutboundScheduler(), callback, 'sendMessage')
+    assert len(calls) == 1
+
+def test_unsent_requests_and_reads_are_retried():
+    callback, calls = _failing(NetworkError("httpx.ConnectError"), httpx.ConnectError("refused"))
+    assert _request(OutboundScheduler(), callback, 'sendMessage') == 'ok' and len(calls) == 2
+    callback, calls = _failing(TimedOut(), httpx.ReadTimeout("read"))
+    assert _request(OutboundScheduler(), callback, 'getChatMember') == 'ok' and len(calls) == 2
+
+def test_global_budget_serves_by_priority():
+    scheduler = OutboundScheduler(global_rate=(50, 1))
+    order = []
+
+    async def acquire(name, priority):
+        await scheduler._acquire_global(priority)
+        order.append(name)
+
+    async def run():
+        await scheduler._acquire_global(PRIORITY_TRANSACTIONAL)  # Drains the bucket
+        cosmetic = [asyncio.create_task(acquire(f"cosmetic{n}", PRIORITY_COSMETIC)) for n in range(3)]
+        await asyncio.sleep(0)
+        urgent = asyncio.create_task(acquire("urgent", PRIORITY_TRANSACTIONAL))
+        await asyncio.wait_for(asyncio.gather(*cosmetic, urgent), 2)
+    asyncio.run(run())
+    assert order == ["urgent", "cosmetic0", "cosmetic1", "cosmetic2"]
@@ -0,0 +1,110 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+import handlers
+from models import Review, Report, Reputation, TransactionStatus
+from reputation import HALF_LIFE_SECONDS, apply_delta, decay, is_risky, merge_deltas, recent, report_delta, review_delta
+from sqlite_storage import SQLiteStorage
+from storage import Storage, storage as live_storage
+
+NOW = datetime(2026, 1, 1)
+
+def _review(rating, at=NOW, transaction_id='tx-1', user_id=1, subject_id=2):
+    return Review(transaction_id, user_id, "text", at, rating=rating, subject_id=subject_id)
+
+def test_decay_halves_per_half_life():
+    assert decay(8.0, HALF_LIFE_SECONDS) == pytest.approx(4.0)
+    assert decay(8.0, -5) == 8.0
+
+def test_merged_deltas_equal_events_applied_one_by_one():
+    events = [(2, NOW + timedelta(days=day), review_delta(_review(rating))) for day, rating in ((0, 5), (40, 1), (10, 3))]
+    events.append((2, NOW + timedelta(days=20), report_delta(Report(3, "scam", NOW))))
+    [merged] = merge_deltas(events)
+    folded = Reputation(2)
+    for _, at, delta in sorted(events, key=lambda event: event[1]):
+        apply_delta(folded, at, delta)
+    assert merged == folded
+    assert (merged.reviews, merged.ratings, merged.rating_sum, merged.reports) == (3, 3, 9, 1)
+
+def test_recent_average_favours_recent_ratings():
+    reputation = Reputation(2)
+    apply_delta(reputation, NOW - timedelta(days=120), review_delta(_review(5)))
+    apply_delta(reputation, NOW, review_delta(_review(1)))
+    recent_average, reports = recent(reputation, NOW)
+    assert 1 < recent_average < 1.5 and reports == 0
+
+def test_is_risky():
+    reported = Reputation(2)
+    apply_delta(reported, NOW, report_delta(Report(3, "scam", NOW, subject_id=2)))
+    assert is_risky(reported, NOW)
+    # Decayed below the threshold after two half-lives
+    assert not is_risky(reported, NOW + timedelta(seconds=2 * HALF_LIFE_SECONDS))
+    rated = Reputation(2)
+    for rating in (1, 2, 2):
+        apply_delta(rated, NOW, review_delta(_review(rating)))
+    assert is_risky(rated, NOW)
+    assert not is_risky(Reputation(2), NOW)
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def storage(request, tmp_path):
+    if request.param == 'memory':
+        yield Storage()
+        return
+    engine = SQLiteStorage(str(tmp_path / 'escrow.db'))
+    yield engine
+    engine.close()
+
+def test_one_review_per_author_and_deal(storage):
+    assert storage.add_review(_review(1))
+    assert not storage.add_review(_review(1, NOW + timedelta(seconds=1)))
+    assert storage.add_review(_review(5, transaction_id='tx-2'))
+    reputation = storage.get_reputation(2)
+    assert (reputation.reviews, reputation.rating_sum) == (2, 6)
+
+def test_upgrade_keeps_the_first_of_repeated_reviews(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE reviews (id INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id TEXT NOT NULL, "
+        "user_id INTEGER NOT NULL, message TEXT NOT NULL, created_at REAL NOT NULL, rating INTEGER)"
+    )
+    conn.executemany(
+        "INSERT INTO reviews (transaction_id, user_id, message, created_at, rating) VALUES (?, ?, ?, ?, ?)",
+        [('tx-1', 1, "first", 1.0, 5), ('tx-1', 1, "again", 2.0, 1), ('tx-1', 3, "other", 3.0, 4)]
+    )
+    conn.commit()
+    conn.close()
+    engine = SQLiteStorage(path)
+    try:
+        assert [review.message for _, review in engine.page_reviews()] == ["first", "other"]
+        assert not engine.add_review(_review(1, transaction_id='tx-1', user_id=1))
+    finally:
+        engine.close()
+
+def _report(reporter_id, subject_id):
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    subject = SimpleNamespace(id=subject_id, is_bot=False)
+    update = SimpleNamespace(
+        effective_user=SimpleNamespace(id=reporter_id, language_code='en'),
+        message=SimpleNamespace(reply_text=reply_text, reply_to_message=SimpleNamespace(from_user=subject))
+    )
+    asyncio.run(handlers.report(update, SimpleNamespace(args=["scam"])))
+    return live_storage.reports[-1]
+
+def test_report_counts_only_from_a_counterparty():
+    stranger_report = _report(8001, 8002)
+    assert stranger_report.subject_id is None
+    assert live_storage.get_reputation(8002).reports == 0
+
+    transaction = live_storage.create_transaction(8003, 'BTC')
+    live_storage.transition(
+        transaction.id, TransactionStatus.CREATED, TransactionStatus.BUYER_SET, buyer_id=8002, buyer_address="bc1x"
+    )
+    assert _report(8003, 8002).subject_id == 8002
+    assert live_storage.get_reputation(8002).reports == 1
@@ -0,0 +1,145 @@
+import sqlite3
+from datetime import datetime, timedelta
+import pytest
+from models import Review, Transaction, TransactionStatus
+from sqlite_storage import DATA_MIGRATIONS, SELECT_BY_DEPOSIT_ADDRESS, SELECT_BY_PARTICIPANT, SELECT_EXPIRED, SQLiteStorage
+
+NOW = datetime(2026, 1, 1)
+
+# The first release's tables, before any of MIGRATIONS
+OLD_SCHEMA = """
+CREATE TABLE transactions (
+    id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, currency TEXT NOT NULL, status TEXT NOT NULL,
+    created_at REAL NOT NULL, buyer_id INTEGER, seller_id INTEGER, buyer_address TEXT,
+    seller_address TEXT, amount REAL, funded_at REAL
+);
+CREATE TABLE reviews (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id TEXT NOT NULL, user_id INTEGER NOT NULL,
+    message TEXT NOT NULL, created_at REAL NOT NULL, rating INTEGER
+);
+CREATE TABLE reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, message TEXT NOT NULL,
+    created_at REAL NOT NULL, resolved INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+@pytest.fixture
+def storage(tmp_path):
+    engine = SQLiteStorage(str(tmp_path / 'escrow.db'))
+    yield engine
+    engine.close()
+
+def _transaction(number, created_at=NOW, status=TransactionStatus.CREATED, currency='BTC'):
+    return Transaction(id=f"tx-{number:03d}", user_id=number, currency=currency, status=status, created_at=created_at)
+
+def _plan(storage, sql, params):
+    return " ".join(row[3] for row in storage._connection().execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+def test_create_save_and_lookups(storage):
+    transaction = storage.create_transaction(7, 'BTC', chat_id=-100, deposit_address='bc1derived', deposit_index=3)
+    assert storage.get_transaction(transaction.id) == transaction
+    transaction = storage.transition(
+        transaction.id, TransactionStatus.CREATED, TransactionStatus.SELLER_SET,
+        seller_id=8, seller_address='bc1seller'
+    )
+    transaction.amount = 1_000_000
+    storage.save_transaction(transaction)
+
+    assert storage.get_transaction(transaction.id) == transaction
+    assert storage.get_transaction('missing') is None
+    assert [t.id for t in storage.get_user_transactions(8)] == [transaction.id]
+    assert storage.get_user_transaction(7).id == transaction.id
+    assert [t.id for t in storage.get_transactions_by_address('bc1seller')] == [transaction.id]
+    assert storage.get_transaction_by_deposit_address('bc1derived').id == transaction.id
+    assert storage.get_transactions_by_status(TransactionStatus.SELLER_SET)[0].amount == 1_000_000
+
+def test_lookups_by_many_deposit_addresses_span_batches(storage):
+    storage.save_transactions([
+        Transaction(id=f"tx-{i}", user_id=i, currency='BTC', status=TransactionStatus.BUYER_SET,
+                    created_at=NOW, deposit_address=f"bc1derived{i}")
+        for i in range(600)
+    ])
+    found = storage.get_transactions_by_deposit_addresses(f"bc1derived{i}" for i in range(0, 1200, 2))
+    assert sorted(t.deposit_address for t in found) == sorted(f"bc1derived{i}" for i in range(0, 600, 2))
+
+def test_finished_deals_drop_out_of_active_lookups(storage):
+    transaction = storage.create_transaction(1, 'BTC')
+    storage.transition(transaction.id, TransactionStatus.CREATED, TransactionStatus.CANCELLED)
+    assert storage.get_user_transactions(1) == []
+    assert [t.id for t in storage.get_user_transactions(1, active_only=False)] == [transaction.id]
+
+def test_lookups_use_their_indexes(storage):
+    plan = _plan(storage, SELECT_BY_PARTICIPANT, (1, 1, 1))
+    for index in ('idx_transactions_user', 'idx_transactions_buyer', 'idx_transactions_seller'):
+        assert index in plan
+    assert 'idx_transactions_deposit_address' in _plan(storage, SELECT_BY_DEPOSIT_ADDRESS, ('bc1',))
+    assert 'idx_transactions_expiry' in _plan(storage, SELECT_EXPIRED, (NOW.timestamp(), 10))
+
+def test_expired_sweep_is_oldest_first(storage):
+    storage.save_transactions([
+        _transaction(1, NOW - timedelta(hours=3)),
+        _transaction(2, NOW - timedelta(hours=5)),
+        _transaction(3, NOW - timedelta(hours=4), TransactionStatus.COMPLETED),
+        _transaction(4, NOW + timedelta(hours=1)),
+    ])
+    # Funded deals time out from funding, not creation
+    funded = _transaction(5, NOW - timedelta(hours=6), TransactionStatus.FUNDED)
+    funded.funded_at = NOW - timedelta(minutes=30)
+    storage.save_transaction(funded)
+    assert [t.id for t in storage.get_expired_transactions(NOW, 10)] == ['tx-002', 'tx-001', 'tx-005']
+    assert [t.id for t in storage.get_expired_transactions(NOW - timedelta(hours=1), 10)] == ['tx-002', 'tx-001']
+
+def test_deposit_index_counter_is_monotonic(storage):
+    assert storage.reserve_deposit_indexes('BTC', 5) == 0
+    assert storage.reserve_deposit_indexes('BTC', 1) == 5
+    assert storage.reserve_deposit_indexes('LTC', 1) == 0
+    reopened = SQLiteStorage(storage.path)
+    assert reopened.reserve_deposit_indexes('BTC', 1) == 6
+    reopened.close()
+
+def test_old_database_is_migrated(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(OLD_SCHEMA)
+    conn.execute(
+        "INSERT INTO transactions VALUES ('tx-old', 1, 'BTC', 'funded', ?, 2, 3, 'bc1b', 'bc1s', 0.5, ?)",
+        (NOW.timestamp(), NOW.timestamp())
+    )
+    conn.executemany(
+        "INSERT INTO reviews (transaction_id, user_id, message, created_at, rating) VALUES (?, ?, ?, ?, ?)",
+        [('tx-old', 2, "first", NOW.timestamp(), 5), ('tx-old', 2, "repeat", NOW.timestamp(), 1)]
+    )
+    conn.commit()
+    conn.close()
+
+    storage = SQLiteStorage(path)
+    transaction = storage.get_transaction('tx-old')
+    # Float coins became integer base units; the new columns read as unset
+    assert transaction.amount == 50_000_000 and transaction.deposit_address is None
+    assert [review.message for _, review in storage.page_reviews()] == ["first"]
+    assert not storage.add_review(Review('tx-old', 2, "again", NOW, rating=3))
+    storage.close()
+
+    # Opening again rewrites nothing twice
+    storage = SQLiteStorage(path)
+    assert storage.get_transaction('tx-old').amount == 50_000_000
+    assert storage._connection().execute("PRAGMA user_version").fetchone()[0] == len(DATA_MIGRATIONS)
+    storage.close()
+
+def test_keyset_pagination(storage):
+    # Ties on created_at are broken by id, so no row is skipped or repeated
+    storage.save_transactions([
+        _transaction(i, NOW + timedelta(minutes=i // 3), currency='BTC' if i % 2 else 'LTC') for i in range(10)
+    ])
+    seen, after = [], None
+    while True:
+        page = storage.page_transactions(after=after, limit=4)
+        if not page:
+            break
+        seen += [t.id for t in page]
+        after = (page[-1].created_at, page[-1].id)
+    assert seen == [f"tx-{i:03d}" for i in range(10)]
+
+    filtered = storage.page_transactions(currency='BTC', created_from=NOW + timedelta(minutes=1))
+    assert [t.id for t in filtered] == ['tx-003', 'tx-005', 'tx-007', 'tx-009']
+    assert storage.page_transactions(created_to=NOW + timedelta(minutes=1), limit=2)[-1].id == 'tx-001'
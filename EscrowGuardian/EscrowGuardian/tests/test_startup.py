@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+import bot
+from asset_cache import AssetCache
+from startup import StartupTimer
+
+class FakeBot:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def set_my_commands(self, commands):
+        self.calls.append('commands')
+        if self.fail:
+            raise RuntimeError("Flood control exceeded")
+
+    async def set_my_name(self, name):
+        self.calls.append('name')
+
+def _restart(monkeypatch, tmp_path):
+    """A fresh asset cache reading the file the previous process wrote."""
+    monkeypatch.setattr(bot, 'asset_cache', AssetCache(str(tmp_path / 'asset_cache.json'), str(tmp_path)))
+
+def _post_init(monkeypatch, fake_bot, leader=True):
+    async def renew():
+        return leader
+
+    monkeypatch.setattr(bot, 'warm_pools', lambda: None)
+    monkeypatch.setattr(bot, 'leadership', SimpleNamespace(renew=renew))
+    monkeypatch.setattr(bot, 'profile_task', None)
+
+    async def main():
+        await bot.post_init(SimpleNamespace(bot=fake_bot))
+        # Nothing is sent to Telegram before post_init returns
+        sent_before_return = list(fake_bot.calls)
+        if bot.profile_task is not None:
+            await bot.profile_task
+        return sent_before_return
+
+    return asyncio.run(main())
+
+def test_profile_is_sent_in_the_background_only_when_changed(monkeypatch, tmp_path):
+    _restart(monkeypatch, tmp_path)
+    failing = FakeBot(fail=True)
+    assert _post_init(monkeypatch, failing) == []
+    # A failed update is not remembered, so the next start tries again
+    _restart(monkeypatch, tmp_path)
+    sent = FakeBot()
+    _post_init(monkeypatch, sent)
+    assert failing.calls == ['commands', 'name'] and sent.calls == ['commands']
+
+    _restart(monkeypatch, tmp_path)
+    unchanged = FakeBot()
+    _post_init(monkeypatch, unchanged)
+    assert unchanged.calls == []
+
+def test_only_the_leader_updates_the_profile(monkeypatch, tmp_path):
+    _restart(monkeypatch, tmp_path)
+    follower = FakeBot()
+    _post_init(monkeypatch, follower, leader=False)
+    assert follower.calls == [] and bot.profile_task is None
+
+def test_startup_phases_and_first_update_are_recorded():
+    timer = StartupTimer()
+    timer.phase("imports")
+    timer.phase("ready")
+    assert set(timer.samples()) == {('imports',), ('ready',)}
+    timer.update_received()
+    first = timer.first_update
+    timer.update_received()
+    assert timer.first_update == first and timer.samples()[('first_update',)] == round(first, 6)
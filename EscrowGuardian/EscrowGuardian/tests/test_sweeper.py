@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+import sweeper
+from config import ESCROW_TIMEOUT_HOURS
+from models import Transaction, TransactionStatus
+from storage import AsyncStorage, Storage
+
+NOW = datetime(2026, 1, 1)
+TIMEOUT = timedelta(hours=ESCROW_TIMEOUT_HOURS)
+
+@pytest.fixture
+def storage(monkeypatch):
+    engine = Storage()
+    monkeypatch.setattr(sweeper, 'async_storage', AsyncStorage(engine))
+    return engine
+
+def _deal(number, created_at, status=TransactionStatus.CREATED, funded_at=None):
+    return Transaction(
+        id=f"tx-{number:03d}", user_id=number, currency='BTC', status=status,
+        created_at=created_at, funded_at=funded_at
+    )
+
+def test_expiry_is_oldest_first_and_counts_funded_deals_from_funding(storage):
+    storage.save_transactions([
+        _deal(1, NOW - TIMEOUT - timedelta(hours=1)),
+        _deal(2, NOW - TIMEOUT - timedelta(hours=3)),
+        # Created long ago but funded an hour before the sweep: still in its window
+        _deal(3, NOW - TIMEOUT - timedelta(hours=5), TransactionStatus.FUNDED, funded_at=NOW - timedelta(hours=1)),
+        _deal(4, NOW - TIMEOUT - timedelta(hours=9), TransactionStatus.FUNDED, funded_at=NOW - TIMEOUT - timedelta(hours=2)),
+        _deal(5, NOW - timedelta(hours=2)),
+    ])
+    assert [t.id for t in storage.get_expired_transactions(NOW - TIMEOUT, 10)] == ['tx-002', 'tx-004', 'tx-001']
+
+    expired = asyncio.run(sweeper.sweep_expired(now=NOW))
+    assert {t.id: t.status for t in expired} == {
+        'tx-001': TransactionStatus.CANCELLED,
+        'tx-002': TransactionStatus.CANCELLED,
+        'tx-004': TransactionStatus.REFUNDED,
+    }
+    assert storage.get_transaction('tx-003').status == TransactionStatus.FUNDED
+    assert storage.get_transaction('tx-005').status == TransactionStatus.CREATED
+
+    # The funded deal expires once its own window has run out, after the later created one
+    expired = asyncio.run(sweeper.sweep_expired(now=NOW + TIMEOUT))
+    assert [(t.id, t.status) for t in expired] == [
+        ('tx-005', TransactionStatus.CANCELLED), ('tx-003', TransactionStatus.REFUNDED)
+    ]
+
+def test_funding_restarts_the_timeout(storage):
+    transaction = storage.create_transaction(1, 'BTC')
+    storage.transition(
+        transaction.id, TransactionStatus.CREATED, TransactionStatus.BUYER_SET, buyer_id=2, buyer_address="bc1buyer"
+    )
+    funded_at = transaction.created_at + TIMEOUT - timedelta(minutes=1)
+    storage.transition(transaction.id, TransactionStatus.BUYER_SET, TransactionStatus.FUNDED, funded_at=funded_at)
+    assert asyncio.run(sweeper.sweep_expired(now=transaction.created_at + TIMEOUT + timedelta(minutes=1))) == []
+    [refunded] = asyncio.run(sweeper.sweep_expired(now=funded_at + TIMEOUT + timedelta(seconds=1)))
+    assert refunded.status == TransactionStatus.REFUNDED
+
+def test_sweep_transitions_every_batch(storage):
+    storage.save_transactions([_deal(n, NOW - TIMEOUT - timedelta(minutes=n)) for n in range(1, 8)])
+    expired = asyncio.run(sweeper.sweep_expired(now=NOW, batch_size=3))
+    assert sorted(t.id for t in expired) == [f"tx-{n:03d}" for n in range(1, 8)]
+    assert all(t.status == TransactionStatus.CANCELLED for t in storage.transactions.values())
+    assert asyncio.run(sweeper.sweep_expired(now=NOW, batch_size=3)) == []
+
+def test_a_deal_released_meanwhile_is_not_expired(storage):
+    storage.save_transactions([_deal(1, NOW - TIMEOUT - timedelta(hours=1), TransactionStatus.FUNDED)])
+    [stale] = storage.get_expired_transactions(NOW - TIMEOUT, 10)
+    storage.transition(stale.id, TransactionStatus.FUNDED, TransactionStatus.COMPLETED)
+    assert asyncio.run(sweeper.sweep_expired(now=NOW)) == []
+    assert storage.get_transaction(stale.id).status == TransactionStatus.COMPLETED
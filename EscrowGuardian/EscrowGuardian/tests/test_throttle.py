@@ -0,0 +1,26 @@
+from throttle import InboundThrottle, command_of
+
+def _throttle():
+    return InboundThrottle(
+        user_rate=(0.001, 2), chat_rate=(0.001, 5), command_rates={'transaction': (0.001, 3)}, max_keys=100
+    )
+
+def test_chat_limit_spans_users():
+    throttle = _throttle()
+    assert [throttle.check(user_id, -100, 'status') for user_id in range(6)] == [None] * 5 + ['chat']
+
+def test_rejected_update_takes_no_tokens():
+    throttle = _throttle()
+    assert throttle.check(1, 1, 'transaction') is None
+    assert throttle.check(1, 1, 'status') is None
+    assert throttle.check(1, 1, 'transaction') == 'user'
+    assert throttle._buckets[('command', (1, 'transaction'))].tokens >= 1.99
+
+def test_command_of():
+    class Message:
+        text = '/Start@EscrowBot now'
+
+    class Update:
+        callback_query = None
+        message = Message()
+    assert command_of(Update()) == 'start'
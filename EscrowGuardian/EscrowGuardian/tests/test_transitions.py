@@ -0,0 +1,102 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from models import TransactionStatus, can_transition
+from sqlite_storage import SQLiteStorage
+from storage import Storage
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def storage(request, tmp_path):
+    if request.param == 'memory':
+        yield Storage()
+        return
+    engine = SQLiteStorage(str(tmp_path / 'escrow.db'))
+    yield engine
+    engine.close()
+
+def _buyer_set(storage, user_id=1):
+    transaction = storage.create_transaction(user_id, 'BTC')
+    return storage.transition(
+        transaction.id, TransactionStatus.CREATED, TransactionStatus.BUYER_SET,
+        buyer_id=user_id + 1, buyer_address=f"bc1buyer{user_id}"
+    )
+
+def test_transition_table():
+    assert can_transition(TransactionStatus.BUYER_SET, TransactionStatus.FUNDED)
+    assert can_transition(TransactionStatus.FUNDED, TransactionStatus.COMPLETED)
+    assert not can_transition(TransactionStatus.CREATED, TransactionStatus.FUNDED)
+    assert not any(can_transition(TransactionStatus.COMPLETED, status) for status in TransactionStatus)
+
+def test_transition_is_compare_and_set(storage):
+    transaction = _buyer_set(storage)
+    assert transaction.status == TransactionStatus.BUYER_SET and transaction.buyer_id == 2
+    funded = storage.transition(transaction.id, TransactionStatus.BUYER_SET, TransactionStatus.FUNDED, amount=5_000)
+    assert funded.status == TransactionStatus.FUNDED and funded.amount == 5_000
+    # A second writer holding the old status loses, and the first write stands
+    assert storage.transition(transaction.id, TransactionStatus.BUYER_SET, TransactionStatus.CANCELLED) is None
+    stored = storage.get_transaction(transaction.id)
+    assert stored.status == TransactionStatus.FUNDED and stored.amount == 5_000
+
+def test_illegal_moves_and_fields_are_refused(storage):
+    transaction = _buyer_set(storage)
+    assert storage.transition(transaction.id, TransactionStatus.BUYER_SET, TransactionStatus.COMPLETED) is None
+    assert storage.transition('missing', TransactionStatus.BUYER_SET, TransactionStatus.FUNDED) is None
+    with pytest.raises(ValueError):
+        storage.transition(transaction.id, TransactionStatus.BUYER_SET, TransactionStatus.FUNDED, user_id=99)
+    assert storage.get_transaction(transaction.id).status == TransactionStatus.BUYER_SET
+
+def test_awaiting_funds_can_record_a_rejected_deposit(storage):
+    transaction = _buyer_set(storage)
+    recorded = storage.transition(
+        transaction.id, TransactionStatus.BUYER_SET, TransactionStatus.BUYER_SET,
+        rejected_outpoint='ab:1', rejected_amount=7
+    )
+    assert recorded.status == TransactionStatus.BUYER_SET
+    assert storage.get_transaction(transaction.id).rejected_outpoint == 'ab:1'
+
+def test_transition_many_applies_only_current_moves(storage):
+    first, second = _buyer_set(storage, 1), _buyer_set(storage, 3)
+    changed = storage.transition_many([
+        (first.id, TransactionStatus.BUYER_SET, TransactionStatus.CANCELLED),
+        (second.id, TransactionStatus.SELLER_SET, TransactionStatus.CANCELLED),
+    ])
+    assert [t.id for t in changed] == [first.id]
+    assert storage.get_transaction(second.id).status == TransactionStatus.BUYER_SET
+
+def test_final_transitions_record_the_finish_time(storage):
+    transaction = _buyer_set(storage)
+    assert transaction.finished_at is None
+    funded = storage.transition(transaction.id, TransactionStatus.BUYER_SET, TransactionStatus.FUNDED)
+    assert funded.finished_at is None
+    [completed] = storage.transition_many([(transaction.id, TransactionStatus.FUNDED, TransactionStatus.COMPLETED)])
+    assert completed.finished_at is not None and completed.finished_at >= completed.created_at
+
+def test_reset_cancels_only_unfunded_deals(storage):
+    open_deal = _buyer_set(storage, 5)
+    assert storage.reset_transaction(6, open_deal.id) is None  # Not the creator
+    cancelled = storage.reset_transaction(5)
+    assert cancelled.id == open_deal.id and cancelled.status == TransactionStatus.CANCELLED
+    funded = _buyer_set(storage, 5)
+    storage.transition(funded.id, TransactionStatus.BUYER_SET, TransactionStatus.FUNDED, amount=5_000)
+    assert storage.reset_transaction(5) is None
+    assert storage.reset_transaction(5, funded.id) is None
+    assert storage.get_transaction(funded.id).status == TransactionStatus.FUNDED
+
+def test_restart_command_leaves_a_funded_deal_alone():
+    import handlers
+    from storage import storage as live_storage
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    transaction = _buyer_set(live_storage, 7001)
+    live_storage.transition(transaction.id, TransactionStatus.BUYER_SET, TransactionStatus.FUNDED, amount=9_000)
+    update = SimpleNamespace(
+        effective_user=SimpleNamespace(id=7001, language_code='en'), message=SimpleNamespace(reply_text=reply_text)
+    )
+    for args in ([], [transaction.id]):
+        asyncio.run(handlers.restart(update, SimpleNamespace(args=args)))
+    stored = live_storage.get_transaction(transaction.id)
+    assert stored.status == TransactionStatus.FUNDED and stored.amount == 9_000
+    assert replies == [handlers.catalog_for(update).text('reset_none')] * 2
@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime
+import pytest
+from telegram import Chat, Message, Update, User
+import storage as storage_module
+from models import TransactionStatus
+from storage import AsyncStorage, Storage
+from update_processor import KeyedUpdateProcessor, sender_key, transaction_key
+
+@pytest.fixture
+def storage(monkeypatch):
+    engine = Storage()
+    monkeypatch.setattr(storage_module, 'async_storage', AsyncStorage(engine))
+    return engine
+
+def _update(user_id, text, update_id=1):
+    message = Message(
+        message_id=update_id, date=datetime.now(), chat=Chat(-100, Chat.SUPERGROUP),
+        from_user=User(user_id, f"user{user_id}", False), text=text
+    )
+    return Update(update_id, message=message)
+
+def _deal(storage):
+    transaction = storage.create_transaction(1, 'BTC', chat_id=-100)
+    storage.transition(
+        transaction.id, TransactionStatus.CREATED, TransactionStatus.BUYER_SET, buyer_id=2, buyer_address="bc1buyer"
+    )
+    storage.transition(
+        transaction.id, TransactionStatus.BUYER_SET, TransactionStatus.SELLER_SET, seller_id=3, seller_address="bc1seller"
+    )
+    return transaction
+
+def test_buyer_and_seller_share_their_deal_key(storage):
+    transaction = _deal(storage)
+    keys = {asyncio.run(transaction_key(_update(user_id, "/pay_seller"))) for user_id in (1, 2, 3)}
+    assert keys == {('transaction', transaction.id)}
+    assert sender_key(_update(2, "/pay_seller")) == ('user', 2)
+
+    # Named ids win; a user without an active deal only has their own key
+    named = f"/status {'ab' * 4}-0000-0000-0000-{'cd' * 6}"
+    assert asyncio.run(transaction_key(_update(9, named))) == ('transaction', f"{'ab' * 4}-0000-0000-0000-{'cd' * 6}")
+    assert asyncio.run(transaction_key(_update(9, "/status"))) is None
+    storage.transition(transaction.id, TransactionStatus.SELLER_SET, TransactionStatus.CANCELLED)
+    assert asyncio.run(transaction_key(_update(2, "/status"))) is None
+
+def test_updates_of_one_deal_run_in_order(storage):
+    _deal(storage)
+    order = []
+
+    async def handle(name, delay):
+        order.append(f"{name} start")
+        await asyncio.sleep(delay)
+        order.append(f"{name} end")
+
+    async def main():
+        processor = KeyedUpdateProcessor(8)
+        await asyncio.gather(
+            processor.do_process_update(_update(2, "/refund_buyer", 1), handle('buyer', 0.02)),
+            processor.do_process_update(_update(3, "/pay_seller", 2), handle('seller', 0)),
+            processor.do_process_update(_update(7, "/help", 3), handle('other', 0)),
+        )
+        return processor.stats()
+
+    stats = asyncio.run(main())
+    # The seller waits for the buyer; an unrelated user does not
+    assert order.index('seller start') > order.index('buyer end')
+    assert order.index('other end') < order.index('buyer end')
+    assert stats['locked_keys'] == 0 and stats['pending'] == 0
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import pytest
+from config import WEBHOOK_PATH, WEBHOOK_SECRET
+from webhook import webhook_bridge
+
+HEADERS = {'X-Telegram-Bot-Api-Secret-Token': WEBHOOK_SECRET}
+
+@pytest.fixture
+def client(web_app):
+    return web_app.test_client()
+
+@pytest.fixture
+def application():
+    """A bot loop on its own thread whose update queue holds a single update."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    application = SimpleNamespace(bot=None, update_queue=None)
+
+    async def attach():
+        application.update_queue = asyncio.Queue(maxsize=1)
+        webhook_bridge.attach(application)
+
+    asyncio.run_coroutine_threadsafe(attach(), loop).result()
+    yield application
+    webhook_bridge.detach()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+def test_updates_are_queued_until_the_queue_is_full(client, application):
+    response = client.post(WEBHOOK_PATH, json={'update_id': 1}, headers=HEADERS)
+    assert response.status_code == 200
+    assert application.update_queue.get_nowait().update_id == 1
+    application.update_queue.put_nowait(None)
+
+    # Telegram redelivers anything not answered with a 2xx
+    response = client.post(WEBHOOK_PATH, json={'update_id': 2}, headers=HEADERS)
+    assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+
+def test_bad_requests_are_refused(client, application):
+    assert client.post(WEBHOOK_PATH, json={'update_id': 1}).status_code == 403
+    wrong = {'X-Telegram-Bot-Api-Secret-Token': WEBHOOK_SECRET[:-1]}
+    assert client.post(WEBHOOK_PATH, json={'update_id': 1}, headers=wrong).status_code == 403
+    assert client.post(WEBHOOK_PATH, data='not json', headers=HEADERS).status_code == 400
+    assert client.post(WEBHOOK_PATH, json={'message': {}}, headers=HEADERS).status_code == 400
+    assert application.update_queue.empty()
+
+def test_updates_wait_for_the_bot_loop(client):
+    response = client.post(WEBHOOK_PATH, json={'update_id': 1}, headers=HEADERS)
+    assert response.status_code == 503 and response.headers['Retry-After'] == '5'
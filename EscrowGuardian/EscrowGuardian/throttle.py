@@ -0,0 +1,110 @@
+import logging
+import time
+from collections import OrderedDict
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, CallbackContext
+import metrics
+from rate_limiter import TokenBucket
+from messages import catalog_for
+from config import (
+    ADMIN_USER_IDS, THROTTLE_USER_RATE, THROTTLE_CHAT_RATE, THROTTLE_COMMAND_RATES,
+    THROTTLE_MAX_KEYS, THROTTLE_NOTICE_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+def command_of(update):
+    """'start' for '/start@Bot arg', 'callback' for button presses, None for anything else."""
+    if update.callback_query:
+        return 'callback'
+    message = update.message
+    if message and message.text and message.text.startswith('/'):
+        return message.text.split(maxsplit=1)[0][1:].split('@', 1)[0].lower()
+    return None
+
+class InboundThrottle:
+    """Token buckets limiting commands per user, per chat and per (user, command).
+
+    Buckets live in an LRU dict capped at max_keys, so memory stays bounded
+    however many users write; an evicted bucket belonged to the sender idle
+    the longest. Checks are a few dict lookups, so rejecting a flood costs
+    far less than the replies and storage writes the handlers would make.
+    """
+
+    def __init__(self, user_rate=THROTTLE_USER_RATE, chat_rate=THROTTLE_CHAT_RATE,
+                 command_rates=THROTTLE_COMMAND_RATES, max_keys=THROTTLE_MAX_KEYS,
+                 notice_seconds=THROTTLE_NOTICE_SECONDS):
+        self.user_rate = user_rate
+        self.chat_rate = chat_rate
+        self.command_rates = command_rates
+        self.max_keys = max_keys
+        self.notice_seconds = notice_seconds
+        self._buckets = OrderedDict()
+        self._notified = OrderedDict()
+
+    def _bucket(self, key, rate):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*rate)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def check(self, user_id, chat_id, command):
+        """None if the command may run, else the scope ('command', 'user' or 'chat') over its limit."""
+        limits = []
+        rate = self.command_rates.get(command)
+        if rate:
+            limits.append(('command', (user_id, command), rate))
+        limits.append(('user', user_id, self.user_rate))
+        # A private chat's id is the user's, so its user bucket already covers it
+        if chat_id is not None and chat_id != user_id:
+            limits.append(('chat', chat_id, self.chat_rate))
+        buckets = [(scope, self._bucket((scope, key), rate)) for scope, key, rate in limits]
+        # A rejected update costs no bucket a token, so it cannot eat into the others' budgets
+        for scope, bucket in buckets:
+            if bucket.peek():
+                return scope
+        for _, bucket in buckets:
+            bucket.take()
+        return None
+
+    def should_notify(self, user_id):
+        """True at most once per notice window per user."""
+        now = time.monotonic()
+        last = self._notified.get(user_id)
+        if last is not None and now - last < self.notice_seconds:
+            return False
+        self._notified[user_id] = now
+        self._notified.move_to_end(user_id)
+        while len(self._notified) > self.max_keys:
+            self._notified.popitem(last=False)
+        return True
+
+inbound_throttle = InboundThrottle()
+
+async def throttle_update(update: Update, context: CallbackContext):
+    """Stop commands and button presses over their limits before any handler runs"""
+    user = update.effective_user
+    command = command_of(update)
+    if command is None or user is None or user.id in ADMIN_USER_IDS:
+        return
+    chat = update.effective_chat
+    scope = inbound_throttle.check(user.id, chat.id if chat else None, command)
+    if scope is None:
+        return
+    metrics.throttled_updates.inc(scope)
+    # A flood gets one reply per window; everything else is dropped silently
+    if inbound_throttle.should_notify(user.id):
+        text = catalog_for(update).text('throttled')
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(text)
+            elif update.message:
+                await update.message.reply_text(text)
+        except TelegramError as e:
+            logger.warning("Could not send throttle notice to %s: %s", user.id, e)
+    raise ApplicationHandlerStop
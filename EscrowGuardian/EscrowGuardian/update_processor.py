@@ -0,0 +1,132 @@
+import asyncio
+import contextlib
+import time
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from models import TRANSACTION_ID_PATTERN
+
+def sender_key(update):
+    """Key of the user, else the chat, an update comes from; None means no ordering needed."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return ('user', update.effective_user.id)
+    if update.effective_chat:
+        return ('chat', update.effective_chat.id)
+    return None
+
+async def transaction_key(update):
+    """Key of the transaction an update can touch, if any.
+
+    Commands naming a transaction id are keyed by it; anything else a user
+    sends by their current active transaction, the one find_transaction
+    falls back to, so buyer and seller updates for a deal share its lane.
+    """
+    if not isinstance(update, Update):
+        return None
+    message = update.effective_message
+    if message and message.text and message.text.startswith('/'):
+        for arg in message.text.split()[1:]:
+            if TRANSACTION_ID_PATTERN.match(arg.lower()):
+                return ('transaction', arg.lower())
+    if update.effective_user:
+        # Imported here: the cluster supervisor imports this module but must
+        # not build a storage engine of its own
+        from storage import async_storage
+        transaction = await async_storage.get_user_transaction(update.effective_user.id)
+        if transaction is not None and transaction.is_active():
+            return ('transaction', transaction.id)
+    return None
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently while serializing updates that share a key.
+
+    PTB's own semaphore is sized generously so it never blocks; the real
+    concurrency limit is applied only after an update holds its key locks.
+    That keeps updates for one transaction in arrival order without letting
+    them occupy worker slots while they wait.
+
+    The sender's lock is requested before anything awaits, so one user's
+    updates keep their arrival order even while their transaction is looked
+    up. The transaction's lock is taken next: every update locks its sender
+    before its transaction, so two updates never wait on each other's locks.
+    """
+
+    def __init__(self, max_concurrent_updates, sender_key=sender_key, transaction_key=transaction_key,
+                 max_pending=10000):
+        super().__init__(max_pending)
+        self.limit = max_concurrent_updates
+        self.sender_key = sender_key
+        self.transaction_key = transaction_key
+        self._workers = asyncio.Semaphore(max_concurrent_updates)
+        self._locks = {}
+        self.pending = 0
+        self.active = 0
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _acquire_lock(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _release_lock(self, key):
+        entry = self._locks[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        queued_at = time.monotonic()
+        self.pending += 1
+        started = False
+        keys = []
+        try:
+            async with contextlib.AsyncExitStack() as held:
+                key = self.sender_key(update)
+                if key is not None:
+                    keys.append(key)
+                    await held.enter_async_context(self._acquire_lock(key))
+                key = await self.transaction_key(update)
+                if key is not None:
+                    keys.append(key)
+                    await held.enter_async_context(self._acquire_lock(key))
+                async with self._workers:
+                    started = True
+                    wait = time.monotonic() - queued_at
+                    self.pending -= 1
+                    self.active += 1
+                    self.started += 1
+                    self.total_wait += wait
+                    self.max_wait = max(self.max_wait, wait)
+                    try:
+                        await coroutine
+                    finally:
+                        self.active -= 1
+        finally:
+            if not started:
+                self.pending -= 1
+                coroutine.close()
+            for key in keys:
+                self._release_lock(key)
+
+    def stats(self):
+        """Snapshot of queue depth and wait times for monitoring."""
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'pending': self.pending,
+            'locked_keys': len(self._locks),
+            'started': self.started,
+            'avg_wait_seconds': self.total_wait / self.started if self.started else 0.0,
+            'max_wait_seconds': self.max_wait,
+        }
@@ -0,0 +1,78 @@
+import asyncio
+import concurrent.futures
+import hmac
+import logging
+from telegram import Update
+from config import WEBHOOK_SECRET, WEBHOOK_SUBMIT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+ACCEPTED = 'accepted'
+BUSY = 'busy'
+INVALID = 'invalid'
+UNAVAILABLE = 'unavailable'
+
+class WebhookBridge:
+    """Hands updates received by the web server to the bot's event loop."""
+
+    def __init__(self, secret=WEBHOOK_SECRET, timeout=WEBHOOK_SUBMIT_TIMEOUT):
+        self.secret = secret
+        self.timeout = timeout
+        self._application = None
+        self._loop = None
+
+    def attach(self, application):
+        """Start accepting updates; must be called from the bot's event loop."""
+        self._application = application
+        self._loop = asyncio.get_running_loop()
+
+    def detach(self):
+        self._application = None
+        self._loop = None
+
+    @property
+    def ready(self):
+        return self._loop is not None and not self._loop.is_closed()
+
+    def check_secret(self, token):
+        return token is not None and hmac.compare_digest(token, self.secret)
+
+    async def _enqueue(self, data):
+        update = Update.de_json(data, self._application.bot)
+        try:
+            self._application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def submit(self, data):
+        """Queue a raw update from a web worker thread and report the outcome."""
+        if not self.ready:
+            return UNAVAILABLE
+
+        future = asyncio.run_coroutine_threadsafe(self._enqueue(data), self._loop)
+        try:
+            accepted = future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return BUSY
+        except Exception as e:
+            logger.warning("Rejected malformed webhook payload: %s", e)
+            return INVALID
+
+        if not accepted:
+            logger.warning("Update queue full; asking Telegram to retry")
+            return BUSY
+        return ACCEPTED
+
+def http_response(result):
+    """(body, status, headers) answering Telegram for a submit or route result."""
+    if result == ACCEPTED:
+        return {"status": "ok"}, 200, {}
+    if result == INVALID:
+        return {"error": "invalid update"}, 400, {}
+    # Non-2xx responses make Telegram redeliver the update later
+    retry_after = "1" if result == BUSY else "5"
+    return {"error": result}, 503, {"Retry-After": retry_after}
+
+webhook_bridge = WebhookBridge()